@@ -0,0 +1,224 @@
+#! /usr/bin/env python
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Checks that the fragment cache and the shard manifest never reuse stale
+code. For each
+attribute of the bit fields and registers, a synthetic register set is
+loaded, the attribute of one register (or of one of its fields) is
+changed, and the Verilog and UVM outputs are generated with a fragment
+cache (and the sharded UVM output with a manifest) that was filled before
+the change. The outputs must match the
+outputs generated without a cache, and if the change altered an output,
+at least one fragment must have been rendered again.
+"""
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from regenerate.db import BitField, Register, RegisterDb, RegProject
+from regenerate.writers import find_exporter, fragments
+from regenerate.writers.writer_base import set_jobs
+
+import synth
+
+# Exporters whose output is built from fragments
+EXPORTERS = ("rtl-verilog-2001", "proj-uvm", "proj-uvm-shards")
+
+# Attributes that do not affect the generated code
+IGNORED = frozenset(["modified"])
+
+# Attributes that remove the register from the output of an exporter,
+# so no fragment needs to be rendered for them
+REMOVES_REGISTER = frozenset(["_do_not_generate_code", "_do_not_use_uvm"])
+
+# Lines containing the generation time, which may differ between runs
+TIME_RE = re.compile(r"\d\d:\d\d:\d\d|[A-Z][a-z]+ \d\d, \d{4}")
+
+
+def same_output(text1, text2):
+    """
+    Compares the outputs, ignoring the lines that contain the time
+    """
+    lines1 = text1.splitlines()
+    lines2 = text2.splitlines()
+    if len(lines1) != len(lines2):
+        return False
+    return all(line1 == line2 or (TIME_RE.search(line1) and
+                                  TIME_RE.search(line2))
+               for (line1, line2) in zip(lines1, lines2))
+
+
+def changed_value(obj, name):
+    """
+    Returns a valid value, different from the current one, for the
+    attribute
+    """
+    value = getattr(obj, name)
+    if name == "lsb":
+        return value + 1
+    if name == "msb":
+        return value - 1
+    if name == "field_type":
+        return (BitField.TYPE_READ_WRITE if value != BitField.TYPE_READ_WRITE
+                else BitField.TYPE_READ_WRITE_1S)
+    if name == "reset_type":
+        return (BitField.RESET_INPUT if value != BitField.RESET_INPUT
+                else BitField.RESET_NUMERIC)
+    if name == "values":
+        return value + [("1", "ONE", "Value one")]
+    if name == "share":
+        return (Register.SHARE_READ if value != Register.SHARE_READ
+                else Register.SHARE_NONE)
+    if name == "width":
+        return value * 2
+    if name in ("dimension", "ram_size"):
+        return value + 2
+    if isinstance(value, bool):
+        return not value
+    if isinstance(value, (int, long)):
+        return value ^ 1
+    if isinstance(value, basestring):
+        return value + "x"
+    raise ValueError("No change defined for %s" % name)
+
+
+def attributes(obj):
+    """
+    Returns the names of the data attributes of the object, as stored
+    (the properties store their values in underscore names), leaving out
+    the private attributes, such as the bit fields of a register
+    """
+    private = "_%s__" % type(obj).__name__
+    return sorted(name for name in vars(obj)
+                  if name not in IGNORED and not name.startswith(private))
+
+
+def target(dbase, kind):
+    """
+    Returns the register or field to change. The register is one with a
+    field at least two bits wide, so that the lsb and msb can be moved.
+    """
+    for reg in dbase.get_all_registers():
+        for field in reg.get_bit_fields():
+            if field.width > 1:
+                return field if kind == "field" else reg
+    raise ValueError("No multi-bit field in the register set")
+
+
+def generate(exp_id, path, output, cache_dir):
+    """
+    Generates the output of the exporter for the project in the output
+    directory, returning the text of the files it contains, and the number
+    of rendered fragments
+    """
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    fragments.set_cache_dir(cache_dir)
+    fragments.STATS.update(reused=0, rendered=0)
+    project = RegProject(path)
+    dbase_list = [RegisterDb(name) for name in project.get_register_set()]
+    info = find_exporter(exp_id)
+    if info.type[0] == "RTL":
+        writer = info.obj_class(project, dbase_list[0])
+    else:
+        writer = info.obj_class(project, dbase_list)
+    writer.write(os.path.join(output, "out" + info.extension))
+    text = []
+    for name in sorted(os.listdir(output)):
+        if not name.startswith("."):
+            with open(os.path.join(output, name)) as ifile:
+                text.append(ifile.read())
+    return ("".join(text), fragments.STATS["rendered"])
+
+
+def check(directory, path, kind, name):
+    """
+    Changes the attribute in the register set, and checks the output of
+    each exporter, returning the list of errors
+    """
+    dbase_file = RegProject(path).get_register_set()[0]
+    backup = dbase_file + ".orig"
+    shutil.copy(dbase_file, backup)
+    errors = []
+    try:
+        for exp_id in EXPORTERS:
+            cache_dir = os.path.join(directory, "cache")
+            output = os.path.join(directory, "cached")
+            fresh = os.path.join(directory, "fresh")
+            shutil.copy(backup, dbase_file)
+            for dirname in (cache_dir, output, fresh):
+                if os.path.isdir(dirname):
+                    shutil.rmtree(dirname)
+            (original, _) = generate(exp_id, path, output, cache_dir)
+
+            dbase = RegisterDb(dbase_file)
+            obj = target(dbase, kind)
+            value = changed_value(obj, name)
+            setattr(obj, name, value)
+            dbase.save_xml(dbase_file)
+            if getattr(target(RegisterDb(dbase_file), kind), name) != value:
+                # Not saved in the register set file
+                break
+
+            (cached, rendered) = generate(exp_id, path, output, cache_dir)
+            (expected, _) = generate(exp_id, path, fresh, None)
+            if not same_output(cached, expected):
+                errors.append("%s %s.%s: stale output" % (exp_id, kind, name))
+            elif (not rendered and name not in REMOVES_REGISTER and
+                  not same_output(original, expected)):
+                errors.append("%s %s.%s: no fragment rendered" %
+                              (exp_id, kind, name))
+    finally:
+        shutil.move(backup, dbase_file)
+        fragments.set_cache_dir(None)
+    return errors
+
+
+def main():
+    directory = tempfile.mkdtemp(prefix="fragkeys")
+    errors = []
+    # The fragment counts are only kept for the shards rendered in this
+    # process
+    set_jobs(1)
+    try:
+        path = synth.build_project(directory, sets=1, registers=4, fields=3,
+                                   groups=1, repeat=1, maps=1)
+        dbase = RegisterDb(RegProject(path).get_register_set()[0])
+        cases = ([("field", name) for name in
+                  attributes(target(dbase, "field"))] +
+                 [("register", name) for name in
+                  attributes(target(dbase, "register"))])
+        for (kind, name) in cases:
+            errors.extend(check(directory, path, kind, name))
+    finally:
+        shutil.rmtree(directory)
+
+    for error in errors:
+        print error
+    print "%d attribute(s) checked, %d error(s)" % (len(cases), len(errors))
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
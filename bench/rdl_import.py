@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Compares the speed of the tokenizer based RDL importer against the
+original line based importer. A synthetic RDL file, laid out one construct
+per line so that both importers can read it, is generated, imported by
+both, and the results are compared.
+"""
+
+import os
+import sys
+import time
+import tempfile
+from optparse import OptionParser
+
+from regenerate.db import RegisterDb
+from regenerate.importers.rdl import RDLParser, LineRDLParser
+
+ACCESS = ('"rw"', '"r"', '"w"')
+
+
+def write_rdl(filename, count):
+    """
+    Writes an RDL file containing count registers, each with four fields.
+    Every other register gives its address and reset values without the
+    0x prefix, which both importers read as hexadecimal.
+    """
+    with open(filename, "w") as ofile:
+        ofile.write("addrmap bench {\n")
+        ofile.write("  default regwidth = 32;\n")
+        for i in range(count):
+            ofile.write("  reg {\n")
+            prefix = "0x" if i % 2 else ""
+            for j in range(4):
+                ofile.write("    field {\n")
+                ofile.write("      sw = %s;\n" % ACCESS[(i + j) % 3])
+                ofile.write('      desc = "Field %d of register %d";\n' %
+                            (j, i))
+                ofile.write("      reset = %s%x;\n" % (prefix,
+                                                   (i + j) & 0xff))
+                ofile.write("    } F%d[%d:%d];\n" % (j, j * 8 + 7, j * 8))
+            ofile.write("  } REG%d @%s%x;\n" % (i, prefix, i * 4))
+        ofile.write("};\n")
+
+
+def register_data(dbase):
+    """
+    Returns the data used to compare the results of the importers
+    """
+    data = []
+    for reg in dbase.get_all_registers():
+        fields = [(fld.field_name, fld.msb, fld.lsb, fld.field_type,
+                   fld.reset_value, fld.description)
+                  for fld in reg.get_bit_fields()]
+        data.append((reg.address, reg.token, reg.width, fields))
+    return data
+
+
+def time_import(parser_class, filename):
+    """
+    Imports the file with the parser, returning the database and the time
+    """
+    dbase = RegisterDb()
+    start = time.time()
+    parser_class(dbase).import_data(filename)
+    return (dbase, time.time() - start)
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--registers", type="int", default=100000,
+                      help="number of registers to generate")
+    parser.add_option("-k", "--keep", metavar="FILE",
+                      help="write the RDL file to FILE and keep it")
+    (options, args) = parser.parse_args()
+
+    if options.keep:
+        filename = options.keep
+    else:
+        (handle, filename) = tempfile.mkstemp(suffix=".rdl")
+        os.close(handle)
+
+    try:
+        write_rdl(filename, options.registers)
+        size = os.path.getsize(filename)
+        print "%d registers, %d bytes" % (options.registers, size)
+
+        (line_db, line_time) = time_import(LineRDLParser, filename)
+        (token_db, token_time) = time_import(RDLParser, filename)
+    finally:
+        if not options.keep:
+            os.unlink(filename)
+
+    print "%-20s %8.2fs" % ("line importer", line_time)
+    print "%-20s %8.2fs" % ("token importer", token_time)
+    if token_time:
+        print "%-20s %8.2fx" % ("speedup", line_time / token_time)
+
+    if register_data(line_db) != register_data(token_db):
+        print "Results differ"
+        sys.exit(1)
+    print "Results match"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Checks regbuild against the example project in test/. The project has an
+export with an exporter that no longer exists, which must be skipped with
+a warning instead of stopping the build. A copy of the project is listed
+with --list-targets and built with -a, and the listed targets are checked
+against the known exporters and the files that were written.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from regenerate.writers import find_exporter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGBUILD = os.path.join(ROOT, "bin", "regbuild")
+PROJECT = os.path.join(ROOT, "test", "test.rprj")
+
+
+def regbuild(*args):
+    """
+    Runs regbuild in process mode, returning the exit status, the
+    output and the error output
+    """
+    env = dict(os.environ, REGENERATED_SOCKET=os.devnull)
+    proc = subprocess.Popen([sys.executable, REGBUILD] + list(args),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            env=env)
+    (output, errors) = proc.communicate()
+    return (proc.returncode, output, errors)
+
+
+def main():
+    directory = tempfile.mkdtemp(prefix="regbuild")
+    errors = []
+    try:
+        for name in os.listdir(os.path.dirname(PROJECT)):
+            shutil.copy(os.path.join(os.path.dirname(PROJECT), name),
+                        directory)
+        project = os.path.join(directory, os.path.basename(PROJECT))
+
+        (status, output, messages) = regbuild("-a", "--list-targets",
+                                              project)
+        if status:
+            errors.append("--list-targets failed:\n" + messages)
+            targets = []
+        else:
+            targets = json.loads(output)
+        for target in targets:
+            if find_exporter(target["exporter"]) is None:
+                errors.append("%s listed with an unknown exporter" %
+                              target["id"])
+
+        (status, output, messages) = regbuild("-a", project)
+        if status:
+            errors.append("-a failed:\n" + messages)
+        for target in targets:
+            if not os.path.exists(target["dest"]):
+                errors.append("%s was not written" % target["dest"])
+        print "%d target(s) listed and built" % len(targets)
+    finally:
+        shutil.rmtree(directory)
+
+    for error in errors:
+        print error
+    if errors or not targets:
+        sys.exit(1)
+    print "regbuild OK"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+#! /usr/bin/env python
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Benchmark suite. A synthetic project is generated (see synth.py), and the
+following are timed against it:
+
+  * parsing the register sets (RegParser)
+  * saving the register sets (RegWriter)
+  * loading the project (ProjectReader)
+  * every exporter in EXPORTERS, GRP_EXPORTERS, and PRJ_EXPORTERS
+  * comparing two versions of a register set (regdiff)
+  * finding the addresses of every register (find_addresses)
+  * the UVM exporter on 64 bit registers with 64 single bit fields
+    (uvm-wide-fields)
+
+Each case is run several times, and the best time is kept. The cases in
+SKIPPED are not run, and are recorded with the reason they are skipped. The results
+can be saved as a baseline (in bench/baselines), and a later run can be
+compared against a saved baseline, reporting the ratio of the times.
+"""
+
+import imp
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+from regenerate.db import RegisterDb, RegProject
+from regenerate.writers import (EXPORTERS, GRP_EXPORTERS, PRJ_EXPORTERS,
+                                 find_exporter)
+from regenerate.extras.addr import find_addresses
+
+import synth
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+
+# Differences smaller than this (in seconds) are treated as noise
+NOISE_FLOOR = 0.001
+REGDIFF = os.path.join(os.path.dirname(BENCH_DIR), "bin", "regdiff")
+
+# Project used by the uvm-wide-fields case. The number of registers is
+# taken from the main project.
+WIDE_PARAMS = {"sets": 1, "fields": 64, "width": 64, "groups": 1,
+               "repeat": 1, "maps": 1}
+
+# Cases that cannot be run, and the reason. These writers cannot be
+# created with the arguments of their exporter type.
+SKIPPED = {
+    "export:doc-odt": "OdtDoc takes (dbase, rlist) instead of "
+    "(project, dbase)",
+    "project:headers-system-verilog": "VerilogConstRegPackage does not "
+    "pass the project to WriterBase",
+}
+
+
+class BenchData(object):
+    """
+    The synthetic project and the data loaded from it, shared by the
+    benchmark cases
+    """
+
+    def __init__(self, directory, params):
+        self.directory = directory
+        self.path = synth.build_project(directory, **params)
+        self.project = RegProject(self.path)
+        self.files = self.project.get_register_set()
+        self.dbase_list = [RegisterDb(path) for path in self.files]
+        self.output = os.path.join(directory, "output")
+        os.mkdir(self.output)
+        self.changed = self.build_changed_set()
+
+        wide_params = dict(WIDE_PARAMS, registers=params["registers"])
+        self.wide_project = RegProject(
+            synth.build_project(os.path.join(directory, "wide"),
+                                **wide_params))
+        self.wide_dbase_list = [RegisterDb(path) for path in
+                                self.wide_project.get_register_set()]
+
+    def build_changed_set(self):
+        """
+        Writes a copy of the first register set with every fourth register
+        altered, returning the (name, old path, new path) tuple used by
+        regdiff.
+        """
+        old_path = self.files[0]
+        name = os.path.splitext(os.path.basename(old_path))[0]
+        new_path = os.path.join(self.directory, "changed.xml")
+
+        dbase = RegisterDb(old_path)
+        for (index, reg) in enumerate(dbase.get_all_registers()):
+            if index % 4 == 0:
+                reg.description = reg.description + " (changed)"
+                for field in reg.get_bit_fields():
+                    field.reset_value ^= 1
+        dbase.save_xml(new_path)
+        return (name, old_path, new_path)
+
+    def output_file(self, name):
+        return os.path.join(self.output, name)
+
+
+def bench_parse(data):
+    for path in data.files:
+        RegisterDb(path)
+
+
+def bench_save(data):
+    for (index, dbase) in enumerate(data.dbase_list):
+        dbase.save_xml(data.output_file("save%d.xml" % index))
+
+
+def bench_project(data):
+    RegProject(data.path)
+
+
+def bench_find_addresses(data):
+    for dbase in data.dbase_list:
+        for reg in dbase.get_all_registers():
+            find_addresses(data.project, dbase.set_name, reg)
+
+
+def bench_regdiff(data):
+    REGDIFF_MODULE.diff_register_set(data.changed)
+
+
+def bench_uvm_wide_fields(data):
+    writer = find_exporter("proj-uvm").obj_class
+    writer(data.wide_project, data.wide_dbase_list).write(
+        data.output_file("uvm_wide.sv"))
+
+
+def block_exporter(info):
+
+    def bench(data):
+        writer = info.obj_class
+        for (index, dbase) in enumerate(data.dbase_list):
+            writer(data.project, dbase).write(
+                data.output_file("%s%d%s" % (info.id, index, info.extension)))
+    return bench
+
+
+def group_exporter(info):
+
+    def bench(data):
+        writer = info.obj_class
+        for group in data.project.get_grouping_list():
+            writer(data.project, group.name, data.dbase_list).write(
+                data.output_file("%s_%s%s" % (info.id, group.name,
+                                              info.extension)))
+    return bench
+
+
+def project_exporter(info):
+
+    def bench(data):
+        writer = info.obj_class
+        writer(data.project, data.dbase_list).write(
+            data.output_file(info.id + info.extension))
+    return bench
+
+
+REGDIFF_MODULE = None
+
+
+def load_regdiff():
+    """
+    Imports bin/regdiff as a module, so that its comparison function can
+    be timed without starting a new process
+    """
+    global REGDIFF_MODULE
+    if REGDIFF_MODULE is None:
+        REGDIFF_MODULE = imp.load_source("regdiff", REGDIFF)
+    return REGDIFF_MODULE
+
+
+def build_cases():
+    """
+    Returns the list of (name, function) benchmark cases
+    """
+    cases = [("parse", bench_parse),
+             ("save", bench_save),
+             ("project", bench_project)]
+    for info in EXPORTERS:
+        cases.append(("export:" + info.id, block_exporter(info)))
+    for info in GRP_EXPORTERS:
+        cases.append(("group:" + info.id, group_exporter(info)))
+    for info in PRJ_EXPORTERS:
+        cases.append(("project:" + info.id, project_exporter(info)))
+    cases.append(("regdiff", bench_regdiff))
+    cases.append(("find_addresses", bench_find_addresses))
+    cases.append(("uvm-wide-fields", bench_uvm_wide_fields))
+    return cases
+
+
+def time_case(function, data, repeat):
+    """
+    Runs the function the specified number of times, returning the
+    result dictionary. If the function raises an exception, the error
+    is recorded instead of the times.
+    """
+    times = []
+    try:
+        for _ in range(repeat):
+            start = time.time()
+            function(data)
+            times.append(time.time() - start)
+    except Exception as msg:
+        return {"error": "%s: %s" % (msg.__class__.__name__, msg)}
+    return {"min": min(times), "mean": sum(times) / len(times),
+            "runs": len(times)}
+
+
+def run_cases(data, options, ofile):
+    """
+    Runs the selected cases, printing the times as they complete
+    """
+    selected = re.compile(options.filter) if options.filter else None
+    load_regdiff()
+
+    results = {}
+    for (name, function) in build_cases():
+        if selected and not selected.search(name):
+            continue
+        if name in SKIPPED:
+            results[name] = {"skipped": SKIPPED[name]}
+            ofile.write("%-40s skipped: %s\n" % (name, SKIPPED[name]))
+            continue
+        result = time_case(function, data, options.repeat)
+        results[name] = result
+        if "error" in result:
+            ofile.write("%-40s %s\n" % (name, result["error"]))
+        else:
+            ofile.write("%-40s %10.4fs %10.4fs\n" % (name, result["min"],
+                                                     result["mean"]))
+        ofile.flush()
+    return results
+
+
+def baseline_path(name):
+    """
+    A name without a directory or extension refers to a file in the
+    baselines directory
+    """
+    if os.path.dirname(name) or name.endswith(".json"):
+        return name
+    return os.path.join(BASELINE_DIR, name + ".json")
+
+
+def save_baseline(filename, params, results):
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    info = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": params,
+        "results": results,
+    }
+    with open(filename, "w") as ofile:
+        json.dump(info, ofile, indent=2, sort_keys=True,
+                  separators=(",", ": "))
+
+
+def compare(baseline, results, threshold, ofile):
+    """
+    Prints the comparison report for the cases that were run, returning
+    the names of the cases that are slower than the baseline by more than
+    the threshold.
+    """
+    old_results = baseline["results"]
+    slower = []
+
+    ofile.write("\n%-40s %10s %10s %8s\n" % ("Case", "Baseline", "Current",
+                                             "Ratio"))
+    ofile.write("%s %s %s %s\n" % ("-" * 40, "-" * 10, "-" * 10, "-" * 8))
+    for name in sorted(results):
+        old = old_results.get(name, {})
+        new = results[name]
+        if "min" not in old or "min" not in new:
+            if not old:
+                status = "missing"
+            elif "skipped" in new:
+                status = "skipped"
+            else:
+                status = "error"
+            ofile.write("%-40s %10s %10s %8s\n" % (name, "", "", status))
+            continue
+        ratio = new["min"] / old["min"] if old["min"] else 1.0
+        flag = ""
+        if abs(new["min"] - old["min"]) < NOISE_FLOOR:
+            pass
+        elif ratio > threshold:
+            flag = " slower"
+            slower.append(name)
+        elif ratio < 1.0 / threshold:
+            flag = " faster"
+        ofile.write("%-40s %9.4fs %9.4fs %7.2fx%s\n" %
+                    (name, old["min"], new["min"], ratio, flag))
+    return slower
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]",
+                          description="Runs the benchmark suite")
+    parser.add_option("-s", "--sets", type="int", default=10,
+                      help="number of register sets")
+    parser.add_option("-r", "--registers", type="int", default=100,
+                      help="number of registers per register set")
+    parser.add_option("-f", "--fields", type="int", default=4,
+                      help="number of fields per register")
+    parser.add_option("-g", "--groups", type="int", default=2,
+                      help="number of groups")
+    parser.add_option("-p", "--repeat-groups", type="int", default=2,
+                      dest="repeat_groups",
+                      help="number of times each group is repeated")
+    parser.add_option("-m", "--maps", type="int", default=2,
+                      help="number of address maps")
+    parser.add_option("-n", "--repeat", type="int", default=3,
+                      help="number of times each case is run")
+    parser.add_option("-k", "--filter", metavar="REGEX",
+                      help="only run the cases matching REGEX")
+    parser.add_option("--save", metavar="NAME",
+                      help="save the results as baseline NAME")
+    parser.add_option("--compare", metavar="NAME",
+                      help="compare the results against baseline NAME")
+    parser.add_option("--threshold", type="float", default=1.10,
+                      help="ratio above which a case is reported as slower")
+    parser.add_option("--keep", metavar="DIR",
+                      help="generate the project in DIR and keep it")
+    (options, args) = parser.parse_args()
+
+    params = {"sets": options.sets, "registers": options.registers,
+              "fields": options.fields, "groups": options.groups,
+              "repeat": options.repeat_groups, "maps": options.maps}
+
+    baseline = None
+    if options.compare:
+        with open(baseline_path(options.compare)) as ifile:
+            baseline = json.load(ifile)
+        # Use the same project as the baseline, so the times are comparable
+        params = baseline["params"]
+
+    if options.keep:
+        directory = options.keep
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+    else:
+        directory = tempfile.mkdtemp(prefix="regbench")
+
+    try:
+        data = BenchData(directory, params)
+        sys.stdout.write("%(sets)d register sets, %(registers)d registers, "
+                         "%(fields)d fields\n\n" % params)
+        results = run_cases(data, options, sys.stdout)
+    finally:
+        if not options.keep:
+            shutil.rmtree(directory)
+
+    if options.save:
+        save_baseline(baseline_path(options.save), params, results)
+
+    if baseline:
+        slower = compare(baseline, results, options.threshold, sys.stdout)
+        if slower:
+            sys.stdout.write("\n%d case(s) slower than the baseline\n" %
+                             len(slower))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+#! /usr/bin/env python
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Generates synthetic projects for benchmarking. A project consists of a
+number of register sets, each with the same number of registers and
+fields per register. The register sets are placed into groups (which may
+be repeated), and the groups are placed into address maps.
+
+The output is deterministic for a given set of parameters, so projects
+generated at different times can be compared.
+"""
+
+import os
+from optparse import OptionParser
+
+from regenerate.db import (RegisterDb, RegProject, Register, BitField,
+                           GroupData, GroupInstData)
+
+# Field types used, in rotation, for the generated fields
+FIELD_TYPES = (BitField.TYPE_READ_WRITE, BitField.TYPE_READ_ONLY,
+               BitField.TYPE_READ_ONLY_VALUE, BitField.TYPE_READ_WRITE_1S,
+               BitField.TYPE_WRITE_1_TO_CLEAR_SET, BitField.TYPE_READ_ONLY_LOAD,
+               BitField.TYPE_WRITE_ONLY, BitField.TYPE_READ_WRITE_LOAD)
+
+# Every ARRAY_INTERVAL registers, a register array of ARRAY_SIZE elements
+# is generated instead of a single register
+ARRAY_INTERVAL = 16
+ARRAY_SIZE = 4
+
+
+def set_name(index):
+    return "set%03d" % index
+
+
+def build_field(reg_index, field_index, lsb, msb):
+    """
+    Builds a bit field, assigning the signals required by its type
+    """
+    from regenerate.db.bitfield_types import TYPE_TO_ENABLE
+
+    field = BitField(msb, lsb)
+    field.field_name = "F%d" % field_index
+    field.field_type = FIELD_TYPES[(reg_index + field_index) %
+                                   len(FIELD_TYPES)]
+    mask = (1 << (msb - lsb + 1)) - 1
+    field.reset_value = (reg_index + field_index) & mask
+    field.description = ("Field %d of the REG%d Register, which controls "
+                          "a portion of the block" % (field_index, reg_index))
+
+    base = "r%d_f%d" % (reg_index, field_index)
+    (has_input, has_control) = TYPE_TO_ENABLE[field.field_type]
+    if has_input:
+        field.input_signal = base + "_in"
+    if has_control:
+        field.control_signal = base + "_ld"
+    if not field.is_constant():
+        field.output_signal = base + "_out"
+        field.use_output_enable = True
+    return field
+
+
+def build_register_set(name, registers, fields, width=32):
+    """
+    Builds a register database with the specified number of registers of
+    the specified width, each containing the specified number of fields.
+    """
+    dbase = RegisterDb()
+    dbase.module_name = name
+    dbase.set_name = name
+    dbase.descriptive_title = "Synthetic register set %s" % name
+    dbase.overview_text = ("Register set %s, generated for benchmarking. "
+                           "See the REG0 Register." % name)
+    dbase.owner = "bench"
+    dbase.organization = "bench"
+
+    field_width = max(1, width / max(1, fields))
+
+    address = 0
+    for reg_index in range(registers):
+        reg = Register(address, width)
+        reg.register_name = "REG%d" % reg_index
+        reg.token = "REG%d" % reg_index
+        reg.description = "Register %d of %s" % (reg_index, name)
+        if reg_index % ARRAY_INTERVAL == ARRAY_INTERVAL - 1:
+            reg.dimension = ARRAY_SIZE
+
+        lsb = 0
+        for field_index in range(fields):
+            msb = min(lsb + field_width - 1, width - 1)
+            if lsb > msb:
+                break
+            reg.add_bit_field(build_field(reg_index, field_index, lsb, msb))
+            lsb = msb + 1
+
+        dbase.add_register(reg)
+        address += reg.dimension * (width / 8)
+
+    dbase.address_bus_width = max(12, (address - 1).bit_length())
+    return dbase
+
+
+def build_project(directory, sets=10, registers=100, fields=4, groups=2,
+                  repeat=2, maps=2, width=32):
+    """
+    Generates a project in the directory, returning the path to the project
+    file. The register sets are divided among the groups, each group is
+    repeated the specified number of times, and each address map contains
+    all the groups.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    project = RegProject()
+    project.path = os.path.join(directory, "synth.rprj")
+    project.name = "Synthetic Project"
+    project.short_name = "synth"
+    project.company_name = "bench"
+
+    groups = max(1, min(groups, sets))
+    set_size = 1 << (registers * (width / 8) * ARRAY_SIZE - 1).bit_length()
+    group_size = set_size * ((sets + groups - 1) / groups)
+
+    group_list = []
+    for grp_index in range(groups):
+        group = GroupData("grp%d" % grp_index,
+                          grp_index * repeat * group_size,
+                          "grp%d" % grp_index, repeat, group_size)
+        project.add_to_grouping_list(group)
+        group_list.append(group)
+
+    for index in range(sets):
+        name = set_name(index)
+        filename = os.path.join(directory, name + ".xml")
+        build_register_set(name, registers, fields, width).save_xml(filename)
+        project.add_register_set(filename)
+        project.add_to_export_list(filename, "rtl-system-verilog",
+                                   os.path.join(directory, name + ".sv"))
+
+        group = group_list[index % groups]
+        offset = (index / groups) * set_size
+        group.register_sets.append(
+            GroupInstData(name, name, offset, 1, 0, "", False, False,
+                          False, False))
+
+    for map_index in range(maps):
+        map_name = "map%d" % map_index
+        project.set_address_map(map_name,
+                                map_index * groups * repeat * group_size, 4,
+                                False, False)
+        for group in group_list:
+            project.add_address_map_group(map_name, group.name)
+
+    project.add_to_project_export_list("proj-uvm",
+                                       os.path.join(directory, "synth_pkg.sv"))
+    project.save()
+    return project.path
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] directory",
+                          description="Generates a synthetic project")
+    parser.add_option("-s", "--sets", type="int", default=10,
+                      help="number of register sets")
+    parser.add_option("-r", "--registers", type="int", default=100,
+                      help="number of registers per register set")
+    parser.add_option("-f", "--fields", type="int", default=4,
+                      help="number of fields per register")
+    parser.add_option("-g", "--groups", type="int", default=2,
+                      help="number of groups")
+    parser.add_option("-p", "--repeat", type="int", default=2,
+                      help="number of times each group is repeated")
+    parser.add_option("-m", "--maps", type="int", default=2,
+                      help="number of address maps")
+    parser.add_option("-w", "--width", type="int", default=32,
+                      help="register width in bits")
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.print_help()
+        return 1
+
+    path = build_project(args[0], options.sets, options.registers,
+                         options.fields, options.groups, options.repeat,
+                         options.maps, options.width)
+    print "Created", path
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
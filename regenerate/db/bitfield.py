@@ -21,6 +21,7 @@ Provides the definition of a Bit Field,
 """
 
 import uuid
+import hashlib
 
 
 def clean_signal(name):
@@ -66,7 +67,7 @@ class BitField(object):
                     "volatile", "is_error_field", "_reset_value",
                     "reset_input", "reset_type", "reset_parameter",
                     "description", "control_signal", "output_is_static",
-                    "output_has_side_effect", "values")
+                    "output_has_side_effect", "values", "can_randomize")
 
     doc_compare = ("_id", "lsb", "msb", "_field_name", "field_type",
                    "is_error_field", "_reset_value", "reset_input",
@@ -110,6 +111,13 @@ class BitField(object):
     def __cmp__(self, other):
         return cmp(self.msb, other.msb)
 
+    def fingerprint(self):
+        """
+        Returns a hash of the items used by the full comparison.
+        """
+        data = [self.__dict__[i] for i in self.full_compare]
+        return hashlib.sha1(repr(data)).hexdigest()
+
     def is_constant(self):
         """
         Indicates the the value is a constant value.
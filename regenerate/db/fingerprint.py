@@ -0,0 +1,41 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Provides content hashes for files, used to quickly detect files that
+have not changed without parsing them.
+"""
+
+import hashlib
+
+BLOCK_SIZE = 1 << 16
+
+
+def file_digest(filename):
+    """
+    Returns the SHA1 hash of the contents of the file, or None if the
+    file cannot be read.
+    """
+    sha = hashlib.sha1()
+    try:
+        with open(filename, "rb") as ifile:
+            for block in iter(lambda: ifile.read(BLOCK_SIZE), b""):
+                sha.update(block)
+    except IOError:
+        return None
+    return sha.hexdigest()
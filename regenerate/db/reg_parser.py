@@ -538,7 +538,7 @@ class RegParser(object):
         Called when the interface tag is terminated. The text value is assigned
         to the database's write_strobe_name
         """
-        self.__db.use_interface = bool(text)
+        self.__db.use_interface = bool(int(text))
 
     def end_wr(self, text):
         """
@@ -0,0 +1,192 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Fast scan of register set files.
+
+Reads the module name, the bus widths and the port names from the header
+of a register set file (the <module>, <base> and <ports> elements) without
+building a RegisterDb. Unless the registers are counted, parsing stops at
+the end of the <ports> element. Counting the registers parses the rest of
+the file, but only looks at the <register>, <width> and <dimension>
+elements, and does not create any objects.
+"""
+
+import os
+import xml.parsers.expat
+from collections import namedtuple
+
+from regenerate.db.reg_parser import cnv_int
+
+# Maps the tags inside <ports> to the RegisterDb attribute names
+PORT_TAGS = {
+    "interface": "use_interface",
+    "addr": "address_bus_name",
+    "data_in": "write_data_name",
+    "data_out": "read_data_name",
+    "be": "byte_strobe_name",
+    "wr": "write_strobe_name",
+    "ack": "acknowledge_name",
+    "rd": "read_strobe_name",
+    "clk": "clock_name",
+    "reset": "reset_name",
+}
+
+# The header of a register set. The ports map the RegisterDb attribute
+# names (see PORT_TAGS, along with byte_strobe_active_level and
+# reset_active_level) to their values. The registers (the number of
+# register elements) and total_bits (the sum of the width times the
+# dimension of each register) are None if the registers were not counted.
+RegSetHeader = namedtuple("RegSetHeader", [
+    "set_name", "module_name", "coverage", "internal_only",
+    "address_bus_width", "data_bus_width", "ports", "registers",
+    "total_bits"])
+
+
+class _HeaderDone(Exception):
+    """
+    Raised to stop the parser at the end of the header
+    """
+    pass
+
+
+class _Scanner(object):
+    """
+    Expat handlers for the scan. The character data handler is only
+    installed while the text of an element is needed.
+    """
+
+    def __init__(self, parser, count):
+        self.parser = parser
+        self.count = count
+        self.module = {"module_name": "", "coverage": True,
+                       "internal_only": False, "address_bus_width": 32,
+                       "data_bus_width": 32}
+        self.ports = {}
+        self.registers = 0
+        self.total_bits = 0
+        self.__in_ports = False
+        self.__text = []
+        self.__width = 32
+        self.__dimension = 1
+
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start_header
+        parser.EndElementHandler = self.end_header
+
+    def __collect(self):
+        self.__text = []
+        self.parser.CharacterDataHandler = self.__text.append
+
+    def __collected(self):
+        self.parser.CharacterDataHandler = None
+        return "".join(self.__text).strip()
+
+    def start_header(self, tag, attrs):
+        if tag == "module":
+            self.module["module_name"] = attrs.get("name", "")
+            self.module["coverage"] = bool(int(attrs.get("coverage", "1")))
+            self.module["internal_only"] = bool(int(attrs.get("internal",
+                                                              "0")))
+        elif tag == "base":
+            self.module["address_bus_width"] = cnv_int(attrs, "addr_width",
+                                                       32)
+            self.module["data_bus_width"] = cnv_int(attrs, "data_width", 32)
+        elif tag == "ports":
+            self.__in_ports = True
+        elif self.__in_ports and tag in PORT_TAGS:
+            if tag == "be":
+                self.ports["byte_strobe_active_level"] = cnv_int(attrs,
+                                                                 "active")
+            elif tag == "reset":
+                self.ports["reset_active_level"] = cnv_int(attrs, "active")
+            self.__collect()
+        elif tag == "register":
+            # A file without a <ports> element
+            self.__end_of_header()
+            self.start_register(tag, attrs)
+
+    def end_header(self, tag):
+        if self.__in_ports and tag in PORT_TAGS:
+            text = self.__collected()
+            if tag == "interface":
+                self.ports[PORT_TAGS[tag]] = bool(int(text or "0"))
+            else:
+                self.ports[PORT_TAGS[tag]] = text
+        elif tag == "ports":
+            self.__in_ports = False
+            self.__end_of_header()
+
+    def __end_of_header(self):
+        if not self.count:
+            raise _HeaderDone()
+        self.parser.StartElementHandler = self.start_register
+        self.parser.EndElementHandler = self.end_register
+
+    def start_register(self, tag, attrs):
+        if tag == "register":
+            self.__width = 32
+            self.__dimension = 1
+        elif tag in ("width", "dimension"):
+            self.__collect()
+
+    def end_register(self, tag):
+        if tag == "register":
+            self.registers += 1
+            self.total_bits += self.__width * self.__dimension
+        elif tag == "width":
+            self.__width = int(self.__collected())
+        elif tag == "dimension":
+            try:
+                self.__dimension = int(self.__collected())
+            except ValueError:
+                self.__dimension = 1
+
+
+_SCANS = {}
+
+
+def scan_register_set(filename, count=False):
+    """
+    Returns the RegSetHeader of the register set file, counting the
+    registers if count is True. The results are kept until the file
+    changes.
+    """
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    key = (path, count)
+    entry = _SCANS.get(key)
+    if entry is not None and entry[0] == (stat.st_mtime, stat.st_size):
+        return entry[1]
+
+    parser = xml.parsers.expat.ParserCreate()
+    scanner = _Scanner(parser, count)
+    with open(path, "rb") as ifile:
+        try:
+            parser.ParseFile(ifile)
+        except _HeaderDone:
+            pass
+
+    header = RegSetHeader(
+        set_name=os.path.splitext(os.path.basename(path))[0],
+        ports=scanner.ports,
+        registers=scanner.registers if count else None,
+        total_bits=scanner.total_bits if count else None,
+        **scanner.module)
+    _SCANS[key] = ((stat.st_mtime, stat.st_size), header)
+    return header
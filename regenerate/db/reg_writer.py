@@ -22,6 +22,7 @@ Writes the XML file containing all the information in the register database
 
 from regenerate.db import BitField, TYPE_TO_ID
 from regenerate.db.textutils import clean_text
+from cStringIO import StringIO
 import os
 import xml.sax.saxutils
 
@@ -51,7 +52,35 @@ class RegWriter(object):
         Saves the data to the specified XML file.
         """
         create_backup_file(filename)
-        ofile = open(filename, "w")
+        with open(filename, "w") as ofile:
+            self.write(ofile)
+
+    def save_if_changed(self, filename):
+        """
+        Saves the data to the specified XML file only if the generated
+        output differs from the existing file. Returns True if the file
+        was written.
+        """
+        buf = StringIO()
+        self.write(buf)
+        data = buf.getvalue()
+
+        try:
+            with open(filename) as ifile:
+                if ifile.read() == data:
+                    return False
+        except IOError:
+            pass
+
+        create_backup_file(filename)
+        with open(filename, "w") as ofile:
+            ofile.write(data)
+        return True
+
+    def write(self, ofile):
+        """
+        Writes the data to the open file object.
+        """
         if self.dbase.array_is_reg:
             array = "reg"
         else:
@@ -79,7 +108,6 @@ class RegWriter(object):
 
         self.write_signal_list(ofile)
         ofile.write('</module>\n')
-        ofile.close()
 
     def write_port_information(self, ofile):
         """
@@ -22,6 +22,7 @@ register, including the list of bit fields.
 """
 
 import uuid
+import hashlib
 from bitfield import BitField
 
 class Register(object):
@@ -88,6 +89,16 @@ class Register(object):
             return False
         return self.get_bit_fields() == other.get_bit_fields()
 
+    def fingerprint(self):
+        """
+        Returns a hash of the items used by the full comparison, including
+        the bit fields. Two registers with the same fingerprint are equal,
+        so the fingerprint can be used instead of a field by field compare.
+        """
+        data = [self.__dict__[i] for i in self.full_compare]
+        data.extend(field.fingerprint() for field in self.get_bit_fields())
+        return hashlib.sha1(repr(data)).hexdigest()
+
     def find_first_unused_bit(self):
         """
         Finds the first unused bit in a the register.
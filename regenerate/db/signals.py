@@ -0,0 +1,269 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Signal connectivity index.
+
+The signals of a register set are only stored on the bit fields (the
+output, input, control and reset input signals). SignalIndex scans the
+fields of a database once, and maps each signal to the fields that use
+it, along with the bits of the signal used by each field. The writers use
+the index to find the ports of the module, the static outputs, and the
+outputs that are driven by more than one field.
+
+ProjectSignals combines the indexes of the register sets used by a
+project with the instances of the register sets in each group.
+
+As with the writer views, the index is a snapshot of the database. Code
+that edits a database (such as the GUI) must call clear_signals before
+running the writers again.
+"""
+
+import re
+import weakref
+from collections import namedtuple, OrderedDict
+
+from regenerate.db.bitfield import BitField
+from regenerate.db.bitfield_types import TYPES, TYPE_TO_OUTPUT
+from regenerate.db.topology import get_topology
+
+OUTPUT = "output"
+INPUT = "input"
+CONTROL = "control"
+RESET = "reset"
+
+BIT_SLICE = re.compile(r"(.*)\[(\d+)\]")
+BUS_SLICE = re.compile(r"(.*)\[(\d+):(\d+)\]")
+
+TYPE_TO_INFO = dict((__i.type, __i) for __i in TYPES)
+
+# A use of a signal by a field. The signal is the name without any bit
+# select, and name is the name as entered on the field. The msb and lsb
+# are the bits of the signal used by the field, or None if the field uses
+# the whole signal.
+SignalUse = namedtuple("SignalUse", ["signal", "name", "kind", "register",
+                                     "field", "msb", "lsb"])
+
+
+def signal_bits(name, field):
+    """
+    Splits the signal name used by a field into the signal and the bits
+    used, returning (signal, msb, lsb). A name without a bit select uses
+    the bits of the field, unless the field is a single bit.
+    """
+    match = BUS_SLICE.match(name)
+    if match:
+        (signal, left, right) = match.groups()
+        return (signal, max(int(left), int(right)),
+                min(int(left), int(right)))
+    match = BIT_SLICE.match(name)
+    if match:
+        return (match.group(1), int(match.group(2)), int(match.group(2)))
+    if "[" in name:
+        return (name.split("[")[0], field.msb, field.lsb)
+    if field.msb == field.lsb:
+        return (name, None, None)
+    return (name, field.msb, field.lsb)
+
+
+def overlaps(first, second):
+    """
+    Checks if the two uses share any bits of the signal
+    """
+    if first.msb is None or second.msb is None:
+        return True
+    return first.lsb <= second.msb and second.lsb <= first.msb
+
+
+def is_driver(use):
+    """
+    Checks if the use is an output that is driven by the register set
+    """
+    return use.kind == OUTPUT and TYPE_TO_OUTPUT[use.field.field_type]
+
+
+class SignalIndex(object):
+    """
+    Signals of a single register database. The uses of each kind are kept
+    in register (address) and field order, which is the order used for the
+    ports of the module.
+    """
+
+    def __init__(self, dbase):
+        self.dbase = dbase
+        self.__uses = OrderedDict()
+        self.__by_kind = dict((kind, []) for kind in (OUTPUT, INPUT,
+                                                      CONTROL, RESET))
+
+        for reg in dbase.get_all_registers():
+            for field in reg.get_bit_fields():
+                info = TYPE_TO_INFO[field.field_type]
+                if info.control and field.control_signal:
+                    self.__add(CONTROL, field.control_signal, reg, field)
+                if info.input and field.input_signal:
+                    self.__add(INPUT, field.input_signal, reg, field)
+                if (field.reset_type == BitField.RESET_INPUT and
+                        field.reset_input):
+                    self.__add(RESET, field.reset_input, reg, field)
+                if field.use_output_enable and field.output_signal:
+                    self.__add(OUTPUT, field.output_signal, reg, field)
+                    if info.oneshot:
+                        self.__add(OUTPUT, field.output_signal + "_1S",
+                                   reg, field)
+
+    def __add(self, kind, name, reg, field):
+        (signal, msb, lsb) = signal_bits(name, field)
+        use = SignalUse(signal, name, kind, reg, field, msb, lsb)
+        self.__uses.setdefault(signal, []).append(use)
+        self.__by_kind[kind].append(use)
+
+    def signals(self, kind=None):
+        """
+        Returns the names of the signals, optionally only those with a use
+        of the specified kind
+        """
+        if kind is None:
+            return list(self.__uses)
+        return list(OrderedDict((use.signal, None)
+                                for use in self.__by_kind[kind]))
+
+    def uses(self, signal):
+        """
+        Returns the uses of the signal
+        """
+        return list(self.__uses.get(signal, []))
+
+    def uses_of_kind(self, kind):
+        """
+        Returns all the uses of the specified kind
+        """
+        return list(self.__by_kind[kind])
+
+    def bit_range(self, signal):
+        """
+        Returns the (msb, lsb) covered by all the uses of the signal, or
+        None if the signal is only used as a whole
+        """
+        bits = [(use.msb, use.lsb) for use in self.__uses.get(signal, [])
+                if use.msb is not None]
+        if not bits:
+            return None
+        return (max(bit[0] for bit in bits), min(bit[1] for bit in bits))
+
+    def static_outputs(self):
+        """
+        Returns the output uses that are marked as static
+        """
+        return [use for use in self.__by_kind[OUTPUT]
+                if use.field.output_is_static and
+                use.name == use.field.output_signal]
+
+    def conflicts(self):
+        """
+        Returns a list of (signal, uses) for the outputs where more than
+        one field drives the same bits
+        """
+        drivers = OrderedDict()
+        for use in self.__by_kind[OUTPUT]:
+            if is_driver(use):
+                drivers.setdefault(use.signal, []).append(use)
+
+        found = []
+        for (signal, uses) in drivers.items():
+            if len(uses) < 2:
+                continue
+            uses = sorted(uses, key=lambda use: -1 if use.lsb is None
+                          else use.lsb)
+            clash = []
+            last = uses[0]
+            for use in uses[1:]:
+                if overlaps(last, use):
+                    if last not in clash:
+                        clash.append(last)
+                    clash.append(use)
+                if use.msb is None or (last.msb is not None and
+                                       use.msb > last.msb):
+                    last = use
+            if clash:
+                found.append((signal, clash))
+        return found
+
+
+class ProjectSignals(object):
+    """
+    Signals of the register sets used by a project. Each use of a signal
+    is reported for every instance of its register set.
+    """
+
+    def __init__(self, project, dblist):
+        topology = get_topology(project)
+        self.indexes = OrderedDict()
+        self.__instances = {}
+        for dbase in topology.used_databases(dblist):
+            self.indexes[dbase.set_name] = get_signals(dbase)
+            self.__instances[dbase.set_name] = topology.instances_of(
+                dbase.set_name)
+
+    def find(self, signal):
+        """
+        Returns a list of (group, instance, use) for each use of the signal
+        """
+        return [(group, inst, use)
+                for (set_name, index) in self.indexes.items()
+                for use in index.uses(signal)
+                for (group, inst) in self.__instances[set_name]]
+
+    def instances(self, set_name):
+        """
+        Returns the (group, instance) pairs for the register set
+        """
+        return self.__instances.get(set_name, ())
+
+    def conflicts(self):
+        """
+        Returns a list of (set name, signal, uses) for the conflicting
+        outputs in each register set
+        """
+        return [(set_name, signal, uses)
+                for (set_name, index) in self.indexes.items()
+                for (signal, uses) in index.conflicts()]
+
+
+_SIGNALS = weakref.WeakKeyDictionary()
+
+
+def get_signals(dbase):
+    """
+    Returns the signal index of the database, building it if needed
+    """
+    index = _SIGNALS.get(dbase)
+    if index is None:
+        index = SignalIndex(dbase)
+        _SIGNALS[dbase] = index
+    return index
+
+
+def clear_signals(dbase=None):
+    """
+    Discards the signal index of the database, or all indexes if no
+    database is given. Must be called after a database is modified.
+    """
+    if dbase is None:
+        _SIGNALS.clear()
+    else:
+        _SIGNALS.pop(dbase, None)
@@ -0,0 +1,175 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Project topology: the address maps, the groups in each map, the register
+set instances in each group, and the register sets used by the UVM
+address maps.
+
+The project and exporter writers all need this information. Working it
+out means scanning every group for every address map. ProjectTopology
+does this once, and get_topology returns the same topology to every
+writer for the project.
+
+The topology is a snapshot of the project. It is not updated when the
+project changes, so code that edits the project (such as the GUI) must
+call clear_topology before running the writers again.
+"""
+
+import weakref
+from collections import OrderedDict
+
+
+class ProjectTopology(object):
+    """
+    Read only summary of the structure of a project:
+
+      address_maps - all address maps (AddrMapData)
+      uvm_maps     - the address maps used by the UVM writers
+      used_maps    - frozenset of the names of the uvm_maps
+      groups       - all groups (GroupData), in project order
+      map_groups   - map name to the tuple of names of the groups in each
+                     of the uvm_maps. A map with no groups assigned
+                     contains all groups.
+      group_maps   - group to the frozenset of names of the uvm_maps that
+                     contain it, for groups in at least one map
+      used_sets    - frozenset of the names of the register sets
+                     instanced in the groups in group_maps
+    """
+
+    __slots__ = ("address_maps", "uvm_maps", "used_maps", "groups",
+                 "map_groups", "group_maps", "used_sets", "_all_maps",
+                 "_by_name", "_instances")
+
+    def __init__(self, project):
+        set_attr = super(ProjectTopology, self).__setattr__
+
+        address_maps = tuple(project.get_address_maps())
+        groups = tuple(project.get_grouping_list())
+        all_names = tuple(group.name for group in groups)
+        assigned = dict((addr_map.name,
+                         project.get_address_map_groups(addr_map.name))
+                        for addr_map in address_maps)
+
+        uvm_maps = tuple(m for m in address_maps if not m.uvm)
+
+        map_groups = OrderedDict()
+        for addr_map in uvm_maps:
+            map_groups[addr_map.name] = (tuple(assigned[addr_map.name]) or
+                                         all_names)
+
+        all_maps = OrderedDict()
+        group_maps = OrderedDict()
+        by_name = {}
+        instances = {}
+        for group in groups:
+            by_name.setdefault(group.name, group)
+            in_maps = frozenset(name for name in assigned
+                                if not assigned[name] or
+                                group.name in assigned[name])
+            all_maps[group] = in_maps
+            in_uvm = frozenset(name for name in map_groups
+                               if group.name in map_groups[name])
+            if in_uvm:
+                group_maps[group] = in_uvm
+            for inst in group.register_sets:
+                instances.setdefault(inst.set, []).append((group, inst))
+
+        used_sets = frozenset(inst.set for group in group_maps
+                              for inst in group.register_sets)
+
+        set_attr("address_maps", address_maps)
+        set_attr("uvm_maps", uvm_maps)
+        set_attr("used_maps", frozenset(map_groups))
+        set_attr("groups", groups)
+        set_attr("map_groups", map_groups)
+        set_attr("group_maps", group_maps)
+        set_attr("used_sets", used_sets)
+        set_attr("_all_maps", all_maps)
+        set_attr("_by_name", by_name)
+        set_attr("_instances", dict((key, tuple(value))
+                                    for (key, value) in instances.items()))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ProjectTopology is read only")
+
+    def group(self, name):
+        """
+        Returns the group with the specified name, or None
+        """
+        return self._by_name.get(name)
+
+    def maps_for_group(self, group):
+        """
+        Returns the names of all the address maps (not just the UVM maps)
+        that contain the group
+        """
+        return self._all_maps.get(group, frozenset())
+
+    def instances_of(self, set_name):
+        """
+        Returns a tuple of (group, instance) pairs for each instance of the
+        register set, in project order
+        """
+        return self._instances.get(set_name, ())
+
+    def used_databases(self, dblist):
+        """
+        Returns the databases from dblist that are instanced in a group
+        used by a UVM map, in dblist order
+        """
+        return [dbase for dbase in dblist if dbase.set_name in self.used_sets]
+
+    def db_groups(self, dblist):
+        """
+        Returns a list of (database, group, map names) for each group that
+        contains an instance of one of the used databases
+        """
+        data = []
+        for dbase in self.used_databases(dblist):
+            seen = set()
+            for (group, inst) in self.instances_of(dbase.set_name):
+                if group in self.group_maps and group not in seen:
+                    seen.add(group)
+                    data.append((dbase, group, self.group_maps[group]))
+        return data
+
+
+_TOPOLOGY = weakref.WeakKeyDictionary()
+
+
+def get_topology(project):
+    """
+    Returns the topology of the project, building it if needed
+    """
+    topology = _TOPOLOGY.get(project)
+    if topology is None:
+        topology = ProjectTopology(project)
+        _TOPOLOGY[project] = topology
+    return topology
+
+
+def clear_topology(project=None):
+    """
+    Discards the topology of the project, or of all projects if no project
+    is given. Must be called after a project is modified.
+    """
+    if project is None:
+        _TOPOLOGY.clear()
+    else:
+        _TOPOLOGY.pop(project, None)
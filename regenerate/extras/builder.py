@@ -0,0 +1,1035 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Builds the export targets of a project, for regbuild and the regenerated
+daemon.
+
+A Builder keeps the projects and register sets it has read, and only
+reads a file again when its modification time or size changes. Since the
+writers share the views and topology of each database and project, and
+the compiled templates, a long running Builder does not repeat any of
+this work between builds.
+
+The daemon serves a Builder over a Unix domain socket. Each request and
+response is a single line of JSON:
+
+    {"command": "build", "project": path, "cwd": dir, "options": {...}}
+    {"status": 0, "output": "..."}
+
+request() sends a request to the daemon, returning None if the daemon is
+not running or does not reply in time, so that the caller can build in
+process instead. daemon_running() checks that the daemon answers a ping
+before a build is handed to it.
+
+The module only imports the database and writer modules when a build is
+run, so a client that hands the build to the daemon stays cheap to start.
+"""
+
+import errno
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import namedtuple
+from cStringIO import StringIO
+from optparse import Values
+
+from regenerate.extras import profiler, memory
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# Options used by Builder.build, and their defaults
+BUILD_OPTIONS = {"force": False, "verbose": False, "uvm": False,
+                 "rtl": False, "fragment_cache": None, "jobs": None,
+                 "output_cache": None, "output_cache_link": False,
+                 "output_cache_size": None, "output_cache_age": None,
+                 "all": False, "shard": None, "cost_file": None,
+                 "record_costs": None, "archive": None, "sync_dir": None,
+                 "share_classes": False}
+
+# Build options that are paths, relative to the directory of the client
+PATH_OPTIONS = ("fragment_cache", "output_cache", "cost_file",
+                "record_costs", "archive", "sync_dir")
+
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                            "writers", "templates")
+
+# Seconds between checks of the file times when inotify is not available
+POLL_INTERVAL = 0.5
+
+# Seconds without a change before the changes seen by watch are built, so
+# that a burst of saves results in a single build
+SETTLE_TIME = 0.3
+
+# Seconds allowed to connect to the daemon, and for it to answer a ping
+CONNECT_TIMEOUT = 1.0
+
+# Seconds allowed for the daemon to reply to a build request
+BUILD_TIMEOUT = 600.0
+
+# An export target: the (exporter id, destination) item from the project,
+# the register set path (relative to the project) for a block target, the
+# group name for a group target (both are None for a project target), and
+# the absolute paths of the files the target is built from.
+Target = namedtuple("Target", ["item", "register_set", "group", "sources"])
+
+
+def default_socket():
+    """
+    Returns the path of the daemon socket, from the REGENERATED_SOCKET
+    environment variable, or a per user file in the temporary directory
+    """
+    path = os.environ.get("REGENERATED_SOCKET")
+    if path:
+        return path
+    user = os.environ.get("USER") or str(os.getuid())
+    return os.path.join(tempfile.gettempdir(), "regenerated-%s.sock" % user)
+
+
+def build_options(options):
+    """
+    Returns the build options from an optparse Values object (or a
+    dictionary), filling in the defaults
+    """
+    if not isinstance(options, dict):
+        options = vars(options)
+    data = dict(BUILD_OPTIONS)
+    for key in BUILD_OPTIONS:
+        if options.get(key) is not None:
+            data[key] = options[key]
+    return data
+
+
+class Builder(object):
+    """
+    Builds the RTL and UVM targets of projects, keeping the files that
+    have been read for later builds. The lock must be held by any thread
+    using the builder while another thread may be using it.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.builds = 0
+        self.__files = {}
+        self.__cache = None
+
+    def __load(self, path, read):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (stat.st_mtime, stat.st_size)
+        entry = self.__files.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        obj = read(path)
+        self.__files[path] = (key, obj, read)
+        return obj
+
+    def project(self, path):
+        """
+        Returns the project, reading it if needed
+        """
+        return self.__load(path, read_project)
+
+    def register_set(self, path):
+        """
+        Returns the register set database, reading it if needed
+        """
+        return self.__load(path, read_register_set)
+
+    def loaded(self):
+        """
+        Returns the paths of the files that have been read
+        """
+        return sorted(self.__files)
+
+    def changed(self):
+        """
+        Returns the paths of the loaded files that have changed (or been
+        removed) since they were read
+        """
+        found = []
+        for (path, entry) in self.__files.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                found.append(path)
+                continue
+            if entry[0] != (stat.st_mtime, stat.st_size):
+                found.append(path)
+        return sorted(found)
+
+    def refresh(self):
+        """
+        Reads the changed files again, and forgets the files that have
+        been removed. Returns the paths of the files that were read.
+        """
+        reread = []
+        for path in self.changed():
+            read = self.__files.pop(path)[2]
+            if os.path.exists(path):
+                self.__load(path, read)
+                reread.append(path)
+        return reread
+
+    def forget(self, path=None):
+        """
+        Forgets the file, or all files if no path is given
+        """
+        if path is None:
+            self.__files.clear()
+        else:
+            self.__files.pop(os.path.abspath(path), None)
+
+    def targets(self, project, options):
+        """
+        Returns the Targets of the project selected by the options. The
+        all option selects every block, group and project target. Exports
+        whose exporter is not known are skipped with a warning.
+        """
+        from regenerate.db import LOGGER
+        from regenerate.writers import find_exporter
+
+        def known(item):
+            if find_exporter(item[0]) is not None:
+                return True
+            LOGGER.warning('Skipping "%s": unknown exporter "%s"', item[1],
+                           item[0])
+            return False
+
+        top = os.path.dirname(project.path)
+        project_file = os.path.abspath(project.path)
+        every = options.all
+        targets = []
+
+        sources = frozenset([project_file] +
+                            [os.path.abspath(rset)
+                             for rset in project.get_register_set()])
+        if options.uvm or every:
+            for item in project.get_project_exports():
+                if ((every or item[0] in ("proj-uvm", "proj-uvm-shards")) and
+                        known(item)):
+                    targets.append(Target(item, None, None, sources))
+
+        if every:
+            for group in project.get_grouping_list():
+                for item in project.get_group_exports(group.name):
+                    if known(item):
+                        targets.append(Target(item, None, group.name, sources))
+
+        if options.rtl or every:
+            for rset in project.get_register_set():
+                rpath = os.path.relpath(rset, top)
+                sources = frozenset([project_file,
+                                     os.path.abspath(os.path.join(top, rpath))])
+                for item in project.get_exports(rpath):
+                    if ((every or item[0].startswith("rtl-")) and
+                            known(item)):
+                        targets.append(Target(item, rpath, None, sources))
+        return targets
+
+    def shard_targets(self, targets, options):
+        """
+        Returns the targets that belong to the shard given by the shard
+        option, an (index, count) pair with index starting at 1, or all
+        the targets if no shard is given
+        """
+        if not options.shard:
+            return targets
+        (index, count) = options.shard
+        costs = read_costs(options.cost_file)
+        return [target for (target, shard) in
+                zip(targets, assign_shards(targets, count, costs))
+                if shard == index]
+
+    def build(self, path, options, ofile=None, changed=None):
+        """
+        Builds the targets of the project selected by the options (see
+        BUILD_OPTIONS), writing the progress messages and the summary to
+        ofile (stdout by default).
+
+        If changed is given, only the targets with a source file in
+        changed are built, and they are always built.
+        """
+        from regenerate.writers.writer_base import (OUTPUT_REPORT, set_jobs,
+                                                    set_output_sink)
+        from regenerate.writers import fragments
+        from regenerate.writers.uvm_reg_block import set_share_classes
+        from regenerate.extras import output_cache
+
+        ofile = ofile or sys.stdout
+        if isinstance(options, dict):
+            options = Values(build_options(options))
+
+        self.builds += 1
+        OUTPUT_REPORT.clear()
+        fragments.STATS.update(reused=0, rendered=0)
+        fragments.set_cache_dir(options.fragment_cache)
+        set_jobs(options.jobs)
+        set_share_classes(options.share_classes)
+        output_cache.STATS.update(hits=0, misses=0)
+        if options.output_cache:
+            self.__cache = output_cache.OutputCache(
+                options.output_cache, options.output_cache_link,
+                [("share_classes", bool(options.share_classes))])
+        else:
+            self.__cache = None
+
+        if options.verbose:
+            ofile.write("Loading project file %s\n" % path)
+        project = self.project(path)
+        targets = self.targets(project, options)
+        costs = {}
+
+        sink = open_sink(project, options)
+        set_output_sink(sink)
+        try:
+            for target in self.shard_targets(targets, options):
+                if changed is None:
+                    # An archive must hold every target
+                    force = options.force or bool(options.archive)
+                elif target.sources & changed:
+                    force = True
+                else:
+                    continue
+                start = time.time()
+                if target.register_set is not None:
+                    built = self.build_set(project, target.item, options,
+                                           target.register_set, ofile, force,
+                                           target.sources)
+                elif target.group is not None:
+                    built = self.build_grp(project, target.item, options,
+                                           target.group, ofile, force,
+                                           target.sources)
+                else:
+                    built = self.build_prj(project, target.item, options,
+                                           ofile, force, target.sources)
+                if built:
+                    costs[target_id(target)] = time.time() - start
+            if sink is not None:
+                message = sink.close(OUTPUT_REPORT)
+                sink = None
+                if options.verbose:
+                    ofile.write(message + "\n")
+        finally:
+            if sink is not None:
+                sink.discard()
+            set_output_sink(None)
+
+        if options.record_costs and costs:
+            update_costs(options.record_costs, costs)
+
+        if changed is None:
+            if options.uvm and not [t for t in targets
+                                    if t.register_set is None and
+                                    t.group is None]:
+                ofile.write("No rule exists for building a register "
+                            "package\n")
+            if options.rtl and not [t for t in targets
+                                    if t.register_set is not None]:
+                ofile.write("No rule exists for building RTL\n")
+
+        if OUTPUT_REPORT.changed or OUTPUT_REPORT.unchanged:
+            OUTPUT_REPORT.write(ofile, options.verbose)
+        if options.fragment_cache and options.verbose:
+            ofile.write("%(reused)d cached fragment(s) reused, "
+                        "%(rendered)d rendered\n" % fragments.STATS)
+        if self.__cache is not None:
+            if options.verbose:
+                ofile.write("%(hits)d output cache hit(s), "
+                            "%(misses)d miss(es)\n" % output_cache.STATS)
+            if (options.output_cache_size is not None or
+                    options.output_cache_age is not None):
+                removed = self.__cache.prune(options.output_cache_size,
+                                             options.output_cache_age)
+                if removed and options.verbose:
+                    ofile.write("%d output cache entries removed\n" %
+                                removed)
+            self.__cache = None
+
+    def build_set(self, project, item, options, path, ofile, force=False,
+                  sources=None):
+        """
+        Builds a register set target, if it is out of date. Returns True if
+        the target was built.
+        """
+        writer = get_writer(item[0])
+        dbase_name = os.path.abspath(
+            os.path.join(os.path.dirname(project.path), path))
+        db_file_mtime = os.path.getmtime(dbase_name)
+
+        dest = os.path.abspath(
+            os.path.join(os.path.dirname(project.path), item[1]))
+
+        if not os.path.exists(dest):
+            rebuild = True
+        else:
+            dest_time = os.path.getmtime(dest)
+            rebuild = dest_time < db_file_mtime
+
+        if rebuild or force:
+            if options.verbose:
+                ofile.write("Generating %s.\n" % dest)
+            self.run_writer(writer, (project, self.register_set(dbase_name)),
+                            item, dest, sources)
+            return True
+        ofile.write("%s up to date.\n" % dest)
+        return False
+
+    def build_prj(self, project, item, options, ofile, force=False,
+                  sources=None):
+        """
+        Builds a project target, if it is out of date. Returns True if the
+        target was built.
+        """
+        dbase_list = [self.register_set(dbase_name)
+                      for dbase_name in project.get_register_set()]
+
+        # The target is out of date if it is older than the newest of its
+        # sources, the project file and the register sets
+        max_mod_time = max(os.path.getmtime(path) for path in
+                           [project.path] + project.get_register_set())
+
+        rebuild = False
+        writer = get_writer(item[0])
+        dest = os.path.abspath(
+            os.path.join(os.path.dirname(project.path), item[1]))
+
+        if not os.path.exists(dest):
+            rebuild = True
+        else:
+            dest_time = os.path.getmtime(dest)
+            rebuild = dest_time < max_mod_time
+
+        if rebuild or force:
+            if options.verbose:
+                ofile.write("Generating %s.\n" % dest)
+            gen = self.run_writer(writer, (project, dbase_list), item, dest,
+                                  sources)
+            counts = getattr(gen, "class_counts", None)
+            if counts and options.verbose:
+                ofile.write("%d UVM register class(es) before sharing, "
+                            "%d after\n" % counts)
+            return True
+        ofile.write("%s up to date.\n" % dest)
+        return False
+
+    def build_grp(self, project, item, options, group, ofile, force=False,
+                  sources=None):
+        """
+        Builds a group target. Group targets depend on the layout of the
+        group, which is not tracked, so they are always built. Returns
+        True.
+        """
+        dbase_list = [self.register_set(dbase_name)
+                      for dbase_name in project.get_register_set()]
+        writer = get_writer(item[0])
+        dest = os.path.abspath(
+            os.path.join(os.path.dirname(project.path), item[1]))
+
+        if options.verbose:
+            ofile.write("Generating %s.\n" % dest)
+        self.run_writer(writer, (project, group, dbase_list), item, dest,
+                        sources)
+        return True
+
+    def run_writer(self, writer, args, item, dest, sources=None):
+        """
+        Writes dest with the writer, which is created from the arguments
+        (the project and the database or list of databases, along with the
+        group name for a group writer). If an output cache is in use
+        and the sources are given, dest is taken from the cache when
+        possible, and the output of the writer is added to the cache.
+        Returns the writer, or None if dest came from the cache.
+        """
+        from regenerate.writers.writer_base import OUTPUT_REPORT, output_path
+
+        cache = self.__cache
+        key = None
+        path = output_path(dest)
+        if cache is not None and sources and path is not None:
+            key = cache.key(item[0], writer, item[1], sources)
+            with profiler.phase("output cache", dest, "target"):
+                changed = cache.fetch(key, path)
+            if changed is not None:
+                OUTPUT_REPORT.record(dest, changed)
+                return None
+
+        before = (len(OUTPUT_REPORT.changed), len(OUTPUT_REPORT.unchanged))
+        with profiler.phase(item[0], dest, "target"):
+            gen = writer(*args)
+            with memory.measure(item[0], dest):
+                gen.write(dest)
+
+        # Only writers that wrote dest and nothing else are cached
+        if key is not None:
+            outputs = (OUTPUT_REPORT.changed[before[0]:] +
+                       OUTPUT_REPORT.unchanged[before[1]:])
+            if [os.path.abspath(name) for name in outputs] == [dest]:
+                cache.store(key, path, getattr(gen, "_dates", ()))
+        return gen
+
+
+def target_id(target):
+    """
+    Returns the name of the target used by the shards and the cost file
+    """
+    return "%s:%s" % target.item
+
+
+def source_size(target):
+    """
+    Returns the number of registers and the total number of register bits
+    in the source files of the target, found with a fast scan of each file
+    """
+    from regenerate.db.reg_scan import scan_register_set
+    from xml.parsers.expat import ExpatError
+
+    registers = 0
+    bits = 0
+    for path in target.sources:
+        try:
+            header = scan_register_set(path, count=True)
+        except (IOError, OSError, ExpatError):
+            continue
+        registers += header.registers
+        bits += header.total_bits
+    return (registers, bits)
+
+
+def target_cost(target, costs):
+    """
+    Returns the cost of the target: the time of its last build if known,
+    otherwise an estimate from the number of registers it is built from
+    """
+    cost = costs.get(target_id(target))
+    if cost is not None:
+        return cost
+    # Approximate build time in seconds per register
+    return source_size(target)[0] * 0.005
+
+
+def assign_shards(targets, count, costs=None):
+    """
+    Splits the targets between count shards, returning the shard (starting
+    at 1) of each target. The most expensive targets are assigned first,
+    each to the least loaded shard, so the shards have similar costs. The
+    assignment only depends on the targets and the costs, so every build
+    node computes the same split.
+    """
+    costs = costs or {}
+    order = sorted(range(len(targets)),
+                   key=lambda i: (-target_cost(targets[i], costs),
+                                  target_id(targets[i])))
+    loads = [0.0] * count
+    shards = [None] * len(targets)
+    for i in order:
+        shard = min(range(count), key=lambda n: (loads[n], n))
+        loads[shard] += target_cost(targets[i], costs)
+        shards[i] = shard + 1
+    return shards
+
+
+def read_costs(path):
+    """
+    Reads the build times of the targets from the cost file, returning
+    an empty dictionary if the file does not exist
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as ifile:
+        try:
+            return json.load(ifile)
+        except ValueError:
+            return {}
+
+
+def update_costs(path, costs):
+    """
+    Adds the build times to the cost file
+    """
+    data = read_costs(path)
+    data.update(costs)
+    dirname = os.path.dirname(os.path.abspath(path))
+    (handle, tmpname) = tempfile.mkstemp(dir=dirname, prefix=".regen")
+    with os.fdopen(handle, "w") as ofile:
+        json.dump(data, ofile, indent=1, sort_keys=True)
+    os.rename(tmpname, path)
+
+
+def list_targets(builder, path, options):
+    """
+    Returns a description of each target of the project selected by the
+    options, for external schedulers
+    """
+    from regenerate.db.reg_scan import scan_register_set
+
+    if isinstance(options, dict):
+        options = Values(build_options(options))
+    project = builder.project(path)
+    top = os.path.dirname(os.path.abspath(project.path))
+    targets = builder.targets(project, options)
+    costs = read_costs(options.cost_file)
+    shards = assign_shards(targets, options.shard[1] if options.shard else 1,
+                           costs)
+
+    found = []
+    for (target, shard) in zip(targets, shards):
+        module = None
+        if target.register_set is not None:
+            level = "block"
+            module = scan_register_set(
+                os.path.join(top, target.register_set)).module_name
+        elif target.group is not None:
+            level = "group"
+        else:
+            level = "project"
+        if options.shard and shard != options.shard[0]:
+            continue
+        (registers, bits) = source_size(target)
+        found.append({"id": target_id(target), "exporter": target.item[0],
+                      "dest": os.path.join(top, target.item[1]),
+                      "level": level, "register_set": target.register_set,
+                      "module": module, "group": target.group,
+                      "sources": sorted(target.sources),
+                      "registers": registers, "bits": bits,
+                      "cost": target_cost(target, costs), "shard": shard})
+    return found
+
+
+def open_sink(project, options):
+    """
+    Returns the output sink selected by the options, or None if the files
+    are written in place
+    """
+    from regenerate.writers.output_sink import ArchiveSink, SyncDirSink
+
+    if options.archive:
+        return ArchiveSink(options.archive, os.path.dirname(
+            os.path.abspath(project.path)))
+    if options.sync_dir:
+        return SyncDirSink(options.sync_dir)
+    return None
+
+
+def read_project(path):
+    from regenerate.db.reg_project import RegProject
+
+    with profiler.phase("parse project", path, "parse"):
+        project = RegProject(path)
+    memory.snapshot("load project", path)
+    return project
+
+
+def read_register_set(path):
+    from regenerate.db.register_db import RegisterDb
+
+    with profiler.phase("parse register set", path, "parse"):
+        dbase = RegisterDb()
+        dbase.read_xml(path)
+    memory.snapshot("load register set", path)
+    memory.add_database(dbase)
+    return dbase
+
+
+def get_writer(exp_id):
+    """
+    Returns the writer class for the exporter, importing it if needed
+    """
+    from regenerate.writers import find_exporter
+
+    info = find_exporter(exp_id)
+    if info is None:
+        raise IOError('Unknown exporter "%s"' % exp_id)
+    with profiler.phase("load writer", exp_id, "config"):
+        return info.obj_class
+
+
+def request(message, path=None, timeout=CONNECT_TIMEOUT):
+    """
+    Sends the request to the daemon and returns the response. Returns None
+    if the daemon is not running (or Unix domain sockets are not
+    available), or if the connection takes longer than CONNECT_TIMEOUT
+    seconds, or the daemon does not send anything for timeout seconds.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        try:
+            sock.connect(path or default_socket())
+        except socket.timeout:
+            return None
+        except socket.error as err:
+            if err.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return None
+            raise
+        sock.settimeout(timeout)
+        data = []
+        try:
+            sock.sendall(json.dumps(message) + "\n")
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data.append(chunk)
+        except socket.timeout:
+            return None
+    finally:
+        sock.close()
+    return json.loads("".join(data))
+
+
+def daemon_running(path=None):
+    """
+    Returns True if the daemon socket exists and the daemon answers a ping
+    within CONNECT_TIMEOUT seconds
+    """
+    path = path or default_socket()
+    return (os.path.exists(path) and
+            request({"command": "ping"}, path) is not None)
+
+
+class BuildServer(object):
+    """
+    Serves the requests for a Builder on a Unix domain socket. Requests
+    are handled one at a time. If poll is given, a background thread
+    checks the loaded files every poll seconds, and reads the changed
+    files again, so the next build does not have to.
+    """
+
+    def __init__(self, path=None, builder=None, poll=None):
+        self.path = path or default_socket()
+        self.builder = builder or Builder()
+        self.poll = poll
+        self.started = time.time()
+        self.running = False
+        self.__sock = None
+
+    def open(self):
+        """
+        Creates the socket. Raises an IOError if a daemon is already
+        running on the socket.
+        """
+        if os.path.exists(self.path):
+            if request({"command": "ping"}, self.path) is not None:
+                raise IOError(errno.EADDRINUSE, "Daemon already running",
+                              self.path)
+            os.remove(self.path)
+        self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_mask = os.umask(0o077)
+        try:
+            self.__sock.bind(self.path)
+        finally:
+            os.umask(old_mask)
+        self.__sock.listen(5)
+
+    def close(self):
+        if self.__sock is not None:
+            self.__sock.close()
+            self.__sock = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def serve(self):
+        """
+        Handles requests until a stop request is received
+        """
+        if self.__sock is None:
+            self.open()
+        self.running = True
+        if self.poll:
+            watcher = threading.Thread(target=self.__watch)
+            watcher.daemon = True
+            watcher.start()
+        try:
+            while self.running:
+                (conn, _) = self.__sock.accept()
+                try:
+                    self.__handle(conn)
+                finally:
+                    conn.close()
+        finally:
+            self.running = False
+            self.close()
+
+    def __watch(self):
+        while self.running:
+            time.sleep(self.poll)
+            with self.builder.lock:
+                self.builder.refresh()
+
+    def __handle(self, conn):
+        ifile = conn.makefile("rb")
+        try:
+            line = ifile.readline()
+        finally:
+            ifile.close()
+        try:
+            message = json.loads(line)
+            response = self.dispatch(message)
+        except ValueError:
+            response = {"status": 1, "output": "Invalid request\n"}
+        conn.sendall(json.dumps(response) + "\n")
+
+    def dispatch(self, message):
+        """
+        Handles a single request, returning the response
+        """
+        command = message.get("command")
+        if command == "ping":
+            return {"status": 0, "pid": os.getpid()}
+        elif command == "status":
+            with self.builder.lock:
+                return {"status": 0, "pid": os.getpid(),
+                        "uptime": time.time() - self.started,
+                        "builds": self.builder.builds,
+                        "loaded": self.builder.loaded()}
+        elif command == "stop":
+            self.running = False
+            return {"status": 0, "output": "regenerated stopped\n"}
+        elif command == "build":
+            return self.build(message)
+        return {"status": 1, "output": "Unknown command %s\n" % command}
+
+    def build(self, message):
+        """
+        Runs a build request, returning the output of the build. The
+        project and the path options are resolved against the directory
+        of the client, instead of changing the directory of the daemon.
+        """
+        output = StringIO()
+        status = 0
+        cwd = message.get("cwd") or os.getcwd()
+        options = dict(message.get("options", {}))
+        for key in PATH_OPTIONS:
+            if options.get(key):
+                options[key] = os.path.join(cwd, options[key])
+        with self.builder.lock:
+            try:
+                self.builder.build(os.path.join(cwd, message["project"]),
+                                   options, output)
+            except (IOError, OSError, ImportError) as msg:
+                output.write(str(msg) + "\n")
+                status = 1
+            except Exception:
+                output.write(traceback.format_exc())
+                status = 1
+        return {"status": status, "output": output.getvalue()}
+
+
+def file_stamp(path):
+    """
+    Returns the modification time and size of the file, or None if the
+    file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+class PollWatcher(object):
+    """
+    Detects changes to a set of files by checking their modification
+    times and sizes
+    """
+
+    def __init__(self, paths):
+        self.__stamps = {}
+        self.watch(paths)
+
+    def watch(self, paths):
+        """
+        Replaces the set of files being watched
+        """
+        self.__stamps = dict((path, file_stamp(path)) for path in paths)
+
+    def changes(self, timeout):
+        """
+        Waits up to timeout seconds for a change, returning the set of
+        files that changed
+        """
+        end = time.time() + timeout
+        while True:
+            found = set()
+            for (path, stamp) in self.__stamps.items():
+                current = file_stamp(path)
+                if current != stamp:
+                    self.__stamps[path] = current
+                    found.add(path)
+            remaining = end - time.time()
+            if found or remaining <= 0:
+                return found
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+    def close(self):
+        pass
+
+
+if pyinotify is not None:
+
+    class _EventRecorder(pyinotify.ProcessEvent):
+        """
+        Records the paths of the files named by the inotify events
+        """
+
+        def my_init(self, found=None):
+            self.found = found
+
+        def process_default(self, event):
+            self.found.add(event.pathname)
+
+
+class InotifyWatcher(object):
+    """
+    Detects changes to a set of files with inotify. The directories that
+    contain the files are watched, so that files replaced by renaming
+    (as most editors save) are still seen.
+    """
+
+    MASK = 0
+    if pyinotify is not None:
+        MASK = (pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO |
+                pyinotify.IN_CREATE | pyinotify.IN_DELETE)
+
+    def __init__(self, paths):
+        self.__found = set()
+        self.__paths = set()
+        self.__dirs = {}
+        self.__manager = pyinotify.WatchManager()
+        self.__notifier = pyinotify.Notifier(
+            self.__manager, _EventRecorder(found=self.__found))
+        self.watch(paths)
+
+    def watch(self, paths):
+        """
+        Replaces the set of files being watched
+        """
+        self.__paths = set(os.path.abspath(path) for path in paths)
+        dirs = set(os.path.dirname(path) for path in self.__paths)
+        for dirname in dirs - set(self.__dirs):
+            self.__dirs.update(self.__manager.add_watch(dirname, self.MASK))
+        for dirname in set(self.__dirs) - dirs:
+            self.__manager.rm_watch(self.__dirs.pop(dirname))
+
+    def changes(self, timeout):
+        """
+        Waits up to timeout seconds for a change, returning the set of
+        files that changed
+        """
+        end = time.time() + timeout
+        while True:
+            remaining = end - time.time()
+            if remaining > 0 and self.__notifier.check_events(
+                    int(remaining * 1000)):
+                self.__notifier.read_events()
+                self.__notifier.process_events()
+            found = self.__found & self.__paths
+            self.__found.clear()
+            if found or end - time.time() <= 0:
+                return found
+
+    def close(self):
+        self.__notifier.stop()
+
+
+def file_watcher(paths):
+    """
+    Returns an InotifyWatcher for the files if pyinotify is available,
+    otherwise a PollWatcher
+    """
+    if pyinotify is not None:
+        return InotifyWatcher(paths)
+    return PollWatcher(paths)
+
+
+def template_files():
+    """
+    Returns the paths of the writer templates
+    """
+    return [os.path.join(TEMPLATE_DIR, name)
+            for name in sorted(os.listdir(TEMPLATE_DIR))]
+
+
+def watch(path, options, ofile=None, builder=None, settle=SETTLE_TIME):
+    """
+    Builds the project, then watches the project file, the register sets
+    and the templates, building the targets affected by each change. A
+    change to a template rebuilds every target. Changes that arrive less
+    than settle seconds apart are built together. Runs until interrupted.
+    """
+    ofile = ofile or sys.stdout
+    builder = builder or Builder()
+    if isinstance(options, dict):
+        options = Values(build_options(options))
+    templates = frozenset(template_files())
+
+    builder.build(path, options, ofile)
+    sources = watched_sources(builder, path, options)
+    watcher = file_watcher(sources | templates)
+    ofile.write("Watching %d file(s) for changes\n" %
+                len(sources | templates))
+    ofile.flush()
+
+    try:
+        while True:
+            changed = watcher.changes(60)
+            if not changed:
+                continue
+            more = watcher.changes(settle)
+            while more:
+                changed |= more
+                more = watcher.changes(settle)
+
+            for name in sorted(changed):
+                ofile.write("Changed %s\n" % name)
+            if changed & templates:
+                changed = changed | sources
+            try:
+                builder.build(path, options, ofile, changed)
+                sources = watched_sources(builder, path, options)
+                watcher.watch(sources | templates)
+            except Exception as msg:
+                ofile.write("Build failed: %s\n" % msg)
+            ofile.flush()
+    finally:
+        watcher.close()
+
+
+def watched_sources(builder, path, options):
+    """
+    Returns the absolute paths of the project file and the source files
+    of its targets
+    """
+    project = builder.project(path)
+    sources = set([os.path.abspath(path)])
+    for target in builder.targets(project, options):
+        sources.update(target.sources)
+    return frozenset(sources)
@@ -0,0 +1,407 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Memory accounting for the command line tools.
+
+Code marks the points of interest with snapshot(), and wraps the steps
+that allocate heavily with measure():
+
+    memory.snapshot("load project")
+    with memory.measure("write", filename):
+        gen.write(filename)
+
+As with the profiler, the functions do nothing unless accounting has been
+enabled, either with the --memory option added by add_options, or by
+installing a MemoryTracker:
+
+    tracker = memory.install(memory.MemoryTracker())
+    ...
+    tracker.finish()
+
+If the tracemalloc module is available, the allocations are traced, and
+the report lists the source lines that allocated the most memory within
+each measured step. Otherwise, the resident set size of the process is
+used, and the allocation sites are approximated by the growth in the
+number of live objects of each type.
+
+The report also estimates the number of bytes used by each Register and
+BitField object in the databases passed to add_database().
+"""
+
+import gc
+import os
+import sys
+from collections import defaultdict
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from regenerate.extras.profiler import peak_memory
+
+# Number of allocation sites reported for each measured step
+TOP_SITES = 10
+
+# Basic values whose size is attributed to the object that holds them
+try:
+    SIMPLE_TYPES = (str, unicode, int, long, float, bool)
+except NameError:
+    SIMPLE_TYPES = (str, bytes, int, float, bool)
+
+
+def current_memory():
+    """
+    Returns the current resident set size of the process in kilobytes,
+    falling back to the peak size if the current size is not available.
+    """
+    try:
+        with open("/proc/self/statm") as ifile:
+            pages = int(ifile.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return peak_memory()
+
+
+def type_counts():
+    """
+    Returns a dictionary mapping type names to the number of live objects
+    of the type that are tracked by the garbage collector
+    """
+    counts = defaultdict(int)
+    for obj in gc.get_objects():
+        counts[type(obj).__name__] += 1
+    return counts
+
+
+def value_size(value, skip):
+    """
+    Returns the size of a value held in an attribute. Containers include
+    the size of their contents. Objects of the skip types, and other
+    objects that are not basic values, are assumed to be accounted for
+    elsewhere.
+    """
+    if isinstance(value, skip):
+        return 0
+    if isinstance(value, SIMPLE_TYPES):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            value_size(key, skip) + value_size(item, skip)
+            for (key, item) in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(value_size(item, skip)
+                                          for item in value)
+    return 0
+
+
+def object_size(obj, skip=()):
+    """
+    Estimates the number of bytes used by the object, including its
+    attribute dictionary and the values held in its attributes. Values
+    that are shared between objects (such as interned strings and small
+    integers) are counted for each object, so this is an upper bound.
+    """
+    total = sys.getsizeof(obj)
+    attrs = getattr(obj, "__dict__", None)
+    if attrs is not None:
+        total += sys.getsizeof(attrs)
+        for (key, value) in attrs.items():
+            total += value_size(value, skip)
+    return total
+
+
+class Snapshot(object):
+    """
+    Memory use at a point in the run
+    """
+
+    __slots__ = ("label", "detail", "current", "peak", "data")
+
+    def __init__(self, label, detail, current, peak, data):
+        self.label = label
+        self.detail = detail
+        self.current = current
+        self.peak = peak
+        self.data = data
+
+
+class _Measure(object):
+    """
+    Context manager that takes a snapshot before and after a step
+    """
+
+    def __init__(self, tracker, label, detail):
+        self.__tracker = tracker
+        self.__label = label
+        self.__detail = detail
+        self.__before = None
+
+    def __enter__(self):
+        self.__before = self.__tracker.take_snapshot(
+            self.__label + " (before)", self.__detail, True)
+        return self.__before
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        tracker = self.__tracker
+        after = tracker.take_snapshot(self.__label, self.__detail, True)
+        tracker.snapshots.append(after)
+        tracker.steps.append((after, tracker.top_sites(self.__before, after)))
+        # The snapshot data is only needed to find the allocation sites
+        self.__before = None
+        after.data = None
+        return False
+
+
+class _NullMeasure(object):
+    """
+    Context manager that does nothing, used when accounting is disabled
+    """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_MEASURE = _NullMeasure()
+
+
+class NullMemoryTracker(object):
+    """
+    Tracker used when memory accounting is disabled. Nothing is recorded.
+    """
+
+    enabled = False
+
+    def snapshot(self, label, detail=None):
+        return None
+
+    def measure(self, label, detail=None):
+        return NULL_MEASURE
+
+    def add_database(self, dbase):
+        pass
+
+    def finish(self, ofile=None):
+        pass
+
+
+class MemoryTracker(object):
+    """
+    Records snapshots of the memory used by the process, and reports the
+    results. If use_tracemalloc is True and the module is available,
+    allocations are traced, keeping the given number of frames for each
+    allocation.
+    """
+
+    enabled = True
+
+    def __init__(self, top=TOP_SITES, use_tracemalloc=True, frames=1):
+        self.top = top
+        self.snapshots = []
+        self.steps = []
+        self.objects = defaultdict(lambda: [0, 0])
+        self.tracing = bool(use_tracemalloc and tracemalloc)
+        if self.tracing and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.base = self.take_snapshot("start", None, False)
+
+    def take_snapshot(self, label, detail, detailed):
+        """
+        Returns a snapshot of the current memory use. If detailed is True,
+        the snapshot includes the data needed to find the allocation sites.
+        """
+        gc.collect()
+        if self.tracing:
+            (current, peak) = tracemalloc.get_traced_memory()
+            current //= 1024
+            peak //= 1024
+            data = tracemalloc.take_snapshot() if detailed else None
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        else:
+            current = current_memory()
+            peak = peak_memory()
+            data = type_counts() if detailed else None
+        return Snapshot(label, detail, current, peak, data)
+
+    def snapshot(self, label, detail=None):
+        """
+        Records the memory used at this point
+        """
+        snap = self.take_snapshot(label, detail, False)
+        self.snapshots.append(snap)
+        return snap
+
+    def measure(self, label, detail=None):
+        return _Measure(self, label, detail)
+
+    def add_database(self, dbase):
+        """
+        Adds the size of the register and bit field objects of the
+        database to the per object totals
+        """
+        from regenerate.db import BitField
+
+        for reg in dbase.get_all_registers():
+            data = self.objects["Register"]
+            data[0] += 1
+            data[1] += object_size(reg, (BitField,))
+            for field in reg.get_bit_fields():
+                data = self.objects["BitField"]
+                data[0] += 1
+                data[1] += object_size(field)
+
+    def top_sites(self, before, after):
+        """
+        Returns a list of (site, size in bytes, count) tuples for the
+        allocation sites that grew the most between the snapshots. Without
+        tracemalloc, the site is the object type, and the size is unknown.
+        """
+        if before.data is None or after.data is None:
+            return []
+        if self.tracing:
+            filters = (tracemalloc.Filter(False, tracemalloc.__file__),
+                       tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                       tracemalloc.Filter(False, __file__))
+            stats = after.data.filter_traces(filters).compare_to(
+                before.data.filter_traces(filters), "lineno")
+            return [("%s:%d" % (stat.traceback[0].filename,
+                                stat.traceback[0].lineno),
+                     stat.size_diff, stat.count_diff)
+                    for stat in stats[:self.top] if stat.size_diff > 0]
+        # The first snapshot and its data are not allocations of the step
+        counts = before.data.copy()
+        counts[type(before).__name__] += 1
+        counts[type(before.data).__name__] += 1
+        growth = [(name, None, count - counts.get(name, 0))
+                  for (name, count) in after.data.items()]
+        growth.sort(key=lambda item: item[2], reverse=True)
+        return [item for item in growth[:self.top] if item[2] > 0]
+
+    def finish(self, ofile=None):
+        """
+        Writes the report to the file (stderr by default), and stops
+        tracing.
+        """
+        self.write_report(ofile or sys.stderr)
+        if self.tracing:
+            tracemalloc.stop()
+
+    def write_report(self, ofile):
+        if self.tracing:
+            ofile.write("\nMemory use (traced allocations)\n")
+        else:
+            ofile.write("\nMemory use (resident set size, tracemalloc "
+                        "not available)\n")
+
+        ofile.write("%-40s %12s %12s %12s\n" % ("Snapshot", "Current (KB)",
+                                                "Change (KB)", "Peak (KB)"))
+        ofile.write("%s %s %s %s\n" % ("-" * 40, "-" * 12, "-" * 12,
+                                       "-" * 12))
+        last = self.base.current
+        for snap in self.snapshots:
+            ofile.write("%-40s %12d %12d %12d\n" %
+                        (snapshot_name(snap)[:40], snap.current,
+                         snap.current - last, snap.peak))
+            last = snap.current
+
+        for (after, sites) in self.steps:
+            if not sites:
+                continue
+            ofile.write("\nTop allocation sites: %s\n" % snapshot_name(after))
+            for (site, size, count) in sites:
+                if size is None:
+                    ofile.write("  %+10d objects  %s\n" % (count, site))
+                else:
+                    ofile.write("  %10.1f KB %+8d blocks  %s\n" %
+                                (size / 1024.0, count, site))
+
+        if self.objects:
+            ofile.write("\n%-12s %10s %14s %14s\n" % ("Object", "Count",
+                                                      "Total (KB)",
+                                                      "Bytes/object"))
+            for name in ("Register", "BitField"):
+                (count, total) = self.objects[name]
+                if count:
+                    ofile.write("%-12s %10d %14.1f %14d\n" %
+                                (name, count, total / 1024.0, total // count))
+
+
+def snapshot_name(snap):
+    if snap.detail:
+        return "%s %s" % (snap.label, os.path.basename(snap.detail))
+    return snap.label
+
+
+ACTIVE = NullMemoryTracker()
+
+
+def snapshot(label, detail=None):
+    """
+    Records a snapshot in the active tracker
+    """
+    return ACTIVE.snapshot(label, detail)
+
+
+def measure(label, detail=None):
+    """
+    Measures a step with the active tracker
+    """
+    return ACTIVE.measure(label, detail)
+
+
+def add_database(dbase):
+    """
+    Adds the objects of the database to the active tracker
+    """
+    ACTIVE.add_database(dbase)
+
+
+def install(tracker):
+    """
+    Makes the tracker the active tracker, returning the tracker
+    """
+    global ACTIVE
+    ACTIVE = tracker
+    return tracker
+
+
+def add_options(parser):
+    """
+    Adds the memory accounting options to either an optparse.OptionParser
+    or an argparse.ArgumentParser.
+    """
+    add = getattr(parser, "add_argument", None) or parser.add_option
+    add("--memory", action="store_true", dest="memory",
+        help="Report the memory used after each step")
+    add("--memory-top", type=int, dest="memory_top", default=TOP_SITES,
+        metavar="N", help="Number of allocation sites to report "
+        "(default %d)" % TOP_SITES)
+
+
+def from_options(options):
+    """
+    Installs and returns a MemoryTracker if memory accounting was
+    requested, otherwise returns the NullMemoryTracker.
+    """
+    if options.memory:
+        return install(MemoryTracker(options.memory_top))
+    return ACTIVE
@@ -0,0 +1,282 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Content addressed cache of generated files, shared between users and
+build jobs.
+
+Each export target is keyed by a hash of everything its output depends
+on: the exporter, the version of the code (the writer and the database
+and writer packages), the templates, the build settings that change the
+output, and the contents of the project and register set files it is
+built from. Before a writer is run, the cache
+is checked for the key, and if found, the cached file is copied (or hard
+linked) into place. Otherwise the writer is run, and its output is added
+to the cache.
+
+The cache is a directory, which may be on a shared (NFS) file system.
+Entries are written to a temporary file and renamed into place, so
+concurrent builds never see a partial entry. Each use of an entry updates
+its modification time, and prune() removes the entries that have not been
+used recently, or the least recently used entries when the cache is too
+large.
+
+The dates the writer inserted into a file are kept next to its entry
+(in a file with the DATES_SUFFIX), so that a hit which only differs from
+the existing file in these dates leaves the file untouched, as when the
+writer is run (see writer_base.same_lines).
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from regenerate.db.fingerprint import file_digest
+from regenerate.writers.writer_base import same_file_contents
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Directories (relative to the package) whose files affect the output of
+# every writer
+CODE_DIRS = ("db", "writers", os.path.join("writers", "templates"))
+
+# Suffix of the file holding the dates inserted into an entry
+DATES_SUFFIX = ".dates"
+
+STATS = {"hits": 0, "misses": 0}
+
+_CODE_VERSION = {}
+
+
+def source_file(module):
+    """
+    Returns the source file of the module, or None
+    """
+    filename = getattr(module, "__file__", None)
+    if filename and filename.endswith((".pyc", ".pyo")):
+        filename = filename[:-1]
+    return filename
+
+
+def code_version(writer_class):
+    """
+    Returns a hash of the code used to generate the output of the writer:
+    the modules defining the writer and its base classes, and the files
+    of the database and writer packages, including the templates
+    """
+    version = _CODE_VERSION.get(writer_class)
+    if version is not None:
+        return version
+
+    from regenerate import PROGRAM_VERSION
+
+    files = set()
+    for cls in inspect.getmro(writer_class):
+        filename = source_file(sys.modules.get(cls.__module__))
+        if filename:
+            files.add(os.path.abspath(filename))
+    for dirname in CODE_DIRS:
+        path = os.path.join(PACKAGE_DIR, dirname)
+        for name in os.listdir(path):
+            filename = os.path.join(path, name)
+            if os.path.isfile(filename) and not name.endswith((".pyc",
+                                                               ".pyo")):
+                files.add(filename)
+
+    sha = hashlib.sha1(PROGRAM_VERSION)
+    for filename in sorted(files):
+        sha.update("%s\0%s\0" % (os.path.basename(filename),
+                                 file_digest(filename)))
+    version = sha.hexdigest()
+    _CODE_VERSION[writer_class] = version
+    return version
+
+
+class OutputCache(object):
+    """
+    Cache of generated files in a directory. If link is True, hits are
+    hard linked into place when possible, instead of copied. The linked
+    files must not be edited in place, since this would change the cached
+    entry. The settings are the build settings that change the output of
+    the writers, which are included in every key.
+    """
+
+    def __init__(self, path, link=False, settings=()):
+        self.path = path
+        self.link = link
+        self.settings = repr(tuple(settings))
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def key(self, exp_id, writer_class, dest_name, sources):
+        """
+        Returns the key for the output of the writer. The dest_name is
+        the destination as named in the project, and sources are the
+        files the output is built from.
+        """
+        sha = hashlib.sha1()
+        sha.update("%s\0%s\0%s\0%s\0" % (exp_id, code_version(writer_class),
+                                         dest_name, self.settings))
+        for filename in sorted(sources):
+            sha.update("%s\0" % file_digest(filename))
+        return sha.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def fetch(self, key, dest):
+        """
+        Puts the cached file for the key at dest, if it is in the cache.
+        Returns None if it is not, otherwise True if dest was replaced, or
+        False if dest already had the same contents.
+        """
+        entry = self.entry(key)
+        try:
+            os.utime(entry, None)
+        except OSError:
+            STATS["misses"] += 1
+            return None
+        STATS["hits"] += 1
+
+        if same_file_contents(dest, entry, self.dates(key)):
+            return False
+
+        dirname = os.path.dirname(os.path.abspath(dest))
+        (handle, tmpname) = tempfile.mkstemp(dir=dirname, prefix=".regen")
+        os.close(handle)
+        try:
+            linked = False
+            if self.link:
+                os.remove(tmpname)
+                try:
+                    os.link(entry, tmpname)
+                    linked = True
+                except OSError:
+                    pass
+            if not linked:
+                shutil.copyfile(entry, tmpname)
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(tmpname, 0o666 & ~umask)
+            if os.name == 'nt' and os.path.exists(dest):
+                os.remove(dest)
+            os.rename(tmpname, dest)
+        except (IOError, OSError):
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+        return True
+
+    def dates(self, key):
+        """
+        Returns the dates the writer inserted into the entry for the key
+        """
+        try:
+            with open(self.entry(key) + DATES_SUFFIX) as ifile:
+                return frozenset(json.load(ifile))
+        except (IOError, ValueError):
+            return frozenset()
+
+    def store(self, key, filename, dates=()):
+        """
+        Adds the file to the cache as the entry for the key, along with
+        the dates the writer inserted into it
+        """
+        entry = self.entry(key)
+        dirname = os.path.dirname(entry)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                if not os.path.isdir(dirname):
+                    raise
+        if dates:
+            self.__install(entry + DATES_SUFFIX, json.dumps(sorted(dates)))
+        self.__install(entry, None, filename)
+
+    def __install(self, path, data, filename=None):
+        """
+        Writes the data (or a copy of the file) to a temporary file, then
+        renames it to the path
+        """
+        (handle, tmpname) = tempfile.mkstemp(dir=os.path.dirname(path),
+                                             prefix=".tmp")
+        os.close(handle)
+        try:
+            if filename is None:
+                with open(tmpname, "w") as ofile:
+                    ofile.write(data)
+            else:
+                shutil.copyfile(filename, tmpname)
+            os.chmod(tmpname, 0o644)
+            os.rename(tmpname, path)
+        except (IOError, OSError):
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+
+    def entries(self):
+        """
+        Returns a list of (last use time, size, path) for the entries
+        """
+        found = []
+        for subdir in os.listdir(self.path):
+            dirname = os.path.join(self.path, subdir)
+            if len(subdir) != 2 or not os.path.isdir(dirname):
+                continue
+            for name in os.listdir(dirname):
+                if name.startswith(".tmp") or name.endswith(DATES_SUFFIX):
+                    continue
+                path = os.path.join(dirname, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, path))
+        return found
+
+    def prune(self, max_size=None, max_age=None):
+        """
+        Removes the entries not used in the last max_age seconds, then the
+        least recently used entries until the cache is no larger than
+        max_size bytes. Returns the number of entries removed.
+        """
+        entries = sorted(self.entries())
+        removed = 0
+        total = sum(entry[1] for entry in entries)
+        oldest = time.time() - max_age if max_age is not None else None
+
+        for (used, size, path) in entries:
+            expired = oldest is not None and used < oldest
+            too_big = max_size is not None and total > max_size
+            if not (expired or too_big):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            if os.path.exists(path + DATES_SUFFIX):
+                os.remove(path + DATES_SUFFIX)
+            removed += 1
+            total -= size
+        return removed
@@ -0,0 +1,278 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Per-phase profiling for the command line tools.
+
+Code marks the phases of its work with the phase() context manager:
+
+    with profiler.phase("parse", filename):
+        dbase.read_xml(filename)
+
+If profiling has not been enabled, phase() returns a shared object whose
+__enter__ and __exit__ do nothing, so the instrumentation can be left in
+place. When enabled (with the --profile family of options added by
+add_options), the wall time, CPU time, and peak memory of each phase are
+recorded. At the end of the run, a summary table is printed, and
+optionally a cProfile dump and a Chrome trace event file (viewable in
+chrome://tracing or Perfetto) are written.
+"""
+
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def cpu_time():
+    """
+    Returns the user and system CPU time used by the process
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+
+def peak_memory():
+    """
+    Returns the peak resident set size of the process in kilobytes, or 0
+    if it cannot be determined on this platform.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak
+
+
+class PhaseInfo(object):
+    """
+    Timing information for a single execution of a phase
+    """
+
+    __slots__ = ("name", "detail", "category", "depth", "start", "wall",
+                 "cpu", "memory")
+
+    def __init__(self, name, detail, category, depth, start):
+        self.name = name
+        self.detail = detail
+        self.category = category
+        self.depth = depth
+        self.start = start
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.memory = 0
+
+
+class _Phase(object):
+    """
+    Context manager that records a phase in the profiler
+    """
+
+    def __init__(self, profiler, name, detail, category):
+        self.__profiler = profiler
+        self.__info = PhaseInfo(name, detail, category, 0, 0.0)
+        self.__cpu = 0.0
+
+    def __enter__(self):
+        info = self.__info
+        info.depth = self.__profiler.depth
+        self.__profiler.depth += 1
+        self.__cpu = cpu_time()
+        info.start = time.time()
+        return info
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        info = self.__info
+        info.wall = time.time() - info.start
+        info.cpu = cpu_time() - self.__cpu
+        info.memory = peak_memory()
+        self.__profiler.depth -= 1
+        self.__profiler.phases.append(info)
+        return False
+
+
+class _NullPhase(object):
+    """
+    Context manager that does nothing, used when profiling is disabled
+    """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_PHASE = _NullPhase()
+
+
+class NullProfiler(object):
+    """
+    Profiler used when profiling is disabled. Nothing is recorded.
+    """
+
+    enabled = False
+
+    def phase(self, name, detail=None, category="phase"):
+        return NULL_PHASE
+
+    def finish(self, ofile=None):
+        pass
+
+
+class Profiler(object):
+    """
+    Records the phases of a run, and reports the results. The cProfile
+    dump and the trace file are only written if their filenames are given.
+    """
+
+    enabled = True
+
+    def __init__(self, stats_file=None, trace_file=None):
+        self.phases = []
+        self.depth = 0
+        self.epoch = time.time()
+        self.stats_file = stats_file
+        self.trace_file = trace_file
+        self.__cprofile = None
+        if stats_file:
+            import cProfile
+            self.__cprofile = cProfile.Profile()
+            self.__cprofile.enable()
+
+    def phase(self, name, detail=None, category="phase"):
+        return _Phase(self, name, detail, category)
+
+    def finish(self, ofile=None):
+        """
+        Stops the profiler, writes the summary to the file (stderr by
+        default), and writes the cProfile and trace files if requested.
+        """
+        if self.__cprofile:
+            self.__cprofile.disable()
+            self.__cprofile.dump_stats(self.stats_file)
+        if self.trace_file:
+            self.write_trace(self.trace_file)
+        self.write_summary(ofile or sys.stderr)
+
+    def totals(self):
+        """
+        Combines the phases by category and name, returning a list of
+        (category, name, count, wall, cpu, peak memory) tuples in the order
+        in which each phase was first completed.
+        """
+        order = []
+        data = {}
+        for info in self.phases:
+            key = (info.category, info.name)
+            if key not in data:
+                order.append(key)
+                data[key] = [0, 0.0, 0.0, 0]
+            total = data[key]
+            total[0] += 1
+            total[1] += info.wall
+            total[2] += info.cpu
+            total[3] = max(total[3], info.memory)
+        return [key + tuple(data[key]) for key in order]
+
+    def write_summary(self, ofile):
+        elapsed = time.time() - self.epoch
+        ofile.write("\n%-10s %-30s %6s %10s %10s %10s\n" %
+                    ("Category", "Phase", "Count", "Wall (s)", "CPU (s)",
+                     "Peak (KB)"))
+        ofile.write("%s %s %s %s %s %s\n" % ("-" * 10, "-" * 30, "-" * 6,
+                                             "-" * 10, "-" * 10, "-" * 10))
+        for (category, name, count, wall, cpu, memory) in self.totals():
+            ofile.write("%-10s %-30s %6d %10.3f %10.3f %10d\n" %
+                        (category, name[:30], count, wall, cpu, memory))
+        ofile.write("%-10s %-30s %6s %10.3f %10.3f %10d\n" %
+                    ("total", "", "", elapsed, cpu_time(), peak_memory()))
+
+    def write_trace(self, filename):
+        """
+        Writes the phases in the Chrome trace event format
+        """
+        pid = os.getpid()
+        events = []
+        for info in self.phases:
+            args = {"cpu_ms": round(info.cpu * 1000.0, 3),
+                    "peak_kb": info.memory}
+            if info.detail:
+                args["detail"] = info.detail
+            events.append({
+                "name": info.name,
+                "cat": info.category,
+                "ph": "X",
+                "ts": int((info.start - self.epoch) * 1e6),
+                "dur": int(info.wall * 1e6),
+                "pid": pid,
+                "tid": 0,
+                "args": args,
+            })
+        events.sort(key=lambda event: (event["ts"], -event["dur"]))
+        with open(filename, "w") as ofile:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"},
+                      ofile, indent=1)
+
+
+ACTIVE = NullProfiler()
+
+
+def phase(name, detail=None, category="phase"):
+    """
+    Marks a phase of the active profiler
+    """
+    return ACTIVE.phase(name, detail, category)
+
+
+def install(profiler):
+    """
+    Makes the profiler the active profiler, returning the profiler
+    """
+    global ACTIVE
+    ACTIVE = profiler
+    return profiler
+
+
+def add_options(parser):
+    """
+    Adds the profiling options to either an optparse.OptionParser or an
+    argparse.ArgumentParser.
+    """
+    add = getattr(parser, "add_argument", None) or parser.add_option
+    add("--profile", action="store_true", dest="profile",
+        help="Report the time and memory used by each phase")
+    add("--profile-stats", dest="profile_stats", metavar="FILE",
+        help="Write cProfile statistics to FILE (implies --profile)")
+    add("--profile-trace", dest="profile_trace", metavar="FILE",
+        help="Write a Chrome trace event file to FILE (implies --profile)")
+
+
+def from_options(options):
+    """
+    Installs and returns a Profiler if any profiling option was given,
+    otherwise returns the NullProfiler.
+    """
+    if options.profile or options.profile_stats or options.profile_trace:
+        return install(Profiler(options.profile_stats, options.profile_trace))
+    return ACTIVE
@@ -0,0 +1,123 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Cross reference engine. Converts mentions of register names in the
+documentation text (such as "Control Register") into RestructuredText
+links ("`Control`_ Register").
+
+All register names are folded into a single regular expression built from
+a prefix tree of the names, so each block of text is scanned exactly once,
+no matter how many registers exist. At any position, the longest register
+name that is followed by the word "Register" wins, which matches the
+behavior of applying the names one at a time, longest first.
+"""
+
+import re
+
+XREF_SUB = r'\1`\2`_ \3'
+
+
+def _build_trie(names):
+    """
+    Builds a prefix tree (nested dictionaries) from the list of names. The
+    empty string key marks the end of a name.
+    """
+    trie = {}
+    for name in names:
+        node = trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return trie
+
+
+def _trie_pattern(node):
+    """
+    Converts the prefix tree into a regular expression. Optional suffixes
+    are greedy, so longer names are tried before shorter names that share
+    the same prefix.
+    """
+    alternates = [re.escape(char) + _trie_pattern(node[char])
+                  for char in sorted(node) if char]
+
+    if not alternates:
+        return ""
+
+    if len(alternates) == 1:
+        body = alternates[0]
+    else:
+        body = "(?:%s)" % "|".join(alternates)
+
+    if '' in node:
+        body = "(?:%s)?" % body
+    return body
+
+
+class XrefMatcher(object):
+    """
+    Links all register names found in a block of text in a single pass.
+    """
+
+    def __init__(self, names):
+        names = set(name for name in names if name)
+        if names:
+            pattern = r'([^`])(%s) ((R|r)egister)' % _trie_pattern(
+                _build_trie(names))
+            self._regex = re.compile(pattern)
+        else:
+            self._regex = None
+
+    def link(self, text):
+        """
+        Returns a tuple of the converted text, and the number of links
+        that were created.
+        """
+        if self._regex is None or not text:
+            return (text, 0)
+        return self._regex.subn(XREF_SUB, text)
+
+
+def register_matcher(dbase):
+    """
+    Builds the XrefMatcher from the register names in the database
+    """
+    return XrefMatcher(reg.register_name for reg in dbase.get_all_registers())
+
+
+def crossreference(dbase, matcher=None):
+    """
+    Adds cross references to the overview text, the register descriptions
+    and the field descriptions of the database. Returns a tuple of the
+    number of overview, register, and field references that were added.
+    """
+    if matcher is None:
+        matcher = register_matcher(dbase)
+
+    (dbase.overview_text, count) = matcher.link(dbase.overview_text)
+
+    rcount = 0
+    fcount = 0
+    for reg in dbase.get_all_registers():
+        (reg.description, total) = matcher.link(reg.description)
+        rcount += total
+        for field in reg.get_bit_fields():
+            (field.description, total) = matcher.link(field.description)
+            fcount += total
+
+    return (count, rcount, fcount)
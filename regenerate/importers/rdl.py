@@ -17,12 +17,574 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
-Imports data from a Denali RDL file
+Imports data from a SystemRDL file
+
+The file is broken into tokens by a single precompiled regular expression,
+and the tokens are consumed by a recursive descent parser. Since the parser
+does not depend on the layout of the lines, constructs may span multiple
+lines (or share a line), and addrmap/regfile blocks may be nested.
+
+The file is read a block at a time, and each block is split into tokens
+in a single call, which are then streamed to the parser. Only the current
+block and the register definitions are held in memory, not the complete
+token list. Tokens are plain strings; the type of a token is determined
+by its first character.
+
+The supported subset of SystemRDL is:
+
+  - default property assignments (only regwidth is used)
+  - addrmap and regfile blocks, which may be nested, with an optional
+    '@ address' that is added to the address of the registers they contain
+  - reg blocks, either anonymous or named definitions that are
+    instantiated later by name, with optional array dimensions
+  - field blocks with property assignments (sw, desc, reset, woclr,
+    woset, rclr, singlepulse), bit ranges ([msb:lsb] or [width]) and an
+    optional reset value
+
+Any other property is parsed and ignored, as are enum, signal, mem,
+constraint, property and struct definitions.
+
+As in the original importer, numbers without a prefix are read as
+hexadecimal in '@' addresses and reset values, and as decimal everywhere
+else.
 """
 
 from regenerate.db import Register, BitField
+from itertools import chain
+from functools import partial
+import string
 import re
 
+BLOCK_SIZE = 1 << 16
+
+# Whitespace and comments are skipped before and after each token. Any
+# other character that does not start a valid token is returned as a
+# single character token, which the parser reports as an error.
+SKIP = r"(?:\s+|//[^\n]*|/\*.*?\*/)*"
+SKIP_RE = re.compile(SKIP, re.DOTALL)
+TOKEN_RE = re.compile(SKIP + r"""
+    ([A-Za-z_][A-Za-z0-9_]*
+    | \+= | %= | [{}\[\]:;=@,]
+    | \d*'[hHbBdDoO][0-9a-fA-F_]+ | 0[xX][0-9a-fA-F_]+ | \d[0-9a-fA-F_]*
+    | "(?:[^"\\]|\\.)*"
+    | \S)
+""" + SKIP, re.VERBOSE | re.DOTALL)
+
+# Single character tokens left by a string or comment that is not
+# terminated in the current block
+UNTERMINATED = ('"', '/')
+
+IDENT_START = frozenset(string.ascii_letters + "_")
+NUMBER_START = frozenset(string.digits + "'")
+
+BLOCK_KEYWORDS = ("addrmap", "regfile")
+
+# Definitions that are not imported, and are skipped
+SKIPPED_KEYWORDS = frozenset(("enum", "signal", "mem", "constraint",
+                              "property", "struct"))
+
+VERILOG_NUMBER = re.compile(r"\d*'([hHbBdDoO])([0-9a-fA-F_]+)$")
+VERILOG_BASE = {'h': 16, 'b': 2, 'd': 10, 'o': 8}
+
+SW_ACCESS = {
+    'rw': BitField.TYPE_READ_WRITE,
+    'wr': BitField.TYPE_READ_WRITE,
+    'w': BitField.TYPE_WRITE_ONLY,
+    'r': BitField.TYPE_READ_ONLY,
+}
+
+
+class RDLParseError(IOError):
+    """
+    Raised when the RDL file cannot be parsed. Derived from IOError so that
+    it is reported in the same manner as a file that cannot be read.
+    """
+
+    def __init__(self, msg, line):
+        IOError.__init__(self, "line %d: %s" % (line, msg))
+        self.line = line
+
+
+class Tokenizer(object):
+    """
+    Breaks the file into tokens. The file is read in blocks, which are
+    split at the last newline, and the remainder is carried over to the
+    next block. If the split falls in the middle of a string or comment,
+    the next block is appended before trying again. The line number is
+    only calculated when needed to report an error.
+    """
+
+    def __init__(self, input_file):
+        self._file = input_file
+        self._chunk = ("", 0, 1, [], iter([]))
+
+    def __iter__(self):
+        return chain.from_iterable(self._chunks())
+
+    def _chunks(self):
+        """
+        Generator that returns an iterator over the tokens of each block
+        """
+        find_tokens = TOKEN_RE.findall
+        skip = SKIP_RE.match
+        data = ""
+        lines = 1
+        at_eof = False
+
+        while not at_eof:
+            block = self._file.read(BLOCK_SIZE)
+            if block:
+                data += block
+                cut = data.rfind("\n") + 1
+                if cut == 0:
+                    continue
+            else:
+                at_eof = True
+                cut = len(data)
+
+            if skip(data, 0, cut).end() == cut:
+                tokens = []
+            else:
+                tokens = find_tokens(data, 0, cut)
+                if not at_eof and (UNTERMINATED[0] in tokens or
+                                   UNTERMINATED[1] in tokens):
+                    continue
+
+            token_iter = iter(tokens)
+            self._chunk = (data, cut, lines, tokens, token_iter)
+            yield token_iter
+            lines += data.count("\n", 0, cut)
+            data = data[cut:]
+
+    def line(self):
+        """
+        Returns the line number of the last token returned
+        """
+        (data, cut, lines, tokens, token_iter) = self._chunk
+        index = len(tokens) - token_iter.__length_hint__()
+        pos = 0
+        for (count, match) in enumerate(TOKEN_RE.finditer(data, 0, cut)):
+            if count >= index:
+                break
+            pos = match.start(1)
+        return lines + data.count("\n", 0, pos)
+
+
+def is_ident(token):
+    return token is not None and token[0] in IDENT_START
+
+
+def is_number(token):
+    return token is not None and token[0] in NUMBER_START
+
+
+def is_string(token):
+    return (token is not None and len(token) > 1 and token[0] == '"' and
+            token[-1] == '"')
+
+
+def parse_number(value, base=10):
+    """
+    Converts a SystemRDL number (C style hex, verilog style sized value, or
+    a number without a prefix, which is in the specified base) into an
+    integer.
+    """
+    value = value.replace('_', '')
+    if "'" in value:
+        match = VERILOG_NUMBER.match(value)
+        if not match:
+            raise ValueError("invalid number %s" % value)
+        (vbase, digits) = match.groups()
+        return int(digits, VERILOG_BASE[vbase.lower()])
+    if value[:2] in ("0x", "0X"):
+        return int(value, 16)
+    return int(value, base)
+
+
+def strip_quotes(text):
+    """
+    Removes the surrounding quotes from a string token, and collapses the
+    whitespace of strings that span multiple lines.
+    """
+    if text[:1] == '"' and text[-1:] == '"':
+        text = text[1:-1]
+    return " ".join(text.replace('\\"', '"').split())
+
+
+class FieldDef(object):
+    """
+    Temporary storage for the properties of a field definition
+    """
+
+    def __init__(self):
+        self.description = ""
+        self.software_access = "rw"
+        self.reset = 0
+        self.flags = set()
+
+
+class RegDef(object):
+    """
+    Temporary storage for the properties and fields of a register
+    definition. Fields are stored as (FieldDef, name, msb, lsb, reset)
+    tuples.
+    """
+
+    def __init__(self, width):
+        self.description = ""
+        self.name = ""
+        self.width = width
+        self.fields = []
+
+
+class RDLParser(object):
+    """
+    Parses the RDL file and loads the database with the data extracted.
+    """
+
+    def __init__(self, dbase):
+        self.dbase = dbase
+        self._tokenizer = None
+        self._next_token = None
+        self._token = None
+        self._default_width = 32
+        self._reg_types = {}
+
+    def import_data(self, filename):
+        """
+        Opens, parses, and extracts data from the input file.
+        """
+        self.dbase.data_bus_width = self._default_width
+        with open(filename) as input_file:
+            self._tokenizer = Tokenizer(input_file)
+            # returns None at the end of the file
+            self._next_token = partial(next, iter(self._tokenizer), None)
+            self._next()
+            while self._token is not None:
+                self._statement(0)
+
+    def _next(self):
+        """
+        Advances to the next token. At the end of the file, the token
+        is None.
+        """
+        self._token = self._next_token()
+
+    def _error(self, msg):
+        raise RDLParseError(msg, self._tokenizer.line())
+
+    def _found(self):
+        if self._token is None:
+            return "end of file"
+        return "'%s'" % self._token
+
+    def _accept(self, value):
+        """
+        Consumes the current token if it matches the value
+        """
+        if self._token == value:
+            self._token = self._next_token()
+            return True
+        return False
+
+    def _expect(self, value):
+        if self._token != value:
+            self._error("expected '%s', found %s" % (value, self._found()))
+        self._next()
+
+    def _name(self):
+        token = self._token
+        if not is_ident(token):
+            self._error("expected a name, found %s" % self._found())
+        self._next()
+        return token
+
+    def _number(self, base=10):
+        """
+        Consumes a number. In base 16, a number without a prefix may start
+        with a letter, so it is tokenized as a name.
+        """
+        token = self._token
+        if not (is_number(token) or (base == 16 and is_ident(token))):
+            self._error("expected a number, found %s" % self._found())
+        self._next()
+        return self._to_number(token, base)
+
+    def _to_number(self, value, base=10):
+        try:
+            return parse_number(value, base)
+        except (ValueError, AttributeError):
+            self._error("invalid number '%s'" % value)
+
+    def _skip_definition(self):
+        """
+        Skips a construct that is not imported, up to the ';' that follows
+        its closing brace
+        """
+        depth = 0
+        while True:
+            token = self._token
+            if token is None:
+                self._error("unexpected end of file")
+            self._next()
+            if token == "{":
+                depth += 1
+            elif token == "}":
+                depth -= 1
+            elif token == ";" and depth == 0:
+                return
+
+    def _statement(self, base):
+        """
+        statement := 'default' assignment
+                   | ('addrmap' | 'regfile') block
+                   | 'reg' reg
+                   | reg_type_name instances
+                   | assignment
+                   | ';'
+        """
+        token = self._token
+
+        if not is_ident(token):
+            if self._accept(";"):
+                return
+            self._error("unexpected %s" % self._found())
+
+        if token == "default":
+            self._next()
+            (name, prop) = self._assignment()
+            if name == "regwidth":
+                self._default_width = self._to_number(prop)
+                self.dbase.data_bus_width = self._default_width
+        elif token in BLOCK_KEYWORDS:
+            self._next()
+            self._block(base)
+        elif token == "reg":
+            self._next()
+            self._reg(base)
+        elif token in self._reg_types:
+            self._next()
+            self._reg_instances(self._reg_types[token], base)
+        elif token in SKIPPED_KEYWORDS:
+            self._skip_definition()
+        else:
+            self._assignment()
+
+    def _block(self, base):
+        """
+        block := [name] '{' statement* '}' [name ['@' number]] ';'
+
+        The address of the block follows the closing brace, so the
+        registers in the block are collected, then added to the database
+        with the block's address once it is known.
+        """
+        if is_ident(self._token):
+            self._next()
+        self._expect("{")
+
+        saved = self.dbase
+        collector = RegisterCollector(saved.data_bus_width)
+        self.dbase = collector
+        try:
+            while not self._accept("}"):
+                if self._token is None:
+                    self._error("unexpected end of file")
+                self._statement(0)
+        finally:
+            self.dbase = saved
+            self.dbase.data_bus_width = collector.data_bus_width
+
+        offset = 0
+        if is_ident(self._token):
+            self._next()
+            if self._accept("@"):
+                offset = self._number(16)
+        self._expect(";")
+
+        for reg in collector.registers:
+            reg.address += base + offset
+            self.dbase.add_register(reg)
+
+    def _reg(self, base):
+        """
+        reg := [name] '{' (field | assignment | ';')* '}' (instances | ';')
+        """
+        name = None
+        if is_ident(self._token):
+            name = self._name()
+
+        reg = RegDef(self._default_width)
+        self._expect("{")
+        lsb = 0
+        while not self._accept("}"):
+            if self._token is None:
+                self._error("unexpected end of file")
+            elif self._accept("field"):
+                lsb = self._field(reg, lsb)
+            elif self._token in SKIPPED_KEYWORDS:
+                self._skip_definition()
+            elif not self._accept(";"):
+                (prop, value) = self._assignment()
+                if prop == "regwidth":
+                    reg.width = self._to_number(value)
+                elif prop == "desc":
+                    reg.description = strip_quotes(value)
+                elif prop == "name":
+                    reg.name = strip_quotes(value)
+
+        if name is not None:
+            self._reg_types[name] = reg
+            if self._accept(";"):
+                return
+        self._reg_instances(reg, base)
+
+    def _reg_instances(self, reg, base):
+        """
+        instances := instance (',' instance)* ';'
+        instance  := name ['[' number ']'] ['@' number] ['+=' number]
+
+        Arrays are always packed, so the '+=' stride is accepted but ignored.
+        """
+        address = 0
+        while True:
+            token = self._name()
+            dimension = 1
+            if self._accept("["):
+                dimension = self._number()
+                self._expect("]")
+            if self._accept("@"):
+                address = self._number(16)
+            if self._accept("+="):
+                self._number()
+            self._add_register(reg, token, address + base, dimension)
+            address += dimension * (reg.width / 8)
+            if not self._accept(","):
+                break
+        self._expect(";")
+
+    def _field(self, reg, lsb):
+        """
+        field := [name] '{' (assignment | ';')* '}' field_instance
+                 (',' field_instance)* ';'
+        field_instance := name [range] ['=' number]
+        range := '[' number [':' number] ']'
+
+        Returns the bit position following the field, which is used as the
+        position of the next field if it does not specify a range.
+        """
+        if is_ident(self._token):
+            self._next()
+
+        info = FieldDef()
+        self._expect("{")
+        while not self._accept("}"):
+            if self._token is None:
+                self._error("unexpected end of file")
+            if self._accept(";"):
+                continue
+            (prop, value) = self._assignment()
+            if prop == "sw":
+                info.software_access = strip_quotes(value).lower()
+            elif prop == "desc":
+                info.description = strip_quotes(value)
+            elif prop == "reset":
+                info.reset = self._to_number(value, 16)
+            elif value is None or value == "true":
+                info.flags.add(prop)
+
+        while True:
+            name = self._name()
+            msb = lsb
+            if self._accept("["):
+                first = self._number()
+                if self._accept(":"):
+                    msb = first
+                    lsb = self._number()
+                else:
+                    msb = lsb + first - 1
+                self._expect("]")
+            reset = info.reset
+            if self._accept("="):
+                reset = self._number(16)
+            (msb, lsb) = (max(msb, lsb), min(msb, lsb))
+            reg.fields.append((info, name, msb, lsb, reset))
+            lsb = msb + 1
+            if not self._accept(","):
+                break
+        self._expect(";")
+        return lsb
+
+    def _assignment(self):
+        """
+        assignment := name ['=' value] ';'
+
+        Returns the property name and the text of the value, or None if
+        the property was specified without a value.
+        """
+        name = self._name()
+        value = None
+        if self._token == "=":
+            value = self._next_token()
+            if not (is_ident(value) or is_number(value) or is_string(value)):
+                self._error("invalid value for '%s'" % name)
+            self._next()
+        self._expect(";")
+        return (name, value)
+
+    def _add_register(self, info, token, address, dimension):
+        """
+        Converts the register definition into a register and its bit fields,
+        and adds it to the database
+        """
+        register = Register()
+        register.address = address
+        register.register_name = info.name or token
+        register.token = token
+        register.width = info.width
+        register.description = info.description
+        register.dimension = dimension
+        self.dbase.add_register(register)
+
+        for (item, name, msb, lsb, reset) in info.fields:
+            field = BitField()
+            field.field_name = name
+            field.field_type = field_type(item)
+            field.start_position = lsb
+            field.stop_position = msb
+            field.reset_value = reset
+            field.description = item.description
+            register.add_bit_field(field)
+
+
+def field_type(info):
+    """
+    Determines the field type from the software access and the flags
+    """
+    if "woclr" in info.flags:
+        return BitField.TYPE_WRITE_1_TO_CLEAR_SET
+    if "woset" in info.flags:
+        return BitField.TYPE_WRITE_1_TO_SET
+    if "rclr" in info.flags:
+        return BitField.TYPE_READ_ONLY_CLEAR_LOAD
+    ftype = SW_ACCESS.get(info.software_access, BitField.TYPE_READ_ONLY)
+    if ftype == BitField.TYPE_READ_WRITE and "singlepulse" in info.flags:
+        return BitField.TYPE_READ_WRITE_1S
+    return ftype
+
+
+class RegisterCollector(object):
+    """
+    Stands in for the database while a nested block is parsed, holding
+    the registers until the address of the block is known.
+    """
+
+    def __init__(self, width):
+        self.registers = []
+        self.data_bus_width = width
+
+    def add_register(self, register):
+        self.registers.append(register)
+
 
 class FieldInfo:
     """
@@ -74,9 +636,11 @@ class FieldInfo:
             method(text)
 
 
-class RDLParser:
+class LineRDLParser:
     """
-    Parses the RDL file and loads the database with the data extracted.
+    Original line oriented RDL parser. Each line is matched against a
+    series of regular expressions, so each construct must fit on a single
+    line. Kept for comparison with RDLParser.
     """
 
     def __init__(self, dbase):
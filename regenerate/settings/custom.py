@@ -17,29 +17,9 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
-import ConfigParser
-import os
+"""
+Provides access to the user's custom settings, which are stored in the
+same file as the .ini settings, using the same cached parser.
+"""
 
-PARSER = ConfigParser.ConfigParser()
-FILENAME = os.path.expanduser("~/.regenerate")
-
-
-def get(section, option, default=None):
-    try:
-        PARSER.read(FILENAME)
-        val = PARSER.get(section, option)
-        return val
-    except (ConfigParser.NoSectionError, ConfigParser.NoOptionError, IOError):
-        return default
-
-
-def set(section, option, value):
-    if not PARSER.has_section(section):
-        PARSER.add_section(section)
-    PARSER.set(section, option, value)
-    try:
-        ofile = open(FILENAME, "w")
-        PARSER.write(ofile)
-        ofile.close()
-    except IOError:
-        return
+from regenerate.settings.ini import get, set, flush
@@ -19,31 +19,125 @@
 """
 Provides the interface to the users .ini file. This is a standard ConfigParser
 module that is used to remember paths for exporters.
+
+The file is parsed once, and only parsed again if its modification time
+changes. Values that are set are held in memory, and written to the file
+by flush(), which is called automatically when the program exits.
 """
 
 import ConfigParser
+import atexit
 import os
+from contextlib import contextmanager
 
-PARSER = ConfigParser.ConfigParser()
 FILENAME = os.path.expanduser("~/.regenerate")
 
 
+class SettingsFile(object):
+    """
+    Cached view of a ConfigParser file. If filename is None, the settings
+    are kept in memory only.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.parser = ConfigParser.ConfigParser()
+        self.reads = 0
+        self.writes = 0
+        self.__mtime = None
+        self.__pending = {}
+
+    def __modified_time(self):
+        try:
+            return os.path.getmtime(self.filename)
+        except (OSError, TypeError):
+            return None
+
+    def __revalidate(self):
+        """
+        Reloads the file if it has changed since it was last read. Values
+        that have been set, but not yet written, are applied on top of the
+        values from the file.
+        """
+        mtime = self.__modified_time()
+        if mtime == self.__mtime:
+            return
+        self.parser = ConfigParser.ConfigParser()
+        try:
+            self.parser.read(self.filename)
+        except ConfigParser.Error:
+            pass
+        self.reads += 1
+        self.__mtime = mtime
+        for ((section, option), value) in self.__pending.iteritems():
+            self.__apply(section, option, value)
+
+    def __apply(self, section, option, value):
+        if not self.parser.has_section(section):
+            self.parser.add_section(section)
+        self.parser.set(section, option, value)
+
+    def get(self, section, option, default=None):
+        self.__revalidate()
+        try:
+            return self.parser.get(section, option, raw=True)
+        except (ConfigParser.NoSectionError, ConfigParser.NoOptionError):
+            return default
+
+    def set(self, section, option, value):
+        self.__revalidate()
+        self.__pending[(section, option)] = value
+        self.__apply(section, option, value)
+
+    def flush(self):
+        """
+        Writes the file if any values have been set since the last write.
+        """
+        if not self.__pending or self.filename is None:
+            return
+        self.__revalidate()
+        try:
+            with open(self.filename, "w") as ofile:
+                self.parser.write(ofile)
+        except IOError:
+            return
+        self.writes += 1
+        self.__pending = {}
+        self.__mtime = self.__modified_time()
+
+
+SETTINGS = SettingsFile(FILENAME)
+
+
 def get(section, option, default=None):
-    try:
-        PARSER.read(FILENAME)
-        val = PARSER.get(section, option, default)
-        return val
-    except (ConfigParser.NoSectionError, ConfigParser.NoOptionError, IOError):
-        return default
+    return SETTINGS.get(section, option, default)
 
 
 def set(section, option, value):
-    if not PARSER.has_section(section):
-        PARSER.add_section(section)
-    PARSER.set(section, option, value)
+    SETTINGS.set(section, option, value)
+
+
+def flush():
+    SETTINGS.flush()
+
+
+@contextmanager
+def override(filename=None):
+    """
+    Temporarily replaces the user's settings with the specified file (or
+    with empty, in memory settings if no file is given), for use by tests.
+    Yields the SettingsFile in use. Values set within the context are not
+    written to the user's file.
+    """
+    global SETTINGS
+
+    saved = SETTINGS
+    SETTINGS = SettingsFile(filename)
     try:
-        ofile = open(FILENAME, "w")
-        PARSER.write(ofile)
-        ofile.close()
-    except IOError:
-        return
+        yield SETTINGS
+        SETTINGS.flush()
+    finally:
+        SETTINGS = saved
+
+
+atexit.register(flush)
@@ -29,10 +29,14 @@ from regenerate.ui.columns import EditableColumn, ToggleColumn
 from regenerate.ui.error_dialogs import ErrorMsg
 from regenerate.ui.export_assistant import ExportAssistant
 from regenerate.writers import EXPORTERS, PRJ_EXPORTERS, GRP_EXPORTERS
-
-(MDL_MOD, MDL_BASE, MDL_FMT, MDL_DEST, MDL_CLASS, MDL_DBASE, MDL_TYPE) = range(7)
-(OPTMAP_DESCRIPTION, OPTMAP_CLASS, OPTMAP_REGISTER_SET) = range(3)
-(MAPOPT_ID, MAPOPT_CLASS, MAPOPT_REGISTER_SET) = range(3)
+from regenerate.db.topology import clear_topology
+from regenerate.db.signals import clear_signals
+from regenerate.writers.db_view import clear_views
+
+(MDL_MOD, MDL_BASE, MDL_FMT, MDL_DEST, MDL_EXPORTER, MDL_DBASE,
+ MDL_TYPE) = range(7)
+(OPTMAP_DESCRIPTION, OPTMAP_EXPORTER, OPTMAP_REGISTER_SET) = range(3)
+(MAPOPT_ID, MAPOPT_EXPORTER, MAPOPT_REGISTER_SET) = range(3)
 (DB_MAP_DBASE, DB_MAP_MODIFIED) = range(2)
 
 (LEVEL_BLOCK, LEVEL_GROUP, LEVEL_PROJECT) = range(3)
@@ -65,20 +69,23 @@ class Build(BaseWindow):
         Builds the maps used to map options. The __optmap maps an internal
         Type Identifier to:
 
-        (Document Description, Exporter Class, Register/Group/Project)
+        (Document Description, Exporter, Register/Group/Project)
 
         The __mapopt maps the Document Description to:
 
-        (Type Identifier, Exporter Class, Register/Group/Project)
+        (Type Identifier, Exporter, Register/Group/Project)
 
+        The exporter's class is only imported when a target is built, so
+        a writer with a missing dependency does not prevent the window
+        from opening.
         """
         self.__optmap = {}
         self.__mapopt = {}
         for level, export_list in enumerate([EXPORTERS, GRP_EXPORTERS, PRJ_EXPORTERS]):
             for item in export_list:
                 value = "{0} ({1})".format(item.type[0], item.type[1])
-                self.__optmap[item.id] = (value, item.obj_class, level)
-                self.__mapopt[value] = (item.id, item.obj_class, level)
+                self.__optmap[item.id] = (value, item, level)
+                self.__mapopt[value] = (item.id, item, level)
 
     def __build_interface(self):
         """
@@ -120,8 +127,9 @@ class Build(BaseWindow):
         register_set = self.__prj.get_register_set()
         mod = file_needs_rebuilt(local_dest, self.__dbmap, register_set)
         self.__modlist.append(mod)
-        (fmt, cls, dbtype) = self.__optmap[option]
-        self.__model.append(row=[mod, "<project>", fmt, dest, cls, None, 2])
+        (fmt, exporter, dbtype) = self.__optmap[option]
+        self.__model.append(row=[mod, "<project>", fmt, dest, exporter, None,
+                                 2])
 
     def __add_dbase_item_to_list(self, dbase_rel_path, option, dest):
         """
@@ -136,9 +144,9 @@ class Build(BaseWindow):
 
         mod = file_needs_rebuilt(local_dest, self.__dbmap, [dbase_full_path])
         self.__modlist.append(mod)
-        (fmt, cls, rpttype) = self.__optmap[option]
+        (fmt, exporter, rpttype) = self.__optmap[option]
         dbase = self.__dbmap[base][DB_MAP_DBASE].db
-        self.__model.append(row=(mod, base, fmt, dest, cls, dbase, 0))
+        self.__model.append(row=(mod, base, fmt, dest, exporter, dbase, 0))
 
     def __add_group_item_to_list(self, group_name, option, dest):
         """
@@ -149,8 +157,9 @@ class Build(BaseWindow):
         #mod = file_needs_rebuilt(local_dest, self.__dbmap, [dbase_full_path])
         mod = True
         self.__modlist.append(mod)
-        (fmt, cls, rpttype) = self.__optmap[option]
-        self.__model.append(row=(mod, group_name, fmt, dest, cls, None, 1))
+        (fmt, exporter, rpttype) = self.__optmap[option]
+        self.__model.append(row=(mod, group_name, fmt, dest, exporter, None,
+                                 1))
 
     def __populate(self):
         """
@@ -203,7 +212,7 @@ class Build(BaseWindow):
         into the database.
         """
         combo_box_model = cell.get_property('model')
-        self.__model[path][MDL_CLASS] = combo_box_model[node][1]
+        self.__model[path][MDL_EXPORTER] = combo_box_model[node][1]
         self.__model[path][MDL_FMT] = combo_box_model[node][0]
 
     def __add_columns(self):
@@ -267,14 +276,19 @@ class Build(BaseWindow):
         """
         Called when the build button is pressed.
         """
+        # The project and databases may have been edited since the last build
+        clear_topology()
+        clear_views()
+        clear_signals()
         for item in [item for item in self.__model if item[MDL_MOD]]:
-            writer_class = item[MDL_CLASS]
+            exporter = item[MDL_EXPORTER]
             dbase = item[MDL_DBASE]
             rtype = item[MDL_TYPE]
             dest = os.path.abspath(
                 os.path.join(os.path.dirname(self.__prj.path), item[MDL_DEST]))
 
             try:
+                writer_class = exporter.obj_class
                 if rtype == 0:
                     gen = writer_class(self.__prj, dbase)
                 elif rtype == 1:
@@ -288,7 +302,7 @@ class Build(BaseWindow):
                     gen = writer_class(self.__prj, db_list)
                 gen.write(dest)
                 item[MDL_MOD] = False
-            except IOError as msg:
+            except (IOError, ImportError) as msg:
                 ErrorMsg("Error running exporter", str(msg))
 
     def on_add_build_clicked(self, obj):
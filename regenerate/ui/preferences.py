@@ -53,4 +53,5 @@ class Preferences(object):
         ini.set('user', 'column_width', obj.get_value_as_int())
 
     def on_close_button_clicked(self, obj):
+        ini.flush()
         self.__properties.destroy()
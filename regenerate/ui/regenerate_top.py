@@ -1490,6 +1490,7 @@ class MainWindow(BaseWindow):
                 self.__builder.get_object('vpaned').get_position())
         ini.set('user', 'hpos',
                 self.__builder.get_object('hpaned').get_position())
+        ini.flush()
         gtk.main_quit()
 
     def __save_and_quit(self):
@@ -17,48 +17,173 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
-Imports the exporters. Makes an attempt to load the site_local versions
+Lists the exporters. Makes an attempt to load the site_local versions
 first. This allows the end user to override the standard version without
 fears that it will get overwritten on the next install.
 
-Instead of directly importing the files with the import statement, we
-loop through a list of items in the MODULES array, looking at the module
-name, and the listed import times from that module. It makes it simpler
-to maintain.
+The description of each exporter (its type, menu description, file
+description, extension, and identifier) is listed statically in the
+MODULES array, along with the name of the module and class that implements
+it. The module is not imported until the obj_class attribute of the
+exporter is accessed, so programs only pay for importing the writers (and
+their dependencies, such as jinja2) that they actually use.
+
+Each writer module also lists its exporters in its own EXPORTERS list.
+check_exporters compares the two, and load_all reports any differences.
+
+The site_local modules, and the modules listed in the REGENERATE_WRITERS
+environment variable (separated by commas), are imported when this module
+is loaded, and the exporters in their EXPORTERS lists are added, replacing
+any standard exporter with the same identifier. This keeps the ability of
+a site to add its own exporters, without importing the standard writers.
 """
 
-from collections import namedtuple
 from writer_base import WriterBase
 from regenerate.db import LOGGER
+import imp
+import os
 import platform
+import time
+import sys
+
+IMPORT_PATHS = ("regenerate.site_local", "regenerate.writers")
+
+#
+# (module, [(type, class, (menu category, menu item), file description,
+#            extension, id), ...])
+#
+MODULES = [
+    ("verilog", [
+        (WriterBase.TYPE_BLOCK, "SystemVerilog", ("RTL", "SystemVerilog"),
+         "SystemVerilog files", ".sv", 'rtl-system-verilog'),
+        (WriterBase.TYPE_BLOCK, "Verilog2001", ("RTL", "Verilog 2001"),
+         "Verilog files", ".v", 'rtl-verilog-2001'),
+        (WriterBase.TYPE_BLOCK, "Verilog", ("RTL", "Verilog 95"),
+         "Verilog files", ".v", 'rtl-verilog-95')]),
+    ("verilog_defs", [
+        (WriterBase.TYPE_BLOCK, "VerilogDefines", ("RTL", "Verilog defines"),
+         "Verilog header files", ".vh", 'rtl-verilog-defines')]),
+    ("verilog_param", [
+        (WriterBase.TYPE_BLOCK, "VerilogParameters",
+         ("RTL", "Verilog parameters"), "Verilog header files", ".vh",
+         'rtl-verilog-parmaeters')]),
+    ("reg_pkg", [
+        (WriterBase.TYPE_PROJECT, "VerilogConstRegPackage",
+         ("Headers", "SystemVerilog Register Constants"),
+         "SystemVerilog files", ".sv", 'headers-system-verilog')]),
+    ("decoder", [
+        (WriterBase.TYPE_GROUP, "AddressDecode", ("RTL", "Address decoder"),
+         "SystemVerilog files", ".sv", 'grp-decode')]),
+    ("ipxact", [
+        (WriterBase.TYPE_BLOCK, "IpXactWriter", ("XML", "IP-XACT"),
+         "IP-XACT files", ".xml", 'ip-xact')]),
+    ("c_test", [
+        (WriterBase.TYPE_BLOCK, "CTest", ("Test", "C program"),
+         "C files", ".c", 'test-c')]),
+    ("c_defines", [
+        (WriterBase.TYPE_BLOCK, "CDefines", ("Header files", "C Source"),
+         "C header files", ".h", 'headers-c')]),
+    ("c_struct", [
+        (WriterBase.TYPE_PROJECT, "CStruct", ("Header files", "C Structures"),
+         "Structures for C Headers", ".h", 'structs-c')]),
+    ("asm_equ", [
+        (WriterBase.TYPE_BLOCK, "AsmEqu",
+         ("Header files", "Assembler Source"), "Assembler files", ".s",
+         'headers-asm')]),
+    ("odt_doc", [
+        (WriterBase.TYPE_BLOCK, "OdtDoc", ("Documentation", "OpenDocument"),
+         "OpenDocument files", ".odt", 'doc-odt')]),
+    ("rst_doc", [
+        (WriterBase.TYPE_PROJECT, "RstDoc",
+         ("Specification", "RestructuredText"), "RestructuredText files",
+         ".rest", 'spec-rst')]),
+    ("uvm_reg_block", [
+        (WriterBase.TYPE_PROJECT, "UVMRegBlockRegisters",
+         ("Test", "UVM Registers"), "SystemVerilog files", ".sv",
+         'proj-uvm'),
+        (WriterBase.TYPE_PROJECT, "UVMRegBlockShards",
+         ("Test", "UVM Registers (package per register set)"),
+         "SystemVerilog files", ".sv", 'proj-uvm-shards')]),
+    ("sdc", [
+        (WriterBase.TYPE_PROJECT, "Sdc", ("Synthesis", "SDC Constraints"),
+         "SDC files", ".sdc", 'syn-constraints'),
+        (WriterBase.TYPE_PROJECT, "SdcLoops",
+         ("Synthesis", "SDC Constraints (Tcl loops)"), "SDC files", ".sdc",
+         'syn-constraints-loops')]),
+    ("spyglass", [
+        (WriterBase.TYPE_PROJECT, "Spyglass",
+         ("Spyglass CDC Checking", "SGDC Constraints"), "SGDC files",
+         ".sgdc", 'spy-constraints')]),
+    ]
+
+# Time taken to import each writer module, in order of import. Used by
+# the --startup-profile option of regbuild.
+LOAD_TIMES = []
+
+
+def load_class(module, class_name):
+    """
+    Imports the module, trying each path in IMPORT_PATHS in order, and
+    returns the class from the first module that provides it.
+    """
+    error = ""
+    for mpath in IMPORT_PATHS:
+        fullpath = mpath + "." + module
+        loaded = fullpath in sys.modules
+        start = time.time()
+        try:
+            mod = __import__(fullpath, globals(), locals(), [class_name])
+            cls = getattr(mod, class_name)
+        except ImportError, msg:
+            error = str(msg)
+            continue
+        except AttributeError, msg:
+            continue
+        except SyntaxError, msg:
+            print str(msg)
+            continue
+        if not loaded:
+            LOAD_TIMES.append((fullpath, time.time() - start))
+        return cls
+    raise ImportError('Could not import the "{0}" module: {1}'.format(
+        module, error))
+
+
+class LazyExportInfo(object):
+    """
+    Provides the same attributes as the ExportInfo tuple (obj_class, type,
+    description, extension, and id), but the class is not imported until
+    obj_class is first accessed.
+    """
+
+    def __init__(self, module, class_name, type_info, description,
+                 extension, exp_id):
+        self.module = module
+        self.class_name = class_name
+        self.type = type_info
+        self.description = description
+        self.extension = extension
+        self.id = exp_id
+        self.__obj_class = None
+
+    @property
+    def obj_class(self):
+        if self.__obj_class is None:
+            self.__obj_class = load_class(self.module, self.class_name)
+        return self.__obj_class
 
-ExportInfo = namedtuple("ExportInfo", ["obj_class", "type", "description",
-                                       "extension", "id"])
+    @property
+    def loaded(self):
+        """
+        True if the class has been imported
+        """
+        return self.__obj_class is not None
 
 
 EXPORTERS = []
 GRP_EXPORTERS = []
 PRJ_EXPORTERS = []
 
-IMPORT_PATHS = ("regenerate.site_local", "regenerate.writers")
-MODULES = [ 
-    ("verilog", ["Verilog", "Verilog2001", "SystemVerilog"]),
-    ("verilog_defs", ["VerilogDefines"]),
-    ("verilog_param", ["VerilogParameters"]),
-    ("reg_pkg", ["VerilogConstRegPackage"]),
-    ("decoder", ["AddressDecode"]),
-    ("ipxact", ["IpXactWriter"]),
-    ("c_test", ["CTest"]),
-    ("c_defines", ["CDefines"]),
-    ("c_struct", ["CStruct"]),
-    ("asm_equ", ["AsmEqu"]),
-    ("odt_doc", ["OdtDoc"]),
-    ("rst_doc", ["RstDoc"]),
-    ("uvm_reg_block", ["UVMRegBlockRegisters"]),
-    ("sdc", ["Sdc"]),
-    ("spyglass", ["Spyglass"]),
-    ]
-
 #-----------------------------------------------------------------------------
 #
 #  Dynamically load writes for Linux. To get the packaging tools to work, 
@@ -79,32 +204,135 @@ if platform.system() == 'windows':
     from asm_equ import AsmEqu
     from odt_doc import OdtDoc
     from rst_doc import RstDoc
-    from uvm_reg_block import UVMRegBlockRegisters
-    from sdc import Sdc
+    from uvm_reg_block import UVMRegBlockRegisters, UVMRegBlockShards
+    from sdc import Sdc, SdcLoops
     from spyglass import Spyglass
 
-for module in MODULES:
-    for mpath in IMPORT_PATHS:
+
+def add_exporter(exp_type, info):
+    """
+    Adds the exporter to the list for its type, replacing any exporter
+    with the same identifier
+    """
+    for exp_list in (EXPORTERS, GRP_EXPORTERS, PRJ_EXPORTERS):
+        exp_list[:] = [old for old in exp_list if old.id != info.id]
+    if exp_type == WriterBase.TYPE_BLOCK:
+        EXPORTERS.append(info)
+    elif exp_type == WriterBase.TYPE_GROUP:
+        GRP_EXPORTERS.append(info)
+    else:
+        PRJ_EXPORTERS.append(info)
+
+
+def extra_modules():
+    """
+    Returns the site_local modules (found without importing the standard
+    writers), followed by the modules listed in REGENERATE_WRITERS
+    """
+    found = []
+    try:
+        import regenerate.site_local as site_local
+    except ImportError:
+        site_local = None
+    if site_local is not None:
+        found.append(site_local.__name__)
+        for (module, _) in MODULES:
+            try:
+                imp.find_module(module, site_local.__path__)
+            except ImportError:
+                continue
+            found.append(site_local.__name__ + "." + module)
+    for name in os.environ.get("REGENERATE_WRITERS", "").split(","):
+        if name.strip():
+            found.append(name.strip())
+    return found
+
+
+def add_extra_exporters():
+    """
+    Imports the site_local and REGENERATE_WRITERS modules, and adds the
+    exporters in their EXPORTERS lists
+    """
+    for fullpath in extra_modules():
+        start = time.time()
         try:
-            fullpath = mpath + "." + module[0]
-            a = __import__(fullpath, globals(), locals(), module[1])
-            for t, info in a.EXPORTERS:
-                if t == WriterBase.TYPE_BLOCK:
-                    EXPORTERS.append(info)
-                elif t == WriterBase.TYPE_GROUP:
-                    GRP_EXPORTERS.append(info)
-                else:
-                    PRJ_EXPORTERS.append(info)
-            break
+            mod = __import__(fullpath, globals(), locals(), ["EXPORTERS"])
         except ImportError, msg:
-            continue
-        except AttributeError, msg:
+            LOGGER.warning('Could not import the "{0}" module: {1}'.format(
+                fullpath, msg))
             continue
         except SyntaxError, msg:
             print str(msg)
             continue
-    else:
-        LOGGER.warning('Cound not import the "{0}" module'.format(module[0]))
+        LOAD_TIMES.append((fullpath, time.time() - start))
+        for (exp_type, info) in getattr(mod, "EXPORTERS", []):
+            add_exporter(exp_type, info)
+
+
+for (module, exporters) in MODULES:
+    for (exp_type, class_name, type_info, descr, ext, exp_id) in exporters:
+        add_exporter(exp_type, LazyExportInfo(module, class_name, type_info,
+                                              descr, ext, exp_id))
+add_extra_exporters()
 
 
+def find_exporter(exp_id):
+    """
+    Returns the exporter with the specified identifier, or None if no
+    exporter matches.
+    """
+    for info in EXPORTERS + GRP_EXPORTERS + PRJ_EXPORTERS:
+        if info.id == exp_id:
+            return info
+    return None
 
+
+def load_all():
+    """
+    Imports the classes for all the exporters, returning the list of
+    exporters whose modules could not be imported. Any differences between
+    MODULES and the EXPORTERS lists of the writer modules are logged.
+    """
+    failed = []
+    for info in EXPORTERS + GRP_EXPORTERS + PRJ_EXPORTERS:
+        try:
+            info.obj_class
+        except ImportError, msg:
+            LOGGER.warning(str(msg))
+            failed.append(info)
+    for msg in check_exporters():
+        LOGGER.warning(msg)
+    return failed
+
+
+def check_exporters():
+    """
+    Compares the MODULES table with the EXPORTERS list of each writer
+    module that can be imported, returning a message for each exporter
+    that differs
+    """
+    errors = []
+    for (module, exporters) in MODULES:
+        try:
+            cls = load_class(module, exporters[0][1])
+        except ImportError:
+            continue
+        if not cls.__module__.startswith(__name__ + "."):
+            # A site_local version, whose EXPORTERS replace the standard ones
+            continue
+        declared = set(
+            (exp_type, info.obj_class.__name__, tuple(info.type),
+             info.description, info.extension, info.id)
+            for (exp_type, info) in getattr(sys.modules[cls.__module__],
+                                            "EXPORTERS", []))
+        listed = set((exp_type, class_name, tuple(type_info), descr, ext,
+                      exp_id)
+                     for (exp_type, class_name, type_info, descr, ext,
+                          exp_id) in exporters)
+        for item in sorted(listed - declared):
+            errors.append("%s: MODULES entry %s is not in the module's "
+                          "EXPORTERS" % (module, item[-1]))
+        for item in sorted(declared - listed):
+            errors.append("%s: EXPORTERS entry %s is not in MODULES" %
+                          (module, item[-1]))
+    return errors
@@ -21,6 +21,7 @@ EquWriter - Writes out Assembler defines (based off the GNU assembler)
 """
 
 from regenerate.writers.writer_base import WriterBase, ExportInfo
+from regenerate.writers.db_view import get_view
 
 
 class AsmEqu(WriterBase):
@@ -29,8 +30,8 @@ class AsmEqu(WriterBase):
     the token for the registers addresses.
     """
 
-    def __init__(self, dbase):
-        WriterBase.__init__(self, dbase)
+    def __init__(self, project, dbase):
+        WriterBase.__init__(self, project, dbase)
         self._offset = 0
         self._ofile = None
 
@@ -49,13 +50,12 @@ class AsmEqu(WriterBase):
         """
         Writes the output file
         """
-        self._ofile = open(filename, "w")
+        self._ofile = self._open(filename)
         self._write_header_comment(self._ofile, 'site_asm.inc',
                                    comment_char=';; ')
 
-        for reg_key in self._dbase.get_keys():
-            self.write_def(self._dbase.get_register(reg_key), self._prefix,
-                           self._offset)
+        for reg in get_view(self._dbase).registers:
+            self.write_def(reg, self._prefix, self._offset)
         self._ofile.write('\n')
         self._ofile.close()
 
@@ -21,6 +21,7 @@ CWriter - Writes out C defines representing the register addresses
 """
 
 from writer_base import WriterBase, ExportInfo
+from regenerate.writers.db_view import get_view
 from regenerate.extras import full_token, in_groups
 import os
 
@@ -86,15 +87,16 @@ class CDefines(WriterBase):
         """
         self._filename = os.path.basename(filename)
 
-        with open(filename, "w") as self._ofile:
+        with self._open(filename) as self._ofile:
             self.write_header(self._ofile, "".join(HEADER))
 
             addr_maps = self._project.get_address_maps()
 
             if len(addr_maps) > 0:
                 base = self._project.get_address_base(addr_maps[0].name)
+                registers = get_view(self._dbase).registers
                 for data in in_groups(self._dbase.module_name, self._project):
-                    for register in self._dbase.get_all_registers():
+                    for register in registers:
                         self.write_def(register, data, base)
                     self._ofile.write('\n')
 
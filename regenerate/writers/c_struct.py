@@ -21,9 +21,9 @@ Actual program. Parses the arguments, and initiates the main window
 """
 
 from regenerate.db import BitField, TYPES, LOGGER
+from regenerate.db.topology import get_topology
 from regenerate.extras.remap import REMAP_NAME
 from regenerate.writers.writer_base import WriterBase, ExportInfo
-import time
 import os
 from jinja2 import Environment
 
@@ -68,35 +68,6 @@ class CStruct(WriterBase):
         else:
             return name
 
-    def uvm_address_maps(self):
-        return [d for d in self._project.get_address_maps() if not d.uvm]
-
-    def build_map_name_to_groups(self):
-        map2grp = {}
-        all_groups = [grp.name for grp in self._project.get_grouping_list()]
-
-        for data in self.uvm_address_maps():
-            name = data.name
-            map2grp[name] = self._project.get_address_map_groups(name)
-            if not map2grp[name]:
-                map2grp[name] = all_groups
-        return map2grp
-
-    def _build_group_maps(self):
-        group_maps = {}
-        for group in self._project.get_grouping_list():
-            in_maps = set()
-            for addr_map in self.uvm_address_maps():
-                map_list = self._project.get_address_map_groups(addr_map.name)
-                if not map_list or group.name in map_list:
-                    in_maps.add(addr_map.name)
-            if in_maps:
-                group_maps[group] = in_maps
-        return group_maps
-
-    def _used_maps(self):
-        return set([addr_map.name for addr_map in self.uvm_address_maps()])
-
     def write(self, filename):
         """
         Write the data to the file as a SystemVerilog package. This includes
@@ -104,8 +75,6 @@ class CStruct(WriterBase):
         container blocks.
         """
         
-        group_maps = self._build_group_maps()
-        name = self._project.short_name
         dirpath = os.path.dirname(__file__)
 
         env = Environment(trim_blocks=True, lstrip_blocks=True)
@@ -114,49 +83,21 @@ class CStruct(WriterBase):
                                      "cstruct.template")
         template = env.from_string(file(template_file).read())
 
-        used_dbs = self.get_used_databases()
-        
+        topology = get_topology(self._project)
 
-        with open(filename, "w") as of:
-            of.write(template.render(project=self._project, dblist=used_dbs,
-                                     db_grp_maps=self.get_db_groups(),
-                                     group_maps = self._build_group_maps(),
+        with self._open(filename) as of:
+            of.write(template.render(project=self._project,
+                                     dblist=topology.used_databases(self.dblist),
+                                     db_grp_maps=topology.db_groups(self.dblist),
+                                     group_maps=topology.group_maps,
                                      fix_name=self.fix_name,
                                      fix_reg=self.fix_reg_name,
                                      use_new=False,
-                                     used_maps = self._used_maps(),
-                                     map2grp = self.build_map_name_to_groups(),
-                                     current_date=time.strftime("%B %d, %Y")
+                                     used_maps=topology.used_maps,
+                                     map2grp=topology.map_groups,
+                                     current_date=self._current_date("%B %d, %Y")
                                      ))
 
-    def get_db_groups(self):
-        data_set = []
-        group_maps = self._build_group_maps()
-        for dbase in self.get_used_databases():
-            for group in self._project.get_grouping_list():
-                used = set()
-                for grp in group.register_sets:
-                    if grp.set == dbase.set_name and grp.set not in used:
-                        used.add(grp.set)
-                        if group in group_maps:
-                            data_set.append((dbase, group, group_maps[group]))
-        return data_set
-
-    def get_used_databases(self):
-
-        grp_set = set()
-        maps = self._build_group_maps()
-        for key in maps:
-            if maps[key]:
-                grp_set.add(key.name)
-
-        used_sets = set([])
-        for group in self._project.get_grouping_list():
-            if group.name in grp_set: 
-                for reg_sets in group.register_sets:
-                    used_sets.add(reg_sets.set)
-        return set([db for db in self.dblist if db.set_name in used_sets])
-
 
 EXPORTERS = [
     (WriterBase.TYPE_PROJECT, ExportInfo(CStruct, ("Header files", "C Structures"),
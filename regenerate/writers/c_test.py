@@ -286,7 +286,7 @@ class CTest(WriterBase):
         """
         address_maps = self._project.get_address_maps()
 
-        cfile = open(filename, "w")
+        cfile = self._open(filename)
 
         if address_maps:
             token = "#ifdef"
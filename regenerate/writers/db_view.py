@@ -0,0 +1,239 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Precomputed view of a register database, shared by the block writers.
+
+Sorting the registers, expanding register arrays into their elements,
+and breaking the fields into bus sized slices is the same work for every
+writer. The view does this once per database, and get_view returns the
+same view to every writer in the run.
+
+The view is not updated when the database changes. Code that edits a
+database (such as the GUI) must call clear_views before running the
+writers again.
+"""
+
+import hashlib
+import weakref
+from collections import defaultdict
+
+from regenerate.db import BitField, TYPE_TO_OUTPUT
+from regenerate.db.signals import BIT_SLICE, BUS_SLICE
+
+(F_FIELD, F_START_OFF, F_STOP_OFF, F_START, F_STOP, F_ADDRESS,
+ F_REGISTER) = range(7)
+
+
+def in_range(lower, upper, lower_limit, upper_limit):
+    """
+    Checks to see if the range is within the specified range
+    """
+    return ((lower_limit <= lower <= upper_limit) or
+            (lower_limit <= upper <= upper_limit) or
+            (lower < lower_limit and upper >= upper_limit))
+
+
+class RegisterElement(object):
+    """
+    A register as seen by the RTL writers. Each element of a register
+    array is a separate RegisterElement with its own address, and a
+    dimension of the index of the element. Registers that are not arrays
+    have a dimension of -1. All other attributes come from the register,
+    so the register does not need to be copied.
+    """
+
+    __slots__ = ("register", "address", "dimension", "_fields")
+
+    def __init__(self, register, address, dimension, fields):
+        self.register = register
+        self.address = address
+        self.dimension = dimension
+        self._fields = fields
+
+    def __getattr__(self, name):
+        return getattr(self.register, name)
+
+    def __cmp__(self, other):
+        return cmp(self.address, other.address)
+
+    def get_bit_fields(self):
+        return self._fields
+
+    def fingerprint(self):
+        return hashlib.sha1(repr((self.register.fingerprint(), self.address,
+                                  self.dimension))).hexdigest()
+
+
+class RegisterDbView(object):
+    """
+    Information derived from a register database:
+
+      registers       - all registers, sorted by address
+      code_registers  - registers for which code is generated
+      elements        - code_registers, with arrays expanded
+      sorted_elements - elements, sorted by address
+      used_types      - the field types used by code_registers
+      parameters      - (msb, lsb, name) for fields reset by parameter
+      output_ports    - (signal, range, dimension) for the output signals
+    """
+
+    def __init__(self, dbase):
+        self.dbase = dbase
+        self.registers = list(dbase.get_all_registers())
+        self.__fields = {}
+        self.__slices = {}
+
+        self.code_registers = [reg for reg in self.registers
+                               if not reg.do_not_generate_code]
+
+        self.elements = []
+        self.used_types = set()
+        for reg in self.code_registers:
+            fields = self.fields(reg)
+            self.used_types.update(field.field_type for field in fields)
+            if reg.dimension > 1:
+                for i in range(0, reg.dimension):
+                    self.elements.append(
+                        RegisterElement(reg, reg.address + (i * (reg.width / 8)),
+                                        i, fields))
+            else:
+                self.elements.append(RegisterElement(reg, reg.address, -1,
+                                                     fields))
+        self.sorted_elements = sorted(self.elements)
+
+        self.parameters = [(field.msb, field.lsb, field.reset_parameter)
+                           for reg in self.registers
+                           for field in self.fields(reg)
+                           if field.reset_type == BitField.RESET_PARAMETER]
+
+        self.output_ports = self.__build_output_ports()
+
+    def fields(self, reg):
+        """
+        Returns the sorted bit fields of the register
+        """
+        fields = self.__fields.get(id(reg))
+        if fields is None:
+            fields = reg.get_bit_fields()
+            self.__fields[id(reg)] = fields
+        return fields
+
+    def word_slices(self, size):
+        """
+        Breaks the fields of the register elements along the specified bus
+        width. Returns a dictionary mapping the bus address to a list of
+        slices, each a tuple of (field, start offset, stop offset, start,
+        stop, address, register element).
+        """
+        slices = self.__slices.get(size)
+        if slices is not None:
+            return slices
+
+        slices = {}
+        nbytes = size / 8
+        for element in self.elements:
+            address = (element.address / nbytes) * nbytes
+            bit_offset = (element.address * 8) % size
+            for field in element.get_bit_fields():
+                offset = 0
+                for lower in range(0, element.width, size):
+                    if in_range(field.lsb, field.msb, lower, lower + size - 1):
+                        start = max(field.lsb, lower)
+                        stop = min(field.msb, lower + size - 1)
+                        slices.setdefault(address + offset, []).append(
+                            (field, start + bit_offset, stop + bit_offset,
+                             start, stop, address + offset, element))
+                        offset += nbytes
+        self.__slices[size] = slices
+        return slices
+
+    def __build_output_ports(self):
+        """
+        Builds the list of output ports, combining the fields that drive
+        bits of the same signal into a single port.
+        """
+        scalar_ports = []
+        array_ports = defaultdict(list)
+        dim = {}
+        for reg in self.code_registers:
+            for field in self.fields(reg):
+                if not (TYPE_TO_OUTPUT[field.field_type] and
+                        field.use_output_enable):
+                    continue
+                sig = field.output_signal
+                root = sig.split('[')
+                wild = sig.split('*')
+                if len(root) == 1:
+                    if field.msb == field.lsb:
+                        scalar_ports.append((sig, "", reg.dimension))
+                    else:
+                        dim[sig] = reg.dimension
+                        for i in range(field.lsb, field.msb + 1):
+                            array_ports[sig].append(i)
+                elif len(wild) > 1:
+                    dim[root[0]] = reg.dimension
+                    for i in range(field.lsb, field.msb + 1):
+                        array_ports[root[0]].append(i)
+                else:
+                    match = BUS_SLICE.match(sig)
+                    if match:
+                        grp = match.groups()
+                        for i in range(int(grp[1]), int(grp[2])):
+                            array_ports[grp[0]].append(i)
+                        continue
+
+                    match = BIT_SLICE.match(sig)
+                    if match:
+                        grp = match.groups()
+                        dim[grp[0]] = reg.dimension
+                        array_ports[grp[0]].append(int(grp[1]))
+
+        for key in array_ports:
+            msb = max(array_ports[key])
+            lsb = min(array_ports[key])
+            if msb == lsb:
+                scalar_ports.append((key, "[%d]" % lsb, dim[key]))
+            else:
+                scalar_ports.append((key, "[%d:%d]" % (msb, lsb), dim[key]))
+        return scalar_ports
+
+
+_VIEWS = weakref.WeakKeyDictionary()
+
+
+def get_view(dbase):
+    """
+    Returns the view of the database, building it if needed
+    """
+    view = _VIEWS.get(dbase)
+    if view is None:
+        view = RegisterDbView(dbase)
+        _VIEWS[dbase] = view
+    return view
+
+
+def clear_views(dbase=None):
+    """
+    Discards the view of the database, or all views if no database is
+    given. Must be called after a database is modified.
+    """
+    if dbase is None:
+        _VIEWS.clear()
+    else:
+        _VIEWS.pop(dbase, None)
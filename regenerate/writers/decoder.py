@@ -88,7 +88,7 @@ class AddressDecode(WriterBase):
         self.group = group
 
     def write(self, filename):
-        with open(filename, "w") as ofile:
+        with self._open(filename) as ofile:
             self.build(ofile)
 
     def build(self, ofile):
@@ -0,0 +1,168 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Fragment cache for the writers.
+
+Writers that render the same block of code for every register (or field)
+can keep the rendered text of each block in a FragmentCache, keyed by the
+fingerprints of the register and field and anything else the block
+depends on. When the file is regenerated, only the blocks whose keys
+have changed are rendered again; the remaining blocks are taken from the
+cache.
+
+Each writer output has its own cache file, containing a version (built
+from the templates, the code version of the writer (see
+output_cache.code_version), and the settings that affect every block)
+and the fragments. If the version does not match, the cache is discarded.
+Fragments that were not used when the file was generated are dropped
+when the cache is saved, so the cache does not grow as registers are
+edited.
+
+Caching is disabled until a directory is set with set_cache_dir. Until
+then, open_cache returns a NullFragmentCache, which always renders.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+import tempfile
+
+CACHE_DIR = None
+
+STATS = {"reused": 0, "rendered": 0}
+
+
+def set_cache_dir(path):
+    """
+    Enables the fragment cache, storing the cache files in the directory
+    """
+    global CACHE_DIR
+    if path and not os.path.isdir(path):
+        os.makedirs(path)
+    CACHE_DIR = path
+
+
+def fragment_key(*items):
+    """
+    Builds a cache key from the items, which must have a stable repr
+    """
+    return hashlib.sha1(repr(items)).hexdigest()
+
+
+def source_digest(*filenames):
+    """
+    Returns a hash of the contents of the files, used as part of the cache
+    version so that editing a template invalidates the cache
+    """
+    sha = hashlib.sha1()
+    for filename in filenames:
+        with open(filename) as ifile:
+            sha.update(ifile.read())
+    return sha.hexdigest()
+
+
+class NullFragmentCache(object):
+    """
+    Cache used when caching is disabled. Every fragment is rendered.
+    """
+
+    def get(self, key, render):
+        STATS["rendered"] += 1
+        return render()
+
+    def save(self):
+        pass
+
+
+class FragmentCache(object):
+    """
+    Fragments for a single output file, stored in the cache file
+    """
+
+    def __init__(self, filename, version):
+        self.filename = filename
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.__stored = {}
+        self.__used = {}
+
+        try:
+            with open(filename, "rb") as ifile:
+                (stored_version, fragments) = pickle.load(ifile)
+            if stored_version == version:
+                self.__stored = fragments
+        except (IOError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError):
+            pass
+
+    def get(self, key, render):
+        """
+        Returns the fragment for the key, calling render to create it if
+        it is not in the cache
+        """
+        text = self.__used.get(key)
+        if text is not None:
+            return text
+
+        text = self.__stored.get(key)
+        if text is None:
+            text = render()
+            self.misses += 1
+            STATS["rendered"] += 1
+        else:
+            self.hits += 1
+            STATS["reused"] += 1
+        self.__used[key] = text
+        return text
+
+    def save(self):
+        """
+        Writes the fragments used in this run to the cache file, if any
+        fragment was added or dropped
+        """
+        if not self.misses and len(self.__used) == len(self.__stored):
+            return
+
+        dirname = os.path.dirname(self.filename)
+        (handle, tmpname) = tempfile.mkstemp(dir=dirname, prefix=".frag")
+        try:
+            with os.fdopen(handle, "wb") as ofile:
+                pickle.dump((self.version, self.__used), ofile,
+                            pickle.HIGHEST_PROTOCOL)
+            if os.name == 'nt' and os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmpname, self.filename)
+        except (IOError, OSError):
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+        self.__stored = self.__used
+
+
+def open_cache(writer_id, name, version):
+    """
+    Returns the fragment cache for the output of the writer for the named
+    register set or project. The version must change whenever a change
+    could alter every fragment.
+    """
+    if CACHE_DIR is None:
+        return NullFragmentCache()
+    filename = os.path.join(CACHE_DIR, "%s-%s.frag" % (writer_id, name))
+    return FragmentCache(filename, fragment_key(version))
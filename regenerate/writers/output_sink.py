@@ -0,0 +1,255 @@
+#
+# Manage registers in a hardware design
+#
+# Copyright (C) 2008  Donald N. Allingham
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Output sinks, which receive the files written by the writers in place of
+their destinations (see writer_base.set_output_sink).
+
+ArchiveSink collects the files into a single tar or zip archive.
+SyncDirSink writes the files into a local scratch directory, and when the
+build is done, copies the files that differ to their destinations.
+
+Both avoid opening and closing many small files on a slow (NFS) file
+system. Only the files written with WriterBase._open and _open_stream go
+to the sink; writers that create their files directly (such as the ODT
+writers) still write to the destination.
+"""
+
+import errno
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from collections import OrderedDict
+from cStringIO import StringIO
+
+from regenerate.writers.writer_base import (install_file,
+                                            same_file_contents)
+
+TAR_MODES = ((".tar.gz", "w:gz"), (".tgz", "w:gz"), (".tar.bz2", "w:bz2"),
+             (".tbz2", "w:bz2"), (".tar", "w"))
+
+
+class ArchiveSink(object):
+    """
+    Writes the output files into a tar or zip archive, chosen by the
+    extension of the archive name. Each file is stored under its path
+    relative to root. The archive is built in a temporary file, and only
+    replaces the archive when the sink is closed.
+    """
+
+    def __init__(self, filename, root):
+        self.name = os.path.abspath(filename)
+        self.root = os.path.abspath(root)
+        self.count = 0
+
+        lname = self.name.lower()
+        modes = [mode for (ext, mode) in TAR_MODES if lname.endswith(ext)]
+        if not (modes or lname.endswith(".zip")):
+            raise IOError(errno.EINVAL, "Unknown archive type, use .tar, "
+                          ".tar.gz, .tar.bz2 or .zip", filename)
+
+        dirname = os.path.dirname(self.name)
+        if not os.path.isdir(dirname):
+            raise IOError(errno.ENOENT, "No such directory", dirname)
+        (handle, self.__tmpname) = tempfile.mkstemp(dir=dirname,
+                                                    prefix=".regen")
+        os.close(handle)
+        if modes:
+            self.__zip = None
+            self.__tar = tarfile.open(self.__tmpname, modes[0])
+        else:
+            self.__tar = None
+            self.__zip = zipfile.ZipFile(self.__tmpname, "w",
+                                         zipfile.ZIP_DEFLATED,
+                                         allowZip64=True)
+
+    def member(self, filename):
+        """
+        Returns the name of the file in the archive
+        """
+        path = os.path.abspath(filename)
+        name = os.path.relpath(path, self.root)
+        if name.startswith(os.pardir):
+            name = os.path.splitdrive(path)[1].lstrip(os.sep)
+        return name.replace(os.sep, "/")
+
+    def path(self, filename):
+        return None
+
+    def add(self, filename, data):
+        name = self.member(filename)
+        if self.__zip is not None:
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self.__zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            info.mode = 0o644
+            self.__tar.addfile(info, StringIO(data))
+        self.count += 1
+
+    def add_file(self, filename, tmpname):
+        name = self.member(filename)
+        try:
+            if self.__zip is not None:
+                self.__zip.write(tmpname, name)
+            else:
+                info = self.__tar.gettarinfo(tmpname, name)
+                info.mode = 0o644
+                with open(tmpname, "rb") as ifile:
+                    self.__tar.addfile(info, ifile)
+        finally:
+            os.remove(tmpname)
+        self.count += 1
+
+    def closed(self, filename, dates):
+        pass
+
+    def remove(self, filename):
+        pass
+
+    def close(self, report):
+        """
+        Finishes the archive, and returns a summary message
+        """
+        if self.__zip is not None:
+            self.__zip.close()
+        else:
+            self.__tar.close()
+        install_file(self.__tmpname, self.name)
+        return "%d file(s) written to %s" % (self.count, self.name)
+
+    def discard(self):
+        """
+        Abandons the archive, leaving any existing archive untouched
+        """
+        try:
+            if self.__zip is not None:
+                self.__zip.close()
+            else:
+                self.__tar.close()
+        finally:
+            if os.path.exists(self.__tmpname):
+                os.remove(self.__tmpname)
+
+
+class SyncDirSink(object):
+    """
+    Writes the output files under a scratch directory, at their absolute
+    paths below the directory. When the sink is closed, the files that
+    differ from their destinations (apart from the dates the writers
+    inserted) are copied over, and the files removed by the writers are
+    removed from their destinations.
+
+    The scratch directory may be kept between builds. A file that the
+    writer found unchanged in the scratch directory, and whose destination
+    has the same size, is assumed to be up to date without reading the
+    destination.
+    """
+
+    def __init__(self, scratch):
+        self.scratch = os.path.abspath(scratch)
+        self.__files = OrderedDict()
+        self.__dates = {}
+        self.__removed = set()
+
+    def path(self, filename):
+        dest = os.path.abspath(filename)
+        path = self.__files.get(dest)
+        if path is None:
+            (drive, rest) = os.path.splitdrive(dest)
+            path = os.path.join(self.scratch, drive.rstrip(":"),
+                                rest.lstrip(os.sep))
+            dirname = os.path.dirname(path)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self.__files[dest] = path
+        self.__removed.discard(dest)
+        return path
+
+    def closed(self, filename, dates):
+        self.__dates[os.path.abspath(filename)] = frozenset(dates)
+
+    def remove(self, filename):
+        dest = os.path.abspath(filename)
+        self.__files.pop(dest, None)
+        self.__removed.add(dest)
+
+    def close(self, report):
+        """
+        Copies the files that differ to their destinations, updating the
+        report so that exactly the copied files are listed as changed, and
+        returns a summary message
+        """
+        unchanged = set(os.path.abspath(name) for name in report.unchanged)
+        copied = set()
+        for (dest, path) in self.__files.items():
+            if not os.path.exists(path):
+                continue
+            if (dest in unchanged and os.path.exists(dest) and
+                    os.path.getsize(dest) == os.path.getsize(path)):
+                continue
+            if same_file_contents(dest, path, self.__dates.get(dest, ())):
+                continue
+            dirname = os.path.dirname(dest)
+            if not os.path.isdir(dirname):
+                raise IOError(errno.ENOENT, "No such directory", dirname)
+            (handle, tmpname) = tempfile.mkstemp(dir=dirname, prefix=".regen")
+            os.close(handle)
+            try:
+                shutil.copyfile(path, tmpname)
+            except (IOError, OSError):
+                os.remove(tmpname)
+                raise
+            install_file(tmpname, dest)
+            copied.add(dest)
+
+        removed = 0
+        for dest in sorted(self.__removed):
+            if os.path.exists(dest):
+                os.remove(dest)
+                removed += 1
+
+        for name in list(report.changed):
+            dest = os.path.abspath(name)
+            if dest in self.__files and dest not in copied:
+                report.changed.remove(name)
+                report.unchanged.append(name)
+        for name in list(report.unchanged):
+            if os.path.abspath(name) in copied:
+                report.unchanged.remove(name)
+                report.changed.append(name)
+
+        message = "%d file(s) copied from %s" % (len(copied), self.scratch)
+        if removed:
+            message += ", %d removed" % removed
+        return message
+
+    def discard(self):
+        """
+        Abandons the build, leaving the destinations untouched
+        """
+        self.__files.clear()
+        self.__dates.clear()
+        self.__removed.clear()
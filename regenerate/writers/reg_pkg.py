@@ -40,7 +40,7 @@ class VerilogConstRegPackage(WriterBase):
         self.dblist = dblist
 
     def write(self, filename):
-        cfile = open(filename, "w")
+        cfile = self._open(filename)
         base = os.path.splitext(os.path.basename(filename))[0]
         cfile.write('package %s;\n' % base)
         cfile.write('import vlsi_pkg::*;\n')
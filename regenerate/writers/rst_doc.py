@@ -97,7 +97,7 @@ class RstDoc(WriterBase):
         Writes the output file
         """
 
-        with open(filename, "w") as f:
+        with self._open(filename) as f:
             f.write("\n")
             f.write(".. section-numbering::\n\n")
 
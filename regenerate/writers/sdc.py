@@ -21,6 +21,13 @@ Sdc - Writes out synthesis constraints
 """
 
 from writer_base import WriterBase, ExportInfo
+from regenerate.db.topology import get_topology
+from regenerate.db.signals import get_signals
+
+
+# Constraints written for each static output cell
+CELL_CONSTRAINTS = ("set_multicycle -from [get_cells{%s}] -setup 4\n"
+                    "set_false_path -from [get_cells{%s}] -hold\n")
 
 
 class Sdc(WriterBase):
@@ -36,32 +43,86 @@ class Sdc(WriterBase):
 
     def write(self, filename):
         """
-        Writes the output file
+        Writes the output file. The file can be very large when the groups
+        and instances are repeated, so it is streamed to disk.
         """
-        of = open(filename, "w")
+        topology = get_topology(self._project)
+
+        with self._open_stream(filename) as of:
+            # Write register blocks
+            for dbase in self.dblist:
+                fields = all_fields(dbase)
+                if not fields:
+                    continue
+                used = set()
+                for (group, grp) in topology.instances_of(dbase.set_name):
+                    if grp.hdl and group not in used:
+                        used.add(group)
+                        self.write_instance(of, group, grp, fields)
 
-        # Write register blocks
-        for dbase in self.dblist:
+    def write_instance(self, of, group, grp, fields):
+        """
+        Writes the constraints for every repeat of the instance and group
+        """
+        for reg, field in fields:
+            base = get_signal_info(reg.address, field)[0]
+            for i in range(0, grp.repeat):
+                for j in range(0, group.repeat):
+                    path = build_format(group.hdl, j, grp.hdl, i)
+                    signal_name = "%s/%s" % (path, base)
+                    of.write(CELL_CONSTRAINTS % (signal_name, signal_name))
 
-            for group in self._project.get_grouping_list():
-                used = set()
-                for grp in group.register_sets:
-                    if grp.set == dbase.set_name and grp.set not in used and grp.hdl:
-                        used.add(grp.set)
-                        for reg, field in all_fields(dbase):
-                            for i in range(0, grp.repeat):
-#                                base = get_signal_base(field)
-                                base = get_signal_info(reg.address, field)[0]
-                                for j in range(0, group.repeat):
-                                    path = build_format(group.hdl, j, grp.hdl, i)
-                                    signal_name = "%s/%s" % (path, base)
-                                    of.write(
-                                        "set_multicycle -from [get_cells{%s}] -setup 4\n"
-                                        % signal_name)
-                                    of.write(
-                                        "set_false_path -from [get_cells{%s}] -hold\n"
-                                        % signal_name)
-        of.close()
+
+class SdcLoops(Sdc):
+    """
+    Writes the same constraints as Sdc, but uses Tcl loops over the
+    repeated groups and instances, and over the cells of the register
+    set, instead of writing the constraints for every combination.
+
+    The loops run at the global scope of the tool, so their variables are
+    prefixed with regen_ to avoid clobbering the user's variables, and are
+    removed after each block.
+    """
+
+    def write_instance(self, of, group, grp, fields):
+        loops = []
+        path = [loop_format(grp.hdl, "regen_i", grp.repeat, loops)]
+        if group.hdl:
+            path.insert(0, loop_format(group.hdl, "regen_j", group.repeat,
+                                       loops))
+        cell = "%s/$regen_cell" % "/".join(path)
+
+        of.write("set regen_cells {%s}\n" % " ".join(
+            get_signal_info(reg.address, field)[0] for reg, field in fields))
+        indent = ""
+        for (var, count) in loops:
+            of.write("%sfor {set %s 0} {$%s < %d} {incr %s} {\n" %
+                     (indent, var, var, count, var))
+            indent += "    "
+        of.write("%sforeach regen_cell $regen_cells {\n" % indent)
+        for line in (CELL_CONSTRAINTS % (cell, cell)).splitlines():
+            of.write("%s    %s\n" % (indent, line))
+        of.write("%s}\n" % indent)
+        while indent:
+            indent = indent[:-4]
+            of.write("%s}\n" % indent)
+        of.write("unset -nocomplain %s\n" % " ".join(
+            ["regen_cells", "regen_cell"] + [var for (var, _) in loops]))
+
+
+def loop_format(hdl, var, count, loops):
+    """
+    Converts the HDL path to a Tcl path, replacing the index with the loop
+    variable. The loop is added to loops if the path uses the index and
+    there is more than one repeat.
+    """
+    hdl = hdl.replace(".", "/")
+    if "%0d" not in hdl:
+        return hdl
+    if count > 1:
+        loops.append((var, count))
+        return hdl.replace("%0d", "${%s}" % var)
+    return hdl.replace("%0d", "0")
 
 
 def build_format(top_hdl, top_count, lower_hdl, lower_count):
@@ -79,12 +140,8 @@ def build_format(top_hdl, top_count, lower_hdl, lower_count):
 
 
 def all_fields(dbase):
-    f = []
-    for reg in dbase.get_all_registers():
-        for field in reg.get_bit_fields():
-            if has_static_output(field):
-                f.append((reg, field))
-    return f
+    return [(use.register, use.field)
+            for use in get_signals(dbase).static_outputs()]
 
 
 def has_static_output(field):
@@ -141,5 +198,7 @@ def get_base_signal(address, field):
 
 EXPORTERS = [
     (WriterBase.TYPE_PROJECT, ExportInfo(Sdc, ("Synthesis", "SDC Constraints"), "SDC files",
-                                         ".sdc", 'syn-constraints'))
+                                         ".sdc", 'syn-constraints')),
+    (WriterBase.TYPE_PROJECT, ExportInfo(SdcLoops, ("Synthesis", "SDC Constraints (Tcl loops)"),
+                                         "SDC files", ".sdc", 'syn-constraints-loops'))
     ]
@@ -94,7 +94,7 @@ class SpiritWriter(WriterBase):
                             trim_blocks=True,
                             lstrip_blocks=True)
 
-        with open(filename, "w") as of:
+        with self._open(filename) as of:
             of.write(template.render(db = self._dbase,
                                      WRITE_MAP=WRITE_MAP,
                                      ACCESS_MAP=ACCESS_MAP,
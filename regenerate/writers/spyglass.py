@@ -21,6 +21,7 @@ Sdc - Writes out synthesis constraints
 """
 
 from writer_base import WriterBase, ExportInfo
+from regenerate.db.signals import get_signals
 
 
 class Spyglass(WriterBase):
@@ -46,17 +47,6 @@ class Spyglass(WriterBase):
                         static_signals.add(field.output_signal)
         return static_signals
 
-    def _build_group_maps(self):
-        group_maps = {}
-        for group in self._project.get_grouping_list():
-            in_maps = set()
-            for addr_map in self._project.get_address_maps():
-                map_list = self._project.get_address_map_groups(addr_map.name)
-                if not map_list or group.name in map_list:
-                    in_maps.add(addr_map.name)
-            group_maps[group] = in_maps
-        return group_maps
-
     def _build_name(self, field):
 
         base = field.output_signal.split('*')
@@ -67,30 +57,23 @@ class Spyglass(WriterBase):
         return base
 
     def get_static_ports(self, dbase):
-        fields = []
-        for reg in dbase.get_all_registers():
-            for field in reg.get_bit_fields():
-                if (field.use_output_enable and field.output_signal and
-                    field.output_is_static):
-                    fields.append(field)
-        return fields
+        return [use.field for use in get_signals(dbase).static_outputs()]
 
     def write(self, filename):
         """
         Writes the output file
         """
-        of = open(filename, "w")
-
-        # Write register blocks
-        for dbase in self.dblist:
-            ports = self.get_static_ports(dbase)
-            if ports:
-                of.write("\n\ncurrent_design %s\n\n" % dbase.module_name)
-                for field in ports:
-                    signal_name = self._build_name(field)
-                    of.write(
-                        "quasi_static -name %s\n" % signal_name)
-        of.close()
+        with self._open_stream(filename) as of:
+            # Write register blocks
+            for dbase in self.dblist:
+                ports = self.get_static_ports(dbase)
+                if ports:
+                    of.write("\n\ncurrent_design %s\n\n" %
+                             dbase.module_name)
+                    for field in ports:
+                        signal_name = self._build_name(field)
+                        of.write(
+                            "quasi_static -name %s\n" % signal_name)
 
 EXPORTERS = [
     (WriterBase.TYPE_PROJECT, ExportInfo(Spyglass, ("Spyglass CDC Checking", "SGDC Constraints"),
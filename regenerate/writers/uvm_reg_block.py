@@ -21,11 +21,19 @@ Actual program. Parses the arguments, and initiates the main window
 """
 
 from regenerate.db import BitField, TYPES, LOGGER
+from regenerate.db.topology import get_topology
 from regenerate.extras.remap import REMAP_NAME
-from regenerate.writers.writer_base import WriterBase, ExportInfo
-import time
+from regenerate.extras import profiler
+from regenerate.extras.output_cache import code_version
+from regenerate.writers.writer_base import (WriterBase, ExportInfo,
+                                            job_count, same_contents,
+                                            replace_file, output_path,
+                                            remove_output,
+                                            template_environment)
+from regenerate.writers import fragments
+from collections import namedtuple
+import json
 import os
-from jinja2 import Environment
 
 #
 # Map regenerate types to UVM type strings
@@ -39,6 +47,35 @@ for i in TYPES:
 
 TYPE_TO_INPUT = dict((__i.type, __i.input) for __i in TYPES)
 
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+# Templates used by the UVM writers. Any change to these invalidates the
+# fragment cache and the saved shard keys.
+TEMPLATES = ("uvm_reg_block.template", "uvm_register.template",
+             "uvm_access_map.template", "uvm_set_classes.template",
+             "uvm_set_block.template", "uvm_top_blocks.template",
+             "uvm_common_pkg.template", "uvm_set_pkg.template",
+             "uvm_top_pkg.template")
+
+# If True, registers in a register set whose classes would be identical
+# share a single class (see RegisterClasses). Off by default, since the
+# other registers become typedefs of the shared class, and so lose their
+# own factory (uvm_object_utils) name.
+SHARE_CLASSES = False
+
+
+def set_share_classes(flag):
+    """
+    Enables or disables the sharing of register classes
+    """
+    global SHARE_CLASSES
+    SHARE_CLASSES = bool(flag)
+
+
+def template_digest():
+    return fragments.source_digest(*[os.path.join(TEMPLATE_DIR, name)
+                                     for name in TEMPLATES])
+
 
 class UVMRegBlockRegisters(WriterBase):
     """
@@ -53,6 +90,8 @@ class UVMRegBlockRegisters(WriterBase):
         """
         WriterBase.__init__(self, project, None)
         self.dblist = dblist
+        self.class_counts = None
+        self._classes = {}
 
     def fix_name(self, field):
         """
@@ -80,34 +119,36 @@ class UVMRegBlockRegisters(WriterBase):
         else:
             return name
 
-    def uvm_address_maps(self):
-        return [d for d in self._project.get_address_maps() if not d.uvm]
-
-    def build_map_name_to_groups(self):
-        map2grp = {}
-        all_groups = [grp.name for grp in self._project.get_grouping_list()]
-
-        for data in self.uvm_address_maps():
-            name = data.name
-            map2grp[name] = self._project.get_address_map_groups(name)
-            if not map2grp[name]:
-                map2grp[name] = all_groups
-        return map2grp
-
-    def _build_group_maps(self):
-        group_maps = {}
-        for group in self._project.get_grouping_list():
-            in_maps = set()
-            for addr_map in self.uvm_address_maps():
-                map_list = self._project.get_address_map_groups(addr_map.name)
-                if not map_list or group.name in map_list:
-                    in_maps.add(addr_map.name)
-            if in_maps:
-                group_maps[group] = in_maps
-        return group_maps
-
-    def _used_maps(self):
-        return set([addr_map.name for addr_map in self.uvm_address_maps()])
+    def _environment(self):
+        """
+        Returns the jinja2 environment used to load the templates
+        """
+        env = template_environment(TEMPLATE_DIR, trim_blocks=True,
+                                   lstrip_blocks=True,
+                                   keep_trailing_newline=True)
+        env.filters['remove_no_uvm'] = remove_no_uvm
+        return env
+
+    def _context(self, topology, register_class, check_access, **kwargs):
+        """
+        Returns the variables used by the package templates
+        """
+        context = dict(project=self._project,
+                       individual_access=check_access,
+                       ACCESS_MAP=ACCESS_MAP,
+                       TYPE_TO_INPUT=TYPE_TO_INPUT,
+                       group_maps=topology.group_maps,
+                       fix_name=self.fix_name,
+                       fix_reg=self.fix_reg_name,
+                       use_new=False,
+                       used_maps=topology.used_maps,
+                       map2grp=topology.map_groups,
+                       register_class=register_class,
+                       class_owner=self._class_owner,
+                       reset_overrides=self._reset_overrides,
+                       current_date=self._current_date("%B %d, %Y"))
+        context.update(kwargs)
+        return context
 
     def write(self, filename):
         """
@@ -116,98 +157,437 @@ class UVMRegBlockRegisters(WriterBase):
         container blocks.
         """
         
-        group_maps = self._build_group_maps()
         name = self._project.short_name
-        dirpath = os.path.dirname(__file__)
+        common_pkg = "%s_reg_pkg" % name.lower()
+
+        env = self._environment()
+        template = env.get_template("uvm_reg_block.template")
+        register_template = env.get_template("uvm_register.template")
+
+        cache = fragments.open_cache(
+            "uvm", name, (template_digest(), code_version(self.__class__),
+                          name, common_pkg))
+
+        with profiler.phase("build model", name):
+            topology = get_topology(self._project)
+            used_dbs = topology.used_databases(self.dblist)
+            db_grp_maps = topology.db_groups(self.dblist)
+            self._share_classes(used_dbs)
+
+        with profiler.phase("render template", filename):
+            check_access = self._individual_access()
+            register_class = self._register_class(cache, register_template,
+                                                  check_access, common_pkg)
+            text = template.render(self._context(
+                topology, register_class, check_access, dblist=used_dbs,
+                db_grp_maps=db_grp_maps))
+            cache.save()
+
+        with profiler.phase("write file", filename):
+            with self._open(filename) as of:
+                of.write(text)
+
+    def _register_class(self, cache, template, check_access, common_pkg):
+        """
+        Returns the function used by the template to render the class for
+        a register, taking the text from the fragment cache if the register
+        has not changed.
+        """
 
-        env = Environment(trim_blocks=True, lstrip_blocks=True)
+        def register_class(dbase, register):
 
-        env.filters['remove_no_uvm'] = remove_no_uvm
+            def render():
+                return template.render(project=self._project, db=dbase,
+                                       register=register,
+                                       individual_access=check_access,
+                                       ACCESS_MAP=ACCESS_MAP,
+                                       TYPE_TO_INPUT=TYPE_TO_INPUT,
+                                       fix_name=self.fix_name,
+                                       fix_reg=self.fix_reg_name,
+                                       common_pkg=common_pkg,
+                                       use_new=False)
 
-        template_file = os.path.join(dirpath, "templates", 
-                                     "uvm_reg_block.template")
-        template = env.from_string(file(template_file).read())
+            return cache.get(register_key(dbase, register), render)
 
-        used_dbs = self.get_used_databases()
-        
+        return register_class
+
+    def _share_classes(self, dblist):
+        """
+        Finds the registers that can share a UVM class in each register
+        set, and records the number of classes needed before and after
+        sharing in class_counts. Does nothing unless sharing is enabled
+        with set_share_classes.
+        """
+        if not SHARE_CLASSES:
+            self._classes = {}
+            self.class_counts = None
+            return
+        self._classes = dict((id(dbase), RegisterClasses(dbase))
+                             for dbase in dblist)
+        self.class_counts = (
+            sum(c.registers for c in self._classes.values()),
+            sum(c.classes for c in self._classes.values()))
+
+    def _class_owner(self, dbase, register):
+        """
+        Returns the register whose class is used for the register
+        """
+        classes = self._classes.get(id(dbase))
+        return classes.owner(register) if classes else register
+
+    def _reset_overrides(self, dbase, register):
+        """
+        Returns the (field, reset value) pairs for the fields whose reset
+        value differs from the register that owns the class
+        """
+        classes = self._classes.get(id(dbase))
+        return classes.reset_overrides(register) if classes else []
+
+    def _individual_access(self):
+        """
+        Returns the function used by the templates to check if a field can
+        be accessed individually. The byte owners of each register are only
+        computed once.
+        """
+        owners = {}
+
+        def check_access(field, reg):
+            if id(reg) not in owners:
+                owners[id(reg)] = byte_owners(reg)
+            return individual_access(field, reg, owners[id(reg)])
+
+        return check_access
+
+
+
+# Register set package: the database, the package name, the output file,
+# the (group, map names) pairs of the groups containing the register set,
+# and the key used to detect changes.
+Shard = namedtuple("Shard", ["dbase", "package", "filename", "groups",
+                             "key"])
+
+# State needed by the worker processes that render the shards, inherited
+# when the processes are forked.
+_SHARD_JOB = None
+
+
+def _render_shard(index):
+    (writer, env, shards) = _SHARD_JOB
+    return writer._render_shard(env, shards[index])
+
+
+class UVMRegBlockShards(UVMRegBlockRegisters):
+    """
+    Generates the same register model as UVMRegBlockRegisters, but split
+    into several packages, so that a change to one register set only
+    changes (and requires recompiling) one package:
+
+      <name>_reg_common_pkg.sv  - the settings shared by all packages
+      <name>_<set>_reg_pkg.sv   - the classes for one register set
+      <name>_reg_pkg.sv         - the group and top level blocks, which
+                                  imports and exports the other packages
+                                  (this is the file passed to write)
+      <name>_reg_pkg.f          - the files, in compile order
+
+    The file list names the files relative to its own directory, so it is
+    meant to be passed to the simulator with -F.
+
+    The register set packages are rendered in parallel (see
+    writer_base.set_jobs). A key for each package is saved in a manifest
+    file in the output directory, and packages whose key has not changed
+    are not generated again.
+    """
+
+    def __init__(self, project, dblist):
+        UVMRegBlockRegisters.__init__(self, project, dblist)
+        self._topology = None
+        self._common_pkg = ""
+        self._digest = ""
+        self._version = ""
+
+    def write(self, filename):
+        """
+        Writes the packages, the file list, and the manifest
+        """
+        name = self._project.short_name
+        prefix = name.lower()
+        directory = os.path.dirname(os.path.abspath(filename))
+        filelist = os.path.splitext(filename)[0] + ".f"
+        manifest_file = os.path.join(directory,
+                                     ".%s.shards" % os.path.basename(filename))
+
+        self._common_pkg = "%s_reg_common_pkg" % prefix
+        self._digest = template_digest()
+        self._version = code_version(self.__class__)
+        env = self._environment()
+
+        with profiler.phase("build model", name):
+            self._topology = get_topology(self._project)
+            shards = self._build_shards(prefix, directory)
+            self._share_classes([shard.dbase for shard in shards])
+
+        manifest = read_manifest(manifest_file)
+        changed = [shard for shard in shards
+                   if (manifest.get(os.path.basename(shard.filename)) !=
+                       shard.key or
+                       not os.path.exists(output_path(shard.filename)))]
+
+        with profiler.phase("render template", filename):
+            texts = self._render_shards(env, changed)
+            check_access = self._individual_access()
+            common_text = env.get_template("uvm_common_pkg.template").render(
+                self._context(self._topology, None, check_access,
+                              common_pkg=self._common_pkg))
+            top_text = env.get_template("uvm_top_pkg.template").render(
+                self._context(self._topology, None, check_access,
+                              common_pkg=self._common_pkg,
+                              packages=[shard.package for shard in shards]))
+
+        with profiler.phase("write file", filename):
+            for (shard, text) in zip(changed, texts):
+                with self._open(shard.filename) as of:
+                    of.write(text)
+
+            common_file = os.path.join(directory,
+                                       self._common_pkg + ".sv")
+            with self._open(common_file) as of:
+                of.write(common_text)
+            with self._open(filename) as of:
+                of.write(top_text)
+
+            files = ([common_file] + [shard.filename for shard in shards] +
+                     [os.path.abspath(filename)])
+            with self._open(filelist) as of:
+                for path in files:
+                    of.write(os.path.basename(path) + "\n")
+
+        current = dict((os.path.basename(shard.filename), shard.key)
+                       for shard in shards)
+        for old_name in set(manifest) - set(current):
+            remove_output(os.path.join(directory, old_name))
+        write_manifest(manifest_file, current)
+
+    def _build_shards(self, prefix, directory):
+        """
+        Returns the list of Shards for the register sets used by the
+        project
+        """
+        groups = {}
+        for (dbase, group, grp_map) in self._topology.db_groups(self.dblist):
+            groups.setdefault(id(dbase), []).append((group, grp_map))
+
+        shards = []
+        for dbase in self._topology.used_databases(self.dblist):
+            package = "%s_%s_reg_pkg" % (prefix, dbase.set_name.lower())
+            db_groups = groups.get(id(dbase), [])
+            shards.append(Shard(dbase, package,
+                                os.path.join(directory, package + ".sv"),
+                                db_groups,
+                                self._shard_key(dbase, package, db_groups)))
+        return shards
+
+    def _shard_key(self, dbase, package, groups):
+        """
+        Returns a key that changes whenever the package for the register
+        set would change, including when the writer code changes
+        """
+        registers = [register_key(dbase, reg)
+                     for reg in dbase.get_all_registers()]
+        maps = [(group.name, [(map_name,
+                               self._project.get_address_width(map_name))
+                              for map_name in sorted(grp_map)])
+                for (group, grp_map) in groups]
+        return fragments.fragment_key(self._digest, self._version,
+                                      SHARE_CLASSES, self._project.name,
+                                      self._common_pkg, package,
+                                      dbase.set_name, dbase.coverage,
+                                      dbase.data_bus_width, registers, maps)
+
+    def _render_shards(self, env, shards):
+        """
+        Renders the packages for the shards, using multiple processes if
+        more than one job is allowed
+        """
+        global _SHARD_JOB
+
+        jobs = job_count(len(shards))
+        if jobs == 1:
+            return [self._render_shard(env, shard) for shard in shards]
+
+        import multiprocessing
+
+        _SHARD_JOB = (self, env, shards)
+        pool = multiprocessing.Pool(jobs)
+        try:
+            texts = pool.map(_render_shard, range(len(shards)))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _SHARD_JOB = None
+        return texts
+
+    def _render_shard(self, env, shard):
+        """
+        Renders the package for a single register set
+        """
+        template = env.get_template("uvm_set_pkg.template")
+        register_template = env.get_template("uvm_register.template")
+        cache = fragments.open_cache("uvm", shard.package,
+                                     (self._digest, self._version,
+                                      self._common_pkg))
+
+        check_access = self._individual_access()
+        register_class = self._register_class(cache, register_template,
+                                              check_access, self._common_pkg)
+        text = template.render(self._context(
+            self._topology, register_class, check_access, db=shard.dbase,
+            package=shard.package, groups=shard.groups,
+            common_pkg=self._common_pkg))
+        cache.save()
+        return text
+
+
+def read_manifest(filename):
+    """
+    Returns the shard keys saved in the manifest file, or an empty
+    dictionary if the file does not exist or cannot be read. The manifest
+    is kept with the output files, so it is empty when the output sink
+    keeps no files.
+    """
+    filename = output_path(filename)
+    if filename is None:
+        return {}
+    try:
+        with open(filename) as ifile:
+            data = json.load(ifile)
+    except (IOError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+def write_manifest(filename, data):
+    text = json.dumps(data, indent=2, sort_keys=True,
+                      separators=(",", ": ")) + "\n"
+    filename = output_path(filename)
+    if filename is not None and not same_contents(filename, text):
+        replace_file(filename, text)
+
+
+def register_key(dbase, register):
+    """
+    Returns the key of the class generated for the register, which covers
+    everything the register template reads: the register and its fields
+    (through the fingerprint, which includes every saved attribute), the
+    share mode, and the register set name and coverage setting. Used both
+    for the fragment cache and for the shard keys.
+    """
+    return fragments.fragment_key(dbase.set_name, dbase.coverage,
+                                  register.fingerprint(), register.share)
+
+
+def class_signature(dbase, register):
+    """
+    Returns the parts of the register that appear in its UVM class. The
+    name of the register and the reset values of the fields are left out,
+    since the block sets them for each instance, except for the reset
+    values of the constant fields that are used in the coverage bins.
+    """
+    cover = dbase.coverage and not register.do_not_cover
+    fields = []
+    for field in register.get_bit_fields():
+        if cover and not field.values and field.is_constant():
+            reset = field.reset_value
+        else:
+            reset = None
+        fields.append((field.field_name, field.lsb, field.msb,
+                       field.field_type, field.volatile, field.input_signal,
+                       field.reset_type, field.can_randomize,
+                       tuple(value[0] for value in field.values), reset))
+    return (register.width, register.share, register.do_not_test,
+            register.do_not_cover, tuple(fields))
+
+
+class RegisterClasses(object):
+    """
+    Registers in a register set that share a UVM class. Registers with
+    the same class_signature (such as the registers of each channel of a
+    block) use the class of the first of them, and the block sets the
+    reset values that differ. Memories always have their own class.
+    """
+
+    def __init__(self, dbase):
+        self.__owner = {}
+        found = {}
+        for reg in remove_no_uvm(dbase.get_all_registers()):
+            if reg.ram_size:
+                owner = reg
+            else:
+                owner = found.setdefault(class_signature(dbase, reg), reg)
+            self.__owner[id(reg)] = owner
+        self.registers = len(self.__owner)
+        self.classes = len(set(id(reg) for reg in self.__owner.values()))
+
+    def owner(self, reg):
+        return self.__owner.get(id(reg), reg)
+
+    def reset_overrides(self, reg):
+        owner = self.owner(reg)
+        if owner is reg:
+            return []
+        return [(field, "%d'h%x" % (field.width, field.reset_value))
+                for (field, orig) in zip(reg.get_bit_fields(),
+                                         owner.get_bit_fields())
+                if field.reset_value != orig.reset_value]
 
-        with open(filename, "w") as of:
-            of.write(template.render(project=self._project, dblist=used_dbs,
-                                     individual_access=individual_access,
-                                     ACCESS_MAP=ACCESS_MAP, 
-                                     TYPE_TO_INPUT=TYPE_TO_INPUT,
-                                     db_grp_maps=self.get_db_groups(),
-                                     group_maps = self._build_group_maps(),
-                                     fix_name=self.fix_name,
-                                     fix_reg=self.fix_reg_name,
-                                     use_new=False,
-                                     used_maps = self._used_maps(),
-                                     map2grp = self.build_map_name_to_groups(),
-                                     current_date=time.strftime("%B %d, %Y")
-                                     ))
-
-    def get_db_groups(self):
-        data_set = []
-        group_maps = self._build_group_maps()
-        for dbase in self.get_used_databases():
-            for group in self._project.get_grouping_list():
-                used = set()
-                for grp in group.register_sets:
-                    if grp.set == dbase.set_name and grp.set not in used:
-                        used.add(grp.set)
-                        if group in group_maps:
-                            data_set.append((dbase, group, group_maps[group]))
-        return data_set
-
-    def get_used_databases(self):
-
-        grp_set = set()
-        maps = self._build_group_maps()
-        for key in maps:
-            if maps[key]:
-                grp_set.add(key.name)
-
-        used_sets = set([])
-        for group in self._project.get_grouping_list():
-            if group.name in grp_set: 
-                for reg_sets in group.register_sets:
-                    used_sets.add(reg_sets.set)
-        return set([db for db in self.dblist if db.set_name in used_sets])
 
 def is_readonly(field):
     return TYPES[field.field_type].readonly
 
 
-def individual_access(field, reg):
+def byte_owners(reg):
     """
-    Make sure that the bits in the field are not in the same byte as any
-    other field that is writable.
+    Returns a list containing the number of writable fields that have bits
+    in each byte of the register
     """
-    used_bytes = set()
-
-    # get all the fields in the register
-    flds = reg.get_bit_fields()
+    fields = reg.get_bit_fields()
+    width = max([reg.width] + [fld.msb + 1 for fld in fields])
+    owners = [0] * ((width + 7) / 8)
+    for fld in fields:
+        if not is_readonly(fld):
+            for byte in range(fld.lsb / 8, fld.msb / 8 + 1):
+                owners[byte] += 1
+    return owners
 
-    # loop through all fields are are not read only and are not the original
-    # field we are checking for. Calculate the bytes used, and add them to the
-    # used_bytes set
 
-    for f in [fld for fld in flds if fld != field and not is_readonly(fld)]:
-        for pos in range(f.lsb, f.msb + 1):
-            used_bytes.add(pos / 8)
+def individual_access(field, reg, owners=None):
+    """
+    Make sure that the bits in the field are not in the same byte as any
+    other field that is writable. The owners list (from byte_owners) is
+    built from the register if it is not provided.
+    """
+    if owners is None:
+        owners = byte_owners(reg)
 
-    # loop through the bytes used by the current field, and make sure they
-    # do match any of the bytes used by other fields
-    for pos in range(field.lsb, field.msb + 1):
-        if (pos / 8) in used_bytes:
+    # The field itself is one of the owners of its bytes if it is writable
+    own = 0 if is_readonly(field) else 1
+    for byte in range(field.lsb / 8, field.msb / 8 + 1):
+        if owners[byte] > own:
             return 0
     return 1
 
+
 def remove_no_uvm(s):
     return [r for r in s if r.do_not_use_uvm is False]
 
 
 EXPORTERS = [
     (WriterBase.TYPE_PROJECT, ExportInfo(UVMRegBlockRegisters, ("Test", "UVM Registers"),
-                                         "SystemVerilog files", ".sv", 'proj-uvm'))
+                                         "SystemVerilog files", ".sv", 'proj-uvm')),
+    (WriterBase.TYPE_PROJECT, ExportInfo(UVMRegBlockShards, ("Test", "UVM Registers (package per register set)"),
+                                         "SystemVerilog files", ".sv", 'proj-uvm-shards'))
 ]
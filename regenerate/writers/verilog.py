@@ -20,27 +20,24 @@
 Actual program. Parses the arguments, and initiates the main window
 """
 
-from regenerate.db import BitField, TYPES, TYPE_TO_OUTPUT, LOGGER, Register
-from regenerate.writers.writer_base import WriterBase, ExportInfo
+from regenerate.db import BitField, TYPES, LOGGER, Register
+from regenerate.writers.writer_base import (WriterBase, ExportInfo,
+                                            template_environment)
 from regenerate.writers.verilog_reg_def import REG
+from regenerate.writers import fragments
+from regenerate.writers.db_view import get_view
+from regenerate.db.signals import get_signals, CONTROL, INPUT
+from regenerate.extras import profiler
+from regenerate.extras.output_cache import code_version
 import time
 import os
-import re
-from jinja2 import FileSystemLoader, Environment
-from collections import namedtuple, OrderedDict, defaultdict
+from collections import namedtuple
 
 import pprint
 
 LOWER_BIT = {128: 4, 64: 3, 32: 2, 16: 1, 8: 0}
 
 
-(F_FIELD, F_START_OFF, F_STOP_OFF, F_START, F_STOP, F_ADDRESS,
- F_REGISTER) = range(7)
-
-BIT_SLICE = re.compile("(.*)\[(\d+)\]")
-BUS_SLICE = re.compile("(.*)\[(\d+):(\d+)\]")
-
-
 CellInfo = namedtuple("CellInfo",
                       ["name", "has_input", "has_control",
                        "has_oneshot", "type_descr", "allows_wide",
@@ -92,13 +89,27 @@ def break_into_bytes(start, stop):
     return data
 
 
-def in_range(lower, upper, lower_limit, upper_limit):
+def first_uses(uses, seen):
+    """
+    Returns (field, register) for the first use of each signal name that
+    is not in seen, skipping registers with no generated code. The names
+    are added to seen, so that a signal is only declared once.
+    """
+    ports = []
+    for use in uses:
+        if use.name not in seen and not use.register.do_not_generate_code:
+            seen.add(use.name)
+            ports.append((use.field, use.register))
+    return ports
+
+
+def field_names(uses):
     """
-    Checks to see if the range is within the specified range
+    Returns the register and field names of the signal uses
     """
-    return ((lower_limit <= lower <= upper_limit) or
-            (lower_limit <= upper <= upper_limit) or
-            (lower < lower_limit and upper >= upper_limit))
+    return ", ".join("%s.%s" % (use.register.token, use.field.field_name)
+                     for use in uses)
+
 
 def rshift(val, shift):
     return val >> shift
@@ -124,150 +135,113 @@ class Verilog(WriterBase):
                 i.id.lower(), i.input, i.control, i.oneshot,
                 i.description, i.wide, i.read, i.readonly)
 
-        self.__sorted_regs = [
-            reg for reg in dbase.get_all_registers()
-            if not (reg.do_not_generate_code or reg.ram_size > 0)
-        ]
         self._used_types = set()
 
-    def _byte_info(self, field, register, lower, size, offset):
-        """
-        Returns the basic information from a field, broken out into byte
-        quantities
-        """
-        start = max(field.lsb, lower)
-        stop = min(field.msb, lower + size - 1)
-
-        nbytes = size / 8
-        address = (register.address / nbytes) * nbytes
-        bit_offset = (register.address * 8) % size
-
-        return (field, start + bit_offset, stop + bit_offset, start, stop,
-                address + offset, register)
-
-    def __generate_group_list(self, reglist, size):
-        """
-        Breaks a set of bit fields along the specified boundary
-        """
-        item_list = {}
-        for register in reglist:
-            for field in register.get_bit_fields():
-                self._used_types.add(field.field_type)
-                offset = 0
-                for lower in range(0, register.width, size):
-                    if in_range(field.lsb, field.msb, lower, lower + size - 1):
-                        data = self._byte_info(field, register, lower, size, offset)
-                        item_list.setdefault(data[F_ADDRESS], []).append(data)
-                        offset += size/8
-        return item_list
-
     def write(self, filename):
         """
         Write the data to the file as a SystemVerilog package. This includes
         a block of register definitions for each register and the associated
         container blocks.
         """
-        import copy
-
         dirpath = os.path.dirname(__file__)
 
-        env = Environment(loader=FileSystemLoader(os.path.join(dirpath, "templates")),
-                          trim_blocks = True, lstrip_blocks = True)
+        env = template_environment(os.path.join(dirpath, "templates"),
+                                   trim_blocks=True, lstrip_blocks=True)
         env.filters['drop_write_share'] = drop_write_share
 
         template = env.get_template("verilog.template")
+        field_template = env.get_template("verilog_field.template")
+
+        cache = fragments.open_cache(
+            self.__class__.__name__.lower(), self._dbase.module_name,
+            (fragments.source_digest(template.filename,
+                                     field_template.filename),
+             code_version(self.__class__), self._dbase.module_name,
+             self._dbase.data_bus_width))
+
+        with profiler.phase("build model", self._dbase.module_name):
+            view = get_view(self._dbase)
+            self._used_types = view.used_types
+            word_fields = view.word_slices(self._data_width)
+            signals = get_signals(self._dbase)
+            declared = set()
+            control_ports = first_uses(signals.uses_of_kind(CONTROL),
+                                       declared)
+            input_ports = first_uses(signals.uses_of_kind(INPUT), declared)
+            for (signal, uses) in signals.conflicts():
+                LOGGER.warning("%s: output %s is driven by more than one "
+                               "field (%s)", self._dbase.module_name, signal,
+                               field_names(uses))
+            reset_edge = "posedge" if self._dbase.reset_active_level and not self._dbase.use_interface else "negedge"
+            reset_op = "" if self._dbase.reset_active_level and not self._dbase.use_interface else "~"
 
-        reglist = []
-        for reg in [r for r in self._dbase.get_all_registers()
-                    if not r.do_not_generate_code]:
-            if reg.dimension > 1:
-                for i in range(0, reg.dimension):
-                    r = copy.copy(reg)
-                    r.address = reg.address + (i * (reg.width / 8))
-                    r.dimension = i 
-                    reglist.append(r)
-            else:
-                r = copy.copy(reg)
-                r.dimension = -1
-                reglist.append(r)
-
-        word_fields = self.__generate_group_list(reglist, self._data_width)
-        reset_edge = "posedge" if self._dbase.reset_active_level and not self._db.use_interface else "negedge"
-        reset_op = "" if self._dbase.reset_active_level and not self._db.use_interface else "~"
-
-        parameters = []
-        for r in self._dbase.get_all_registers():
-            for f in r.get_bit_fields():
-                if f.reset_type == BitField.RESET_PARAMETER:
-                    parameters.append((f.msb, f.lsb, f.reset_parameter))
-
-        scalar_ports = []
-        array_ports = defaultdict(list)
-        dim = {}
-        for r in self._dbase.get_all_registers():
-            if r.do_not_generate_code:
-                continue
-            for f in r.get_bit_fields():
-                if TYPE_TO_OUTPUT[f.field_type] and f.use_output_enable:
-                    sig = f.output_signal
-                    root = sig.split('[')
-                    wild = sig.split('*')
-                    if len(root) == 1:
-                        if f.msb == f.lsb:
-                            scalar_ports.append((sig, "", r.dimension))
-                        else:
-                            dim[sig] = r.dimension
-                            for i in range(f.lsb, f.msb+1):
-                                array_ports[sig].append(i)
-                    elif len(wild) > 1:
-                        dim[root[0]] = r.dimension
-                        for i in range(f.lsb, f.msb+1):
-                            array_ports[root[0]].append(i)
-                    else:
-                        match = BUS_SLICE.match(sig)
-                        if match:
-                            g = match.groups()
-                            for i in range(int(g[1]), int(g[2])):
-                                array_ports[g[0]].append(i)
-                            continue
-
-                        match = BIT_SLICE.match(sig)
-                        if match:
-                            g = match.groups()
-                            dim[g[0]] = r.dimension
-                            array_ports[g[0]].append(int(g[1]))
-                            continue
-
-
-        for key in array_ports:
-            msb = max(array_ports[key])
-            lsb = min(array_ports[key])
-            if msb == lsb:
-                scalar_ports.append((key, "[%d]" % lsb, dim[key]))
-            else:
-                scalar_ports.append((key, "[%d:%d]" % (msb, lsb), dim[key]))
-                        
 # TODO: fix 64 bit registers with 32 bit width
 
-        with open(filename, "w") as of:
-            of.write(template.render(db = self._dbase,
-                                     rshift = rshift,
-                                     parameters = parameters,
-                                     cell_info = self._cell_info,
-                                     word_fields = word_fields,
-                                     break_into_bytes = break_into_bytes,
-                                     sorted_regs = sorted(reglist),
-                                     full_reset_value = full_reset_value,
-                                     reset_value = reset_value,
-                                     input_logic = self.input_logic,
-                                     output_logic = self.output_logic,
-                                     always = self.always,
-                                     output_ports = scalar_ports,
-                                     reset_edge = reset_edge,
-                                     reset_op = reset_op,
-                                     reg_type = self.reg_type,
-                                     LOWER_BIT = LOWER_BIT))
-            self.write_register_modules(of)
+        with profiler.phase("render template", filename):
+            text = template.render(db = self._dbase,
+                                   rshift = rshift,
+                                   parameters = view.parameters,
+                                   cell_info = self._cell_info,
+                                   word_fields = word_fields,
+                                   break_into_bytes = break_into_bytes,
+                                   sorted_regs = view.sorted_elements,
+                                   full_reset_value = full_reset_value,
+                                   reset_value = reset_value,
+                                   input_logic = self.input_logic,
+                                   output_logic = self.output_logic,
+                                   always = self.always,
+                                   output_ports = view.output_ports,
+                                   control_ports = control_ports,
+                                   input_ports = input_ports,
+                                   reset_edge = reset_edge,
+                                   reset_op = reset_op,
+                                   reg_type = self.reg_type,
+                                   field_instance = self._field_instance(
+                                       cache, field_template),
+                                   LOWER_BIT = LOWER_BIT)
+            cache.save()
+
+        with profiler.phase("write file", filename):
+            with self._open(filename) as of:
+                of.write(text)
+                self.write_register_modules(of)
+
+    def _field_instance(self, cache, template):
+        """
+        Returns the function used by the template to render the instance
+        of a register cell for a field, taking the text from the fragment
+        cache if the field has not changed.
+        """
+        fingerprints = {}
+
+        def fingerprint(obj):
+            if id(obj) not in fingerprints:
+                fingerprints[id(obj)] = obj.fingerprint()
+            return fingerprints[id(obj)]
+
+        def field_instance(field, start_offset, stop_offset, start_pos,
+                           stop_pos, addr, reg, clk_name, reset_name,
+                           write_data_name, byte_strobe_name):
+
+            def render():
+                return template.render(
+                    db=self._dbase, cell_info=self._cell_info, field=field,
+                    start_offset=start_offset, stop_offset=stop_offset,
+                    start_pos=start_pos, stop_pos=stop_pos, addr=addr,
+                    reg=reg, clk_name=clk_name, reset_name=reset_name,
+                    write_data_name=write_data_name,
+                    byte_strobe_name=byte_strobe_name,
+                    break_into_bytes=break_into_bytes,
+                    reset_value=reset_value,
+                    full_reset_value=full_reset_value)
+
+            key = fragments.fragment_key(
+                fingerprint(reg), reg.share, fingerprint(field),
+                start_offset, stop_offset, start_pos, stop_pos, addr,
+                clk_name, reset_name, write_data_name, byte_strobe_name)
+            return cache.get(key, render)
+
+        return field_instance
 
     def comment(self, of, text_list, border=None, precede_blank=0):
         """
@@ -21,6 +21,7 @@ DefsWriter - Writes out Verilog defines representing the register addresses
 """
 
 from writer_base import WriterBase, ExportInfo
+from regenerate.writers.db_view import get_view
 
 HEADER = ["`ifdef $M$_DEFS\n", "`else\n", "`define $M$_DEFS 1\n", "\n", ]
 
@@ -32,8 +33,9 @@ class VerilogDefines(WriterBase):
     Writes out Verilog defines representing the register addresses
     """
 
-    def __init__(self, dbase):
-        WriterBase.__init__(self, dbase)
+    def __init__(self, project, dbase):
+        WriterBase.__init__(self, project, dbase)
+        self._offset = 0
         self._ofile = None
 
     def write_def(self, reg, prefix, offset):
@@ -56,7 +58,7 @@ class VerilogDefines(WriterBase):
         Writes the output file
         """
         try:
-            self._ofile = open(filename, "w")
+            self._ofile = self._open(filename)
         except IOError as msg:
             import gtk
             errd = gtk.MessageDialog(type=gtk.MESSAGE_ERROR)
@@ -71,14 +73,13 @@ class VerilogDefines(WriterBase):
             errd.run()
             return
 
-        self._write_comment_header(self._ofile, 'site_verilog.inc',
+        self._write_header_comment(self._ofile, 'site_verilog.inc',
                                    comment_char='//')
 
-        self.write_header(self._ofile, HEADER)
+        self.write_header(self._ofile, "".join(HEADER))
 
-        for reg_key in self._dbase.get_keys():
-            self.write_def(self._dbase.get_register(reg_key), self._prefix,
-                           self._offset)
+        for reg in get_view(self._dbase).registers:
+            self.write_def(reg, self._prefix, self._offset)
         self._ofile.write('\n')
 
         for line in TRAILER:
@@ -21,8 +21,13 @@ WriterBase - base class for objects that product output from the
              register database.
 """
 
+import errno
 import os
+import re
+import tempfile
 import time
+from cStringIO import StringIO
+from itertools import izip_longest
 from regenerate.settings.paths import INSTALL_PATH
 from collections import namedtuple
 
@@ -42,6 +47,432 @@ else:
         return pwd.getpwnam(os.environ['USER'])[4].split(',')[0]
 
 
+# Splits a date into its words, numbers, spaces and punctuation (see
+# date_pattern)
+DATE_TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|\s+|.")
+
+_DATE_PATTERNS = {}
+
+# Number of processes that a writer may use to generate independent parts
+# of its output in parallel. None uses one process per CPU.
+JOBS = None
+
+
+def set_jobs(count):
+    """
+    Sets the number of processes writers may use. A count of 1 (or less)
+    disables parallel generation.
+    """
+    global JOBS
+    JOBS = count
+
+
+def job_count(tasks):
+    """
+    Returns the number of processes to use for the number of tasks.
+    Parallel generation requires fork(), so it is disabled on Windows.
+    """
+    if os.name == 'nt' or tasks < 2:
+        return 1
+    count = JOBS
+    if count is None:
+        import multiprocessing
+        try:
+            count = multiprocessing.cpu_count()
+        except NotImplementedError:
+            count = 1
+    return max(1, min(count, tasks))
+
+
+# Object that receives the output files in place of their destinations
+# (see set_output_sink), or None to write the files in place
+OUTPUT_SINK = None
+
+
+def set_output_sink(sink):
+    """
+    Sets the sink for the output files, or None to write them in place.
+    A sink provides:
+
+        path(filename)           the path the file is written to instead,
+                                 or None if the sink takes the data
+        add(filename, data)      called with the contents of the file when
+                                 path returned None
+        add_file(filename, tmp)  the same, with the contents in a temporary
+                                 file that the sink must remove
+        closed(filename, dates)  called when a file written to the path
+                                 from path() is closed, with the dates the
+                                 writer inserted into it (see same_lines)
+        remove(filename)         called when a writer removes a file
+    """
+    global OUTPUT_SINK
+    OUTPUT_SINK = sink
+
+
+def output_path(filename):
+    """
+    Returns the path where the output file is written, or None if the
+    output sink takes the data
+    """
+    if OUTPUT_SINK is None:
+        return filename
+    return OUTPUT_SINK.path(filename)
+
+
+def remove_output(filename):
+    """
+    Removes an output file that is no longer generated
+    """
+    path = output_path(filename)
+    if path is not None and os.path.exists(path):
+        os.remove(path)
+    if OUTPUT_SINK is not None:
+        OUTPUT_SINK.remove(filename)
+
+
+# jinja2 environments shared by the writers (see template_environment)
+_ENVIRONMENTS = {}
+
+
+def template_environment(path, **options):
+    """
+    Returns the jinja2 Environment that loads the templates in path, with
+    the options. Writers using the same path and options share the
+    environment, so each template is only compiled once per process. The
+    loader notices when a template file changes, and compiles it again.
+    """
+    key = (path, tuple(sorted(options.items())))
+    env = _ENVIRONMENTS.get(key)
+    if env is None:
+        from jinja2 import Environment, FileSystemLoader
+        env = Environment(loader=FileSystemLoader(path), **options)
+        _ENVIRONMENTS[key] = env
+    return env
+
+
+def date_pattern(date):
+    """
+    Returns a regular expression matching any date in the same format as
+    the date (such as the time.asctime() or "%B %d, %Y" formats)
+    """
+    pattern = _DATE_PATTERNS.get(date)
+    if pattern is None:
+        parts = []
+        for token in DATE_TOKEN_RE.findall(date):
+            if token.isalpha():
+                parts.append("[A-Za-z]+")
+            elif token.isdigit():
+                parts.append(r"\d+")
+            elif token.isspace():
+                parts.append(r"\s+")
+            else:
+                parts.append(re.escape(token))
+        pattern = "".join(parts)
+        _DATE_PATTERNS[date] = pattern
+    return pattern
+
+
+def same_line(old, new, dates):
+    """
+    Returns True if the old line is the same as the new line, allowing
+    each of the dates found in the new line to be a different date in the
+    old line
+    """
+    if old == new:
+        return True
+    found = [date for date in dates if date in new]
+    if not found:
+        return False
+    parts = re.split("(%s)" % "|".join(re.escape(date) for date in found),
+                     new)
+    pattern = "".join(date_pattern(part) if i % 2 else re.escape(part)
+                      for (i, part) in enumerate(parts))
+    return re.match(pattern + r"\Z", old) is not None
+
+
+def same_lines(old_lines, new_lines, dates=()):
+    """
+    Compares the lines of two files, allowing the lines containing the
+    dates of the new file (the dates the writer inserted, see
+    WriterBase._current_date) to hold different dates in the old file.
+    Lines that do not contain one of these dates must match exactly, so a
+    change to a date anywhere else, such as in a description, is seen.
+    """
+    for (old, new) in izip_longest(old_lines, new_lines):
+        if old is None or new is None:
+            return False
+        if not same_line(old, new, dates):
+            return False
+    return True
+
+
+class OutputReport(object):
+    """
+    Records the files that were replaced, and the files that were left
+    untouched because their contents had not changed.
+    """
+
+    def __init__(self):
+        self.changed = []
+        self.unchanged = []
+
+    def clear(self):
+        self.changed = []
+        self.unchanged = []
+
+    def record(self, filename, changed):
+        if changed:
+            self.changed.append(filename)
+        else:
+            self.unchanged.append(filename)
+
+    def write(self, ofile, verbose=False):
+        """
+        Writes the summary, listing the files if verbose is True
+        """
+        if verbose:
+            for filename in self.changed:
+                ofile.write("Updated %s\n" % filename)
+            for filename in self.unchanged:
+                ofile.write("Unchanged %s\n" % filename)
+        ofile.write("%d output file(s) updated, %d unchanged\n" %
+                    (len(self.changed), len(self.unchanged)))
+
+OUTPUT_REPORT = OutputReport()
+
+
+class OutputFile(object):
+    """
+    File-like object used by the writers in place of a file opened for
+    writing. The output is collected in memory, and when the file is
+    closed, it is compared to the existing file. The existing file is only
+    replaced if the contents differ, so that unchanged files keep their
+    modification times. The new file is written to a temporary file in the
+    same directory, then renamed over the destination, so that a partially
+    written file is never seen.
+
+    The dates are the dates the writer inserted into the file, which may
+    be different in the existing file (see same_lines). The writer may add
+    to them until the file is closed.
+
+    If used as a context manager and an exception is raised, the
+    destination is left untouched.
+    """
+
+    def __init__(self, filename, report=None, dates=()):
+        self.name = filename
+        self.report = report if report is not None else OUTPUT_REPORT
+        self.dates = dates
+        self.changed = None
+        self.closed = False
+        self.__buffer = StringIO()
+        self.__path = output_path(filename)
+
+        if self.__path is not None:
+            dirname = os.path.dirname(os.path.abspath(self.__path))
+            if not os.path.isdir(dirname):
+                raise IOError(errno.ENOENT, "No such directory", dirname)
+            if not os.access(dirname, os.W_OK):
+                raise IOError(errno.EACCES, "Permission denied", filename)
+
+    def write(self, data):
+        self.__buffer.write(data)
+
+    def writelines(self, lines):
+        self.__buffer.writelines(lines)
+
+    def getvalue(self):
+        return self.__buffer.getvalue()
+
+    def close(self):
+        """
+        Replaces the destination file if the contents have changed.
+        Returns True if the file was written.
+        """
+        if self.closed:
+            return self.changed
+        self.closed = True
+
+        data = self.__buffer.getvalue()
+        self.__buffer.close()
+
+        if self.__path is None:
+            OUTPUT_SINK.add(self.name, data)
+            self.changed = True
+        else:
+            self.changed = not same_contents(self.__path, data, self.dates)
+            if self.changed:
+                replace_file(self.__path, data)
+            if OUTPUT_SINK is not None:
+                OUTPUT_SINK.closed(self.name, self.dates)
+        self.report.record(self.name, self.changed)
+        return self.changed
+
+    def discard(self):
+        """
+        Closes the file without touching the destination
+        """
+        self.closed = True
+        self.__buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
+def same_contents(filename, data, dates=()):
+    """
+    Returns True if the file exists and has the same contents as data,
+    apart from the dates inserted by the writer (see same_lines)
+    """
+    try:
+        with open(filename, "rb") as ifile:
+            current = ifile.read()
+    except IOError:
+        return False
+    if current == data:
+        return True
+    return bool(dates) and same_lines(StringIO(current), StringIO(data),
+                                      dates)
+
+
+def same_file_contents(filename, new_filename, dates=()):
+    """
+    Returns True if the file exists and has the same contents as the new
+    file, apart from the dates inserted by the writer (see same_lines).
+    The files are read a line at a time.
+    """
+    try:
+        with open(filename, "rb") as old_file:
+            with open(new_filename, "rb") as new_file:
+                return same_lines(old_file, new_file, dates)
+    except IOError:
+        return False
+
+
+def replace_file(filename, data):
+    """
+    Atomically replaces the file with the data
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    (handle, tmpname) = tempfile.mkstemp(dir=dirname, prefix=".regen")
+    try:
+        with os.fdopen(handle, "w") as ofile:
+            ofile.write(data)
+    except (IOError, OSError):
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+    install_file(tmpname, filename)
+
+
+def install_file(tmpname, filename):
+    """
+    Renames the temporary file over the file, keeping the permissions of
+    the file if it exists. The temporary file is removed on failure.
+    """
+    try:
+        if os.path.exists(filename):
+            os.chmod(tmpname, os.stat(filename).st_mode & 0o7777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmpname, 0o666 & ~umask)
+        if os.name == 'nt' and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmpname, filename)
+    except (IOError, OSError):
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+
+class OutputStream(object):
+    """
+    Used in place of OutputFile by writers whose output is too large to
+    keep in memory. The data is written straight to a temporary file in
+    the destination directory. When the stream is closed, the temporary
+    file is compared to the destination a line at a time, and only
+    replaces the destination if the contents differ, apart from the dates
+    (as for OutputFile).
+    """
+
+    def __init__(self, filename, report=None, dates=()):
+        self.name = filename
+        self.report = report if report is not None else OUTPUT_REPORT
+        self.dates = dates
+        self.changed = None
+        self.closed = False
+        self.__path = output_path(filename)
+
+        if self.__path is None:
+            dirname = None
+        else:
+            dirname = os.path.dirname(os.path.abspath(self.__path))
+            if not os.path.isdir(dirname):
+                raise IOError(errno.ENOENT, "No such directory", dirname)
+        (handle, self.__tmpname) = tempfile.mkstemp(dir=dirname,
+                                                    prefix=".regen")
+        self.__file = os.fdopen(handle, "w")
+
+    def write(self, data):
+        self.__file.write(data)
+
+    def writelines(self, lines):
+        self.__file.writelines(lines)
+
+    def close(self):
+        """
+        Replaces the destination file if the contents have changed.
+        Returns True if the file was written.
+        """
+        if self.closed:
+            return self.changed
+        self.closed = True
+
+        self.__file.close()
+
+        if self.__path is None:
+            OUTPUT_SINK.add_file(self.name, self.__tmpname)
+            self.changed = True
+        else:
+            self.changed = not same_file_contents(self.__path,
+                                                  self.__tmpname, self.dates)
+            if self.changed:
+                install_file(self.__tmpname, self.__path)
+            else:
+                os.remove(self.__tmpname)
+            if OUTPUT_SINK is not None:
+                OUTPUT_SINK.closed(self.name, self.dates)
+        self.report.record(self.name, self.changed)
+        return self.changed
+
+    def discard(self):
+        """
+        Closes the stream without touching the destination
+        """
+        self.closed = True
+        self.__file.close()
+        if os.path.exists(self.__tmpname):
+            os.remove(self.__tmpname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
 class WriterBase(object):  # IGNORE:R0921 - we know this is a abstract class
     """
     Writes the register information to the output file determined    by the derived class.
@@ -54,6 +485,7 @@ class WriterBase(object):  # IGNORE:R0921 - we know this is a abstract class
         self._dbase = dbase
         self._project = project
         self._project_name = ""
+        self._dates = set()
         if dbase:
             self._set_values_init(dbase)
 
@@ -112,7 +544,7 @@ class WriterBase(object):  # IGNORE:R0921 - we know this is a abstract class
         """
         t = time.time()
         year = str(time.localtime(t)[0])
-        date = time.asctime(time.localtime(t))
+        date = self._current_date(t=t)
 
         user = get_username()
 
@@ -130,6 +562,32 @@ class WriterBase(object):  # IGNORE:R0921 - we know this is a abstract class
         line = line.replace('$U$', user)
         ofile.write(line)
 
+    def _current_date(self, fmt=None, t=None):
+        """
+        Returns the date to insert into the output, in the strftime format
+        (or the time.asctime() format if no format is given). The dates are
+        recorded, so that a file is not replaced when the only lines that
+        differ are the lines holding these dates.
+        """
+        now = time.localtime(t)
+        date = time.strftime(fmt, now) if fmt else time.asctime(now)
+        self._dates.add(date)
+        return date
+
+    def _open(self, filename):
+        """
+        Opens the output file. Writers should use this instead of open(),
+        so the file is only replaced if its contents change.
+        """
+        return OutputFile(filename, dates=self._dates)
+
+    def _open_stream(self, filename):
+        """
+        Opens the output file as an OutputStream, for writers that produce
+        very large files
+        """
+        return OutputStream(filename, dates=self._dates)
+
     def write(self, filename):
         """
         The child class must override this to provide an implementation.
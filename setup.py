@@ -22,7 +22,8 @@ setup(
 		       'writers/templates/*']
     },
     url="https://github.com/dallingham/regenerate",
-    scripts=["bin/regenerate", "bin/regbuild", "bin/regupdate", "bin/regxref",
+    scripts=["bin/regenerate", "bin/regbuild", "bin/regenerated",
+             "bin/regupdate", "bin/regxref",
              "bin/regdiff", "bin/ipxact2reg"],
     classifiers=
     ['Operating System :: POSIX', 'Programming Language :: Python :: 2.7',